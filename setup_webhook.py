@@ -48,6 +48,9 @@ params = {
     'max_connections': 100,
     'drop_pending_updates': True
 }
+# باید با WEBHOOK_SECRET سرور وبهوک یکسان باشد
+if os.getenv('WEBHOOK_SECRET'):
+    params['secret_token'] = os.getenv('WEBHOOK_SECRET')
 
 response = requests.post(set_url, json=params)
 if response.status_code == 200 and response.json().get('ok'):
@@ -21,11 +21,15 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters
 )
 
 from dotenv import load_dotenv
 
+# Load environment variables before the modules below read their settings
+load_dotenv()
+
 # Define states at module level to make them available for import
 # These need to match the values in add_category_scene.py
 ADD_CATEGORY_NAME, ADD_SELECT_PANELS, ADD_SELECT_INBOUNDS, ADD_CONFIRMATION = range(4)
@@ -80,15 +84,25 @@ from src.bot.scenes.extra_volume_settings_scene import (
     SET_MAX_VOLUME as EVS_SET_MAX_VOLUME
 )
 from src.bot.scenes.extra_volume_settings_scene import ExtraVolumeSettingsScene
+from src.bot.scenes.broadcast_scene import BroadcastScene, BROADCAST_MESSAGE, BROADCAST_CONFIRM
 from src.bot.middlewares.admin_middleware import AdminMiddleware
 from src.bot.menus.main_menu import MainMenu
 from src.bot.menus.admin_menu import AdminMenu
 from src.bot.menus.panel_management_menu import PanelManagementMenu
 from src.bot.menus.shop_menu import ShopMenu
 from src.bot.utils.navigation_helpers import handle_back_to_menu
-
-# Load environment variables
-load_dotenv()
+from src.bot.utils.loop_monitor import start_loop_monitor
+from src.bot.utils.router import TextRouter, CallbackRouter, RouteStats
+from src.bot.utils.update_processor import build_update_processor
+from src.bot.utils.persistence import build_persistence, user_states
+from src.bot.utils.rate_limiter import build_rate_limiter
+from src.bot.utils.broadcaster import broadcaster
+from src.services.inbound_sync import inbound_syncer
+from src.services.traffic_collector import traffic_collector
+from src.services.expiry_scheduler import expiry_scheduler
+from src.bot.utils.dedup import drop_duplicate_updates
+from src.services.async_service import AsyncService
+from src.services.user_service import UserService
 
 # Setup logging
 logging.basicConfig(
@@ -112,129 +126,137 @@ delete_category_scene = DeleteCategoryScene()
 delete_product_scene = DeleteProductScene()
 edit_product_scene = EditProductScene()
 extra_volume_settings_scene = ExtraVolumeSettingsScene()
+broadcast_scene = BroadcastScene()
+user_service = AsyncService(UserService())
 admin_middleware = AdminMiddleware()
 main_menu = MainMenu()
 admin_menu = AdminMenu()
 panel_management_menu = PanelManagementMenu()
 shop_menu = ShopMenu()
 
-# Add a state tracker to determine where the user is
-user_states = {}
-
 # Conversation states (for adding panel)
 (PANEL_NAME, PANEL_TYPE, PANEL_URL, PANEL_USERNAME, PANEL_PASSWORD) = range(5)
 
+# Routers for reply keyboard texts and inline keyboard callbacks
+route_stats = RouteStats()
+text_router = TextRouter(route_stats)
+callback_router = CallbackRouter(route_stats)
+
+# پیام‌هایی که توسط ConversationHandler پردازش می‌شوند در روتر ثبت نمی‌شوند:
+# 🖥 اضافه کردن پنل، 🛒 اضافه کردن دسته بندی، 🛍️ اضافه کردن محصول، ❌ حذف دسته بندی،
+# ❌ حذف محصول، ✏️ ویرایش محصول، ➕ تنظیم قیمت حجم اضافه، 📢 پیام همگانی
+# دکمه‌های «🔙 بازگشت به منوی اصلی» و «🔙 بازگشت به بخش مدیریت» هم توسط هندلرهای گروه 0 پردازش می‌شوند
+
+@text_router.route("🔙 بازگشت به منوی مدیریت", states="shop", in_conversation=True)
+async def route_back_to_admin_from_shop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """بازگشت از منوی فروشگاه به منوی مدیریت"""
+    logger.info(f"Handling back to admin menu from shop menu")
+    user_states[update.effective_user.id] = "admin"
+    await admin_menu.show(update, context)
+
+@text_router.route("🔙 بازگشت به بخش فروشگاه", in_conversation=True)
+async def route_back_to_shop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """بازگشت به منوی فروشگاه"""
+    logger.info(f"Handling back to shop menu from message '{update.message.text}'")
+    user_states[update.effective_user.id] = "shop"
+    await shop_menu.show(update, context)
+
+@text_router.route("مدیریت")
+async def route_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if admin_middleware.is_admin(user_id):
+        # Set user state to admin menu
+        user_states[user_id] = "admin"
+        await admin_menu.show(update, context)
+    else:
+        await update.message.reply_text("⛔ شما دسترسی به این بخش را ندارید.")
+
+@text_router.route("👥 مدیریت پنل")
+async def route_panel_management(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if admin_middleware.is_admin(update.effective_user.id):
+        # Show panel management menu
+        await panel_management_menu.show(update, context)
+
+@text_router.route("🏪 بخش فروشگاه")
+async def route_shop_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if admin_middleware.is_admin(user_id):
+        # Set user state to shop menu
+        user_states[user_id] = "shop"
+        await shop_menu.show(update, context)
+
+# Shop menu navigation
+text_router.add("🎁 ساخت کد هدیه", shop_menu.create_gift_code, states="shop")
+text_router.add("❌ حذف کد هدیه", shop_menu.delete_gift_code, states="shop")
+text_router.add("🏷️ ساخت کد تخفیف", shop_menu.create_discount_code, states="shop")
+text_router.add("❌ حذف کد تخفیف", shop_menu.delete_discount_code, states="shop")
+
+@text_router.route("📊 آمار ربات", "⚙️ تنظیمات اکانت تست", "💰 مالی")
+async def route_under_development(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("🚧 این بخش در حال توسعه است...")
+
 # Message handler for menu navigation
 async def handle_menu_navigation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle menu navigation"""
     try:
-        message_text = update.message.text
         user_id = update.effective_user.id
-        
-        # بررسی دکمه "بازگشت به منوی مدیریت" در حالت shop به صورت ویژه
-        if message_text == "🔙 بازگشت به منوی مدیریت":
-            current_state = user_states.get(user_id, "main")
-            if current_state == "shop":
-                logger.info(f"Handling back to admin menu from shop menu")
-                user_states[user_id] = "admin"
-                await admin_menu.show(update, context)
-                return
-        
-        # Skip back commands in other contexts
-        if message_text in ["🔙 بازگشت به منوی اصلی", "🔙 بازگشت به بخش مدیریت"]:
-            logger.debug(f"Skipping back command '{message_text}' in handle_menu_navigation")
-            return
-        
-        # پشتیبانی از 'بازگشت به بخش فروشگاه'
-        elif message_text == "🔙 بازگشت به بخش فروشگاه":
-            # این دکمه احتمالاً اشتباه است و باید به منوی فروشگاه برگردد
-            logger.info(f"Handling back to shop menu from message '{message_text}'")
-            user_states[user_id] = "shop"
-            await shop_menu.show(update, context)
-            return
-            
-        # Skip other processing if we're in a conversation
-        if context.user_data.get('in_conversation'):
-            logger.debug(f"User is in conversation, skipping other menu navigation")
-            return
-        
-        # Track user state
         current_state = user_states.get(user_id, "main")
-        logger.info(f"User {user_id} in state '{current_state}' sent message: '{message_text}' (hex: {message_text.encode('utf-8').hex()})")
-        
-        # پیام‌هایی که توسط ConversationHandler پردازش می‌شوند را رد کن
-        conversation_handled_messages = [
-            "🖥 اضافه کردن پنل",
-            "🛒 اضافه کردن دسته بندی",
-            "🛍️ اضافه کردن محصول",
-            "❌ حذف دسته بندی",
-            "❌ حذف محصول"
-        ]
-        
-        if message_text in conversation_handled_messages:
-            logger.debug(f"Message '{message_text}' will be handled by a ConversationHandler, skipping")
-            return
         
-        if message_text == "مدیریت":
-            if admin_middleware.is_admin(user_id):
-                # Set user state to admin menu
-                user_states[user_id] = "admin"
-                await admin_menu.show(update, context)
-            else:
-                await update.message.reply_text("⛔ شما دسترسی به این بخش را ندارید.")
-        
-        elif message_text == "👥 مدیریت پنل":
-            if admin_middleware.is_admin(user_id):
-                # Show panel management menu
-                await panel_management_menu.show(update, context)
-        
-        elif message_text == "🏪 بخش فروشگاه":
-            if admin_middleware.is_admin(user_id):
-                # Set user state to shop menu
-                user_states[user_id] = "shop"
-                await shop_menu.show(update, context)
-        
-        # Shop menu navigation
-        elif current_state == "shop":
-            logger.info(f"Handling shop menu option: {message_text}")
-            
-            # These menu items have dedicated ConversationHandlers with higher priority
-            # Skip them here to avoid processing them twice
-            # The duplication happens because the handler with higher priority (ConversationHandler)
-            # processes the message, but then it also reaches this handler
-            conversation_handled_options = [
-                "❌ حذف محصول",
-                "🛍️ اضافه کردن محصول",
-                "❌ حذف دسته بندی",
-                "🛒 اضافه کردن دسته بندی",
-                "✏️ ویرایش محصول",
-                "➕ تنظیم قیمت حجم اضافه"
-            ]
-            
-            if message_text in conversation_handled_options:
-                # These should be handled by their respective ConversationHandlers
-                # with higher priority, so we just return here
-                logger.debug(f"Skipping menu item '{message_text}' that should be handled by a ConversationHandler")
-                return
-            
-            # Handle other shop menu options
-            elif message_text == "🎁 ساخت کد هدیه":
-                await shop_menu.create_gift_code(update, context)
-            elif message_text == "❌ حذف کد هدیه":
-                await shop_menu.delete_gift_code(update, context)
-            elif message_text == "🏷️ ساخت کد تخفیف":
-                await shop_menu.create_discount_code(update, context)
-            elif message_text == "❌ حذف کد تخفیف":
-                await shop_menu.delete_discount_code(update, context)
-        
-        elif message_text in ["📊 آمار ربات", "⚙️ تنظیمات اکانت تست", "💰 مالی"]:
-            await update.message.reply_text("🚧 این بخش در حال توسعه است...")
+        if not await text_router.dispatch(update, context, current_state):
+            logger.debug(f"No route for message '{update.message.text}' in state '{current_state}'")
             
     except Exception as e:
         logger.error(f"Error in handle_menu_navigation: {e}")
         logger.error(traceback.format_exc())
         await update.message.reply_text("❌ خطایی رخ داده است. لطفاً دوباره تلاش کنید.")
 
+@callback_router.route("panel_list")
+async def route_panel_list(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    await panel_management_menu.show_panel_list(update, context)
+
+@callback_router.route("panel_list_n_{after_id:int}")
+async def route_panel_list_next(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    await panel_management_menu.show_panel_list(update, context, after_id=action['after_id'])
+
+@callback_router.route("panel_list_p_{before_id:int}")
+async def route_panel_list_prev(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    await panel_management_menu.show_panel_list(update, context, before_id=action['before_id'])
+
+@callback_router.route("back_to_admin")
+async def route_back_to_admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    # We can't directly call show method with a callback query,
+    # so we'll show a message and prompt to use the menu again
+    await update.callback_query.edit_message_text(
+        "برای بازگشت به منوی مدیریت، لطفاً از دکمه‌های زیر استفاده کنید."
+    )
+
+@callback_router.route("panel_type_{panel_type}")
+async def route_panel_type(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    # مستقیم به add_panel_scene ارجاع دهیم تا توسط کد اصلی آن پردازش شود
+    try:
+        return await add_panel_scene.panel_type(update, context)
+    except Exception as e:
+        logger.error(f"Error handling panel_type: {e}")
+        await update.callback_query.edit_message_text("❌ خطایی در پردازش نوع پنل رخ داد. لطفاً دوباره تلاش کنید.")
+
+@callback_router.route("panel_{panel_id:int}")
+async def route_panel_options(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    await panel_management_menu.show_panel_options(update, context, action['panel_id'])
+
+@callback_router.route("confirm_delete_{panel_id:int}")
+async def route_confirm_delete_panel(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    await panel_management_menu.confirm_delete_panel(update, context, action['panel_id'])
+
+@callback_router.route("toggle_panel_{panel_id:int}")
+async def route_toggle_panel(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    await panel_management_menu.toggle_panel_status(update, context, action['panel_id'])
+
+@callback_router.route("delete_panel_{panel_id:int}")
+async def route_delete_panel(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    await panel_management_menu.delete_panel(update, context, action['panel_id'])
+
+callback_router.add("broadcast_stop_{broadcast_id:int}", broadcast_scene.stop_broadcast)
+
 # Callback query handler
 async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle callback queries from inline keyboards"""
@@ -256,55 +278,15 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
     # Answer the callback query to stop loading animation
     await query.answer()
     
-    # Handle different callback data
-    callback_data = query.data
-    logger.info(f"User {user_id} clicked inline button: {callback_data}")
-    
-    # Handle specific callback data first - exact matches
-    if callback_data == "panel_list":
-        await panel_management_menu.show_panel_list(update, context)
-    
-    # Handle back to admin menu
-    elif callback_data == "back_to_admin":
-        # We can't directly call show method with a callback query,
-        # so we'll show a message and prompt to use the menu again
-        await query.edit_message_text(
-            "برای بازگشت به منوی مدیریت، لطفاً از دکمه‌های زیر استفاده کنید."
-        )
-    
-    # پشتیبانی از panel_type
-    elif callback_data.startswith("panel_type_"):
-        # مستقیم به add_panel_scene ارجاع دهیم تا توسط کد اصلی آن پردازش شود
-        try:
-            return await add_panel_scene.panel_type(update, context)
-        except Exception as e:
-            logger.error(f"Error handling panel_type: {e}")
-            await query.edit_message_text("❌ خطایی در پردازش نوع پنل رخ داد. لطفاً دوباره تلاش کنید.")
-    
-    # Handle pattern matches after exact matches
-    # Handle panel selection
-    elif callback_data.startswith("panel_") and len(callback_data.split("_")) >= 2 and callback_data.split("_")[1].isdigit():
-        panel_id = int(callback_data.split("_")[1])
-        await panel_management_menu.show_panel_options(update, context, panel_id)
-    
-    # Handle confirmation for panel deletion
-    elif callback_data.startswith("confirm_delete_"):
-        panel_id = int(callback_data.split("_")[2])
-        await panel_management_menu.confirm_delete_panel(update, context, panel_id)
-    
-    # Handle toggle panel status
-    elif callback_data.startswith("toggle_panel_"):
-        panel_id = int(callback_data.split("_")[2])
-        await panel_management_menu.toggle_panel_status(update, context, panel_id)
-    
-    # Handle delete panel
-    elif callback_data.startswith("delete_panel_"):
-        panel_id = int(callback_data.split("_")[2])
-        await panel_management_menu.delete_panel(update, context, panel_id)
+    logger.info(f"User {user_id} clicked inline button: {query.data}")
+    if not await callback_router.dispatch(update, context):
+        logger.debug(f"No route for callback data '{query.data}'")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler"""
     user_id = update.effective_user.id
+    # ثبت کاربر برای دریافت پیام‌های همگانی
+    await user_service.register_user(user_id, update.effective_user.username)
     # Reset user state to main menu
     user_states[user_id] = "main"
     # Reset conversation flag
@@ -391,12 +373,32 @@ async def send_admin_notification(application):
     except Exception as e:
         logger.error(f"Error sending admin notifications: {e}")
 
-def main():
-    """Start the bot."""
-    print("🤖 Starting SMPanel Bot initialization...")
+def build_application():
+    """Create the bot application with all handlers registered
     
+    Used by main() for polling and PTB webhook mode and by webhook_server.py.
+    """
     # Create the Application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
+    
+    # پردازش همزمان آپدیت‌های کاربران مختلف با حفظ ترتیب آپدیت‌های هر کاربر
+    update_processor = build_update_processor()
+    if update_processor is not None:
+        builder = builder.concurrent_updates(update_processor)
+    
+    # محدودیت نرخ همه ارسال‌ها به API تلگرام (سراسری و برای هر چت)
+    rate_limiter = build_rate_limiter()
+    if rate_limiter is not None:
+        builder = builder.rate_limiter(rate_limiter)
+    
+    # وضعیت کاربران و مراحل گفتگوها در بک‌اند پایدار ذخیره می‌شود
+    builder = builder.persistence(build_persistence())
+    
+    application = builder.build()
+    user_states.bind(application.user_data)
+    
+    # آپدیت‌های تکراری (ارسال مجدد تلگرام) پیش از همه هندلرها کنار گذاشته می‌شوند
+    application.add_handler(TypeHandler(Update, drop_duplicate_updates), group=-1)
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
@@ -424,7 +426,7 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", add_panel_scene.cancel)],
         name="add_panel_conversation",
-        persistent=False
+        persistent=True
     )
     application.add_handler(add_panel_conv_handler, group=1)
     
@@ -439,7 +441,7 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", add_category_scene.cancel)],
         name="add_category_conversation",
-        persistent=False
+        persistent=True
     )
     logger.info("Registering add_category_conv_handler with states: %s", add_category_conv_handler.states)
     application.add_handler(add_category_conv_handler, group=1)
@@ -457,7 +459,7 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", add_product_scene.cancel)],
         name="add_product_conversation",
-        persistent=False
+        persistent=True
     )
     logger.info("Registering add_product_conv_handler")
     application.add_handler(add_product_conv_handler, group=1)
@@ -471,7 +473,7 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", delete_category_scene.cancel)],
         name="delete_category_conversation",
-        persistent=False
+        persistent=True
     )
     logger.info("Registering delete_category_conv_handler")
     application.add_handler(delete_category_conv_handler, group=1)
@@ -486,7 +488,8 @@ def main():
             PRODUCT_CONFIRM_DELETE: [CallbackQueryHandler(delete_product_scene.handle_confirmation)],
         },
         fallbacks=[CommandHandler("cancel", delete_product_scene.cancel)],
-        name="delete_product_conversation"
+        name="delete_product_conversation",
+        persistent=True
     )
     logger.info("Registering delete_product_conv_handler")
     application.add_handler(delete_product_handler, group=1)
@@ -507,7 +510,7 @@ def main():
         fallbacks=[CommandHandler("cancel", edit_product_scene.cancel)],
         name="edit_product_conversation",
         conversation_timeout=300,  # 5 minute timeout
-        persistent=False
+        persistent=True
     )
     logger.info("Registering edit_product_conv_handler")
     application.add_handler(edit_product_conv_handler, group=1)
@@ -538,11 +541,25 @@ def main():
             MessageHandler(filters.Regex("^🔙 بازگشت به منوی مدیریت$"), extra_volume_settings_scene.cancel)
         ],
         name="extra_volume_settings_conversation",
-        persistent=False
+        persistent=True
     )
     logger.info("Registering extra_volume_settings_conv_handler")
     application.add_handler(extra_volume_settings_conv_handler, group=1)
     
+    # Broadcast to all users
+    broadcast_conv_handler = ConversationHandler(
+        entry_points=[MessageHandler(filters.Regex("^📢 پیام همگانی$"), broadcast_scene.start_scene)],
+        states={
+            BROADCAST_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, broadcast_scene.broadcast_message)],
+            BROADCAST_CONFIRM: [CallbackQueryHandler(broadcast_scene.confirmation, pattern="^broadcast_(confirm|cancel)$")],
+        },
+        fallbacks=[CommandHandler("cancel", broadcast_scene.cancel)],
+        name="broadcast_conversation",
+        persistent=True
+    )
+    logger.info("Registering broadcast_conv_handler")
+    application.add_handler(broadcast_conv_handler, group=1)
+    
     # *** THIRD PRIORITY HANDLERS ***
     # Add callback query handler for inline buttons
     application.add_handler(CallbackQueryHandler(handle_callback_query), group=2)
@@ -554,6 +571,14 @@ def main():
     # Register error handler
     application.add_error_handler(error_handler)
     
+    return application
+
+def main():
+    """Start the bot."""
+    print("🤖 Starting SMPanel Bot initialization...")
+    
+    application = build_application()
+    
     # Start the Bot
     print("✅ Bot initialized successfully!")
     
@@ -564,12 +589,22 @@ def main():
     
     # Run as a synchronous function so the event loop works properly
     async def start_webhook_async():
-        # Send admin notification
-        await send_admin_notification(application)
+        # گزارش هندلرهایی که حلقه رویداد را مسدود می‌کنند (LOOP_BLOCK_THRESHOLD)
+        start_loop_monitor()
         
         # Start the webhook
         await application.initialize()
         await application.start()
+        # Send admin notification
+        await send_admin_notification(application)
+        # ادامه پیام‌های همگانی نیمه‌کاره
+        await broadcaster.resume(application)
+        # همگام‌سازی دوره‌ای اینباندهای پنل‌ها با جدول inbounds
+        inbound_syncer.start(application)
+        # اندازه‌گیری دوره‌ای مصرف کلاینت‌ها
+        traffic_collector.start(application)
+        # غیرفعال کردن کلاینت‌های منقضی یا بدون حجم در زمان سررسید
+        expiry_scheduler.start(application)
         await application.updater.start_webhook(
             listen="0.0.0.0",
             port=SERVER_PORT,
@@ -585,12 +620,22 @@ def main():
             await asyncio.sleep(3600)  # انتظار 1 ساعت - این فقط برای نگه داشتن برنامه است
     
     async def start_polling_async():
-        # Send admin notification
-        await send_admin_notification(application)
+        # گزارش هندلرهایی که حلقه رویداد را مسدود می‌کنند (LOOP_BLOCK_THRESHOLD)
+        start_loop_monitor()
         
         # Start polling
         await application.initialize()
         await application.start()
+        # Send admin notification
+        await send_admin_notification(application)
+        # ادامه پیام‌های همگانی نیمه‌کاره
+        await broadcaster.resume(application)
+        # همگام‌سازی دوره‌ای اینباندهای پنل‌ها با جدول inbounds
+        inbound_syncer.start(application)
+        # اندازه‌گیری دوره‌ای مصرف کلاینت‌ها
+        traffic_collector.start(application)
+        # غیرفعال کردن کلاینت‌های منقضی یا بدون حجم در زمان سررسید
+        expiry_scheduler.start(application)
         await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
         
         # Keep the application running - اصلاح روش نگه داشتن اپلیکیشن
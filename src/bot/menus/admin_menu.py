@@ -12,7 +12,7 @@ class AdminMenu(BaseMenu):
         self._keyboard = [
             [self.create_button("📊 آمار ربات")],
             [self.create_button("👥 مدیریت پنل"), self.create_button("🖥 اضافه کردن پنل")],
-            [self.create_button("⚙️ تنظیمات اکانت تست")],
+            [self.create_button("⚙️ تنظیمات اکانت تست"), self.create_button("📢 پیام همگانی")],
             [self.create_button("💰 مالی"), self.create_button("🏪 بخش فروشگاه")],
             [self.create_button("🔙 بازگشت به منوی اصلی")]
         ] 
\ No newline at end of file
@@ -4,10 +4,19 @@
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ContextTypes
 from abc import ABC, abstractmethod
-import asyncio
+
+from src.bot.utils.dedup import update_dedup
 
 class BaseMenu(ABC):
-    """Base class for all menus"""
+    """Base class for all menus
+    
+    The message and keyboard markup of a menu are built once per menu class
+    and cache key and then shared by all users (markups are immutable), so
+    showing a menu does not rebuild its keyboard.
+    """
+    
+    # (menu class, cache key) -> (message, ReplyKeyboardMarkup)
+    _rendered = {}
     
     def __init__(self):
         """Initialize base menu"""
@@ -37,24 +46,51 @@ class BaseMenu(ABC):
             one_time_keyboard=False
         )
     
-    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Show menu to user"""
+    def cache_key(self):
+        """Key of the rendered menu within its class
+        
+        Static menus use the default. A menu whose setup_menu() depends on
+        state (e.g. the user's role) returns a hashable key that captures it,
+        or None to build the menu on every call.
+        """
+        return ()
+    
+    @classmethod
+    def cached(cls, key, build):
+        """Return the value cached for (menu class, key), calling build() on first use"""
+        cache_key = (cls, key)
+        value = BaseMenu._rendered.get(cache_key)
+        if value is None:
+            value = build()
+            BaseMenu._rendered[cache_key] = value
+        return value
+    
+    def _build(self):
         self.setup_menu()
+        return self.message, self.create_keyboard_markup()
+    
+    def render(self):
+        """Get the menu message and keyboard markup
         
-        # اگر این منو قبلاً در این پیام نمایش داده شده، آن را مجدداً نمایش نده
-        menu_marker_key = f"showing_menu_{self.__class__.__name__}"
-        if context.user_data.get(menu_marker_key, False):
-            # منو قبلاً نمایش داده شده، از ارسال مجدد جلوگیری می‌کنیم
+        Returns:
+            tuple: (message, ReplyKeyboardMarkup)
+        """
+        key = self.cache_key()
+        if key is None:
+            return self._build()
+        return self.cached(key, self._build)
+    
+    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show menu to user"""
+        # اگر این منو قبلاً برای همین آپدیت نمایش داده شده (توسط هندلر گروه دیگر)، آن را مجدداً نمایش نده
+        if not update_dedup.claim(update, f"menu:{self.__class__.__name__}"):
             return
         
-        # علامت‌گذاری که این منو در حال نمایش است
-        context.user_data[menu_marker_key] = True
-        
-        # Create keyboard markup
-        keyboard_markup = self.create_keyboard_markup()
+        # پیام و کیبورد منو از کش خوانده می‌شوند
+        message, keyboard_markup = self.render()
         
         # Check if message is empty
-        if not self.message or self.message.strip() == "":
+        if not message or message.strip() == "":
             # If message is empty, just update the keyboard without sending a new message
             await update.message.reply_text(
                 text=" ",  # یک فاصله خالی برای جلوگیری از خطا
@@ -63,18 +99,9 @@ class BaseMenu(ABC):
         else:
             # Normal case: send message with keyboard
             await update.message.reply_text(
-                text=self.message,
+                text=message,
                 reply_markup=keyboard_markup
             )
-        
-        # با تاخیر کوتاه، علامت نمایش منو را پاک می‌کنیم
-        async def reset_menu_flag():
-            await asyncio.sleep(1)
-            if menu_marker_key in context.user_data:
-                del context.user_data[menu_marker_key]
-        
-        # ایجاد وظیفه برای پاکسازی علامت‌ها بعد از یک ثانیه
-        asyncio.create_task(reset_menu_flag())
     
     async def show_with_chat_id(self, chat_id, context: ContextTypes.DEFAULT_TYPE, user_id=None, user_states_dict=None, target_state=None):
         """
@@ -89,11 +116,8 @@ class BaseMenu(ABC):
             user_states_dict: دیکشنری وضعیت‌های کاربر (اختیاری)
             target_state: وضعیت هدف برای تنظیم (اختیاری)
         """
-        # تنظیم منو
-        self.setup_menu()
-        
-        # ایجاد کیبورد
-        keyboard_markup = self.create_keyboard_markup()
+        # دریافت پیام و کیبورد منو از کش
+        message, keyboard_markup = self.render()
         
         # تنظیم وضعیت کاربر اگر اطلاعات داده شده باشد
         if user_id is not None and user_states_dict is not None and target_state is not None:
@@ -102,7 +126,7 @@ class BaseMenu(ABC):
         # ارسال پیام منو
         await context.bot.send_message(
             chat_id=chat_id,
-            text=self.message,
+            text=message,
             reply_markup=keyboard_markup
         )
     
@@ -12,6 +12,16 @@ class EditProductMenu(BaseMenu):
         self._keyboard = [
             [self.create_button("🔙 بازگشت به بخش فروشگاه")]
         ]
+    
+    def edit_options_markup(self):
+        """Get the cached keyboard markup of the edit options menu
+        
+        Only the message depends on the product, the keyboard is the same for all products.
+        """
+        def build():
+            self.setup_edit_options_menu("")
+            return self.create_keyboard_markup()
+        return self.cached('edit_options', build)
         
     def setup_edit_options_menu(self, product_name):
         """Setup edit options menu keyboard and message"""
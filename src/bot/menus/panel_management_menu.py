@@ -5,34 +5,36 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 
 from src.services.panel import PanelService
+from src.services.async_service import AsyncService
+from src.bot.utils.keyboard_helpers import create_pagination_row
+
+# Labels of the circuit breaker states (see src/services/circuit_breaker.py)
+CONNECTION_LABELS = {
+    'closed': "🟢 برقرار",
+    'half_open': "🟡 در حال بررسی دوباره",
+    'open': "🔴 قطع موقت",
+}
 
 class PanelManagementMenu:
     """Panel management menu with inline buttons"""
     
     def __init__(self):
-        self.panel_service = PanelService()
+        self.panel_service = AsyncService(PanelService())
     
-    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Show panel management menu with all panels from database"""
-        # Get all panels from database
-        panels = self.panel_service.get_all_panels()
-        
-        if not panels:
-            # No panels found
-            await update.message.reply_text(
-                "❌ هیچ پنلی یافت نشد!\n"
-                "لطفا ابتدا با استفاده از گزینه 'اضافه کردن پنل' یک پنل جدید اضافه کنید."
-            )
-            return
-        
-        # Create inline keyboard
+    async def _panel_list_markup(self, page):
+        """Build the keyboard of one page of panels"""
         keyboard = []
         
-        # Add each panel as a button
-        for panel in panels:
+        # Add each panel of the page as a button
+        for panel in page.items:
             # Determine status icon
             status_icon = "✅" if panel['status'] == 'active' else "❌"
             
+            # Mark panels whose circuit breaker stops requests to them
+            connection = await self.panel_service.get_connection_state(panel['id'])
+            if connection and connection['state'] != 'closed':
+                status_icon = "🔴" if connection['state'] == 'open' else "🟡"
+            
             # Create button for each panel
             keyboard.append([
                 InlineKeyboardButton(
@@ -41,26 +43,48 @@ class PanelManagementMenu:
                 )
             ])
         
+        # Previous / next page buttons (panel_list_p_{id} / panel_list_n_{id})
+        navigation = create_pagination_row(page, "panel_list")
+        if navigation:
+            keyboard.append(navigation)
+        
         # Add back button
         keyboard.append([
             InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")
         ])
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        return InlineKeyboardMarkup(keyboard)
+    
+    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show panel management menu with the first page of panels"""
+        # Only the current page is read from the database
+        page = await self.panel_service.get_panels_page()
+        
+        if not page.items:
+            # No panels found
+            await update.message.reply_text(
+                "❌ هیچ پنلی یافت نشد!\n"
+                "لطفا ابتدا با استفاده از گزینه 'اضافه کردن پنل' یک پنل جدید اضافه کنید."
+            )
+            return
         
         # Send message with panel list
         await update.message.reply_text(
             "📋 لیست پنل‌های موجود:\n"
             "برای مدیریت هر پنل، روی آن کلیک کنید.",
-            reply_markup=reply_markup
+            reply_markup=await self._panel_list_markup(page)
         )
     
-    async def show_panel_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Show panel list through callback query"""
-        # Get all panels from database
-        panels = self.panel_service.get_all_panels()
+    async def show_panel_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE, after_id=None, before_id=None):
+        """Show a page of the panel list through callback query
+        
+        Args:
+            after_id (int, optional): Show the page after this panel id
+            before_id (int, optional): Show the page before this panel id
+        """
+        page = await self.panel_service.get_panels_page(after_id=after_id, before_id=before_id)
         
-        if not panels:
+        if not page.items:
             # No panels found
             await update.callback_query.edit_message_text(
                 "❌ هیچ پنلی یافت نشد!\n"
@@ -68,40 +92,17 @@ class PanelManagementMenu:
             )
             return
         
-        # Create inline keyboard
-        keyboard = []
-        
-        # Add each panel as a button
-        for panel in panels:
-            # Determine status icon
-            status_icon = "✅" if panel['status'] == 'active' else "❌"
-            
-            # Create button for each panel
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{status_icon} {panel['name']}",
-                    callback_data=f"panel_{panel['id']}"
-                )
-            ])
-        
-        # Add back button
-        keyboard.append([
-            InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")
-        ])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         # Update message with panel list
         await update.callback_query.edit_message_text(
             "📋 لیست پنل‌های موجود:\n"
             "برای مدیریت هر پنل، روی آن کلیک کنید.",
-            reply_markup=reply_markup
+            reply_markup=await self._panel_list_markup(page)
         )
     
     async def show_panel_options(self, update: Update, context: ContextTypes.DEFAULT_TYPE, panel_id):
         """Show options for a specific panel"""
         # Get panel data
-        panel = self.panel_service.get_panel(panel_id)
+        panel = await self.panel_service.get_panel(panel_id)
         
         if not panel:
             # Panel not found
@@ -141,13 +142,25 @@ class PanelManagementMenu:
         # Status icon
         status_icon = "✅" if status == 'active' else "❌"
         
+        # Connection state from the panel's circuit breaker
+        connection = await self.panel_service.get_connection_state(panel_id)
+        if connection is None:
+            connection_text = "⚪️ هنوز بررسی نشده"
+        else:
+            connection_text = CONNECTION_LABELS.get(connection['state'], connection['state'])
+            if connection['state'] == 'open':
+                connection_text += f" (تلاش دوباره تا {connection['retry_after']:.0f} ثانیه دیگر)"
+            if connection['p95_latency'] is not None:
+                connection_text += f"\n⏱ زمان پاسخ (p95): {connection['p95_latency']:.2f} ثانیه | مهلت: {connection['timeout']:.1f} ثانیه"
+        
         # Show panel info
         await update.callback_query.edit_message_text(
             f"🖥 اطلاعات پنل: {panel['name']}\n\n"
             f"🔗 آدرس: {panel['url']}\n"
             f"👤 نام کاربری: {panel['username']}\n"
             f"🔐 رمز عبور: {panel['password']}\n"
-            f"📊 وضعیت: {status_icon} {status_text}\n\n"
+            f"📊 وضعیت: {status_icon} {status_text}\n"
+            f"🔌 اتصال: {connection_text}\n\n"
             f"لطفا عملیات مورد نظر را انتخاب کنید:",
             reply_markup=reply_markup
         )
@@ -155,7 +168,7 @@ class PanelManagementMenu:
     async def confirm_delete_panel(self, update: Update, context: ContextTypes.DEFAULT_TYPE, panel_id):
         """Ask for confirmation before deleting a panel"""
         # Get panel data
-        panel = self.panel_service.get_panel(panel_id)
+        panel = await self.panel_service.get_panel(panel_id)
         
         if not panel:
             # Panel not found
@@ -190,7 +203,7 @@ class PanelManagementMenu:
     async def toggle_panel_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE, panel_id):
         """Toggle panel active status"""
         # Get panel data
-        panel = self.panel_service.get_panel(panel_id)
+        panel = await self.panel_service.get_panel(panel_id)
         
         if not panel:
             # Panel not found
@@ -202,7 +215,7 @@ class PanelManagementMenu:
         new_status = 'inactive' if current_status == 'active' else 'active'
         
         # Update panel status
-        success = self.panel_service.update_panel(panel_id, status=new_status)
+        success = await self.panel_service.update_panel(panel_id, status=new_status)
         
         if success:
             status_text = "فعال" if new_status == 'active' else "غیرفعال"
@@ -216,7 +229,7 @@ class PanelManagementMenu:
     async def delete_panel(self, update: Update, context: ContextTypes.DEFAULT_TYPE, panel_id):
         """Delete a panel"""
         # Get panel data for name
-        panel = self.panel_service.get_panel(panel_id)
+        panel = await self.panel_service.get_panel(panel_id)
         
         if not panel:
             # Panel not found
@@ -226,7 +239,7 @@ class PanelManagementMenu:
         panel_name = panel['name']
         
         # Delete the panel
-        success = self.panel_service.delete_panel(panel_id)
+        success = await self.panel_service.delete_panel(panel_id)
         
         if success:
             await update.callback_query.answer(f"✅ پنل {panel_name} با موفقیت حذف شد.")
@@ -11,14 +11,27 @@ from telegram.ext import (
     filters,
     CallbackContext
 )
+from telegram.error import BadRequest
+import os
+import asyncio
 import logging
 import traceback
 
 from src.services.shop_service import ShopService
+from src.services.async_service import AsyncService
+from src.services.inbound_service import InboundService
+from src.services.inbound_sync import inbound_syncer
 from src.bot.menus.shop_menu import ShopMenu
 from src.bot.menus.admin_menu import AdminMenu
 from src.bot.menus.add_category_menu import AddCategoryMenu
-from src.bot.utils.keyboard_helpers import create_checkbox_keyboard, create_grouped_inbound_keyboard
+from src.bot.utils.keyboard_helpers import (
+    create_checkbox_keyboard,
+    create_grouped_inbound_keyboard,
+    parse_page_callback,
+    set_checkbox_state,
+    edit_reply_markup_if_changed
+)
+from src.bot.utils.persistence import user_states
 
 # Setup logging
 logging.basicConfig(
@@ -34,7 +47,8 @@ class AddCategoryScene:
     """Scene for adding a new category"""
     
     def __init__(self):
-        self.shop_service = ShopService()
+        self.shop_service = AsyncService(ShopService())
+        self.inbound_service = AsyncService(InboundService())
         self.shop_menu = ShopMenu()
         self.admin_menu = AdminMenu()
         self.add_category_menu = AddCategoryMenu()
@@ -55,9 +69,10 @@ class AddCategoryScene:
     async def start_scene(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start the scene"""
         # Initialize user data
-        context.user_data['selected_panels'] = []
-        context.user_data['selected_inbounds'] = []
+        context.user_data['selected_panels'] = set()
+        context.user_data['selected_inbounds'] = set()
         context.user_data['available_inbounds'] = {}
+        context.user_data['inbound_index'] = {}
         
         # Set conversation flag to prevent other handlers from running
         context.user_data['in_conversation'] = True
@@ -65,8 +80,7 @@ class AddCategoryScene:
         logger.info(f"Current conversation state: ADD_CATEGORY_NAME ({ADD_CATEGORY_NAME})")
         
         # تنظیم کیبورد با دکمه بازگشت بدون ارسال پیام اضافی
-        self.add_category_menu.setup_menu()
-        keyboard_markup = self.add_category_menu.create_keyboard_markup()
+        _, keyboard_markup = self.add_category_menu.render()
         
         # ارسال پیام اصلی با کیبورد بازگشت
         await update.message.reply_text(
@@ -100,14 +114,15 @@ class AddCategoryScene:
         context.user_data['category_name'] = category_name
         
         # اطمینان از مقداردهی اولیه selected_panels
-        context.user_data['selected_panels'] = []
-        context.user_data['selected_inbounds'] = []
+        context.user_data['selected_panels'] = set()
+        context.user_data['selected_inbounds'] = set()
+        context.user_data['panels_page'] = {}
         
         try:
-            # Get all panels
-            panels = self.shop_service.get_all_panels()
+            # Only the first page of panels is read; selection is kept in user_data across pages
+            page, reply_markup = await self._panels_keyboard(context)
             
-            if not panels:
+            if not page.items:
                 await update.message.reply_text(
                     "❌ هیچ پنلی یافت نشد. ابتدا باید حداقل یک پنل اضافه کنید."
                 )
@@ -115,20 +130,6 @@ class AddCategoryScene:
                 await self.shop_menu.show(update, context)
                 return ConversationHandler.END
             
-            # Create keyboard with panels
-            keyboard = []
-            
-            for panel in panels:
-                # Use ⬜️ for unselected panels initially
-                keyboard.append([
-                    InlineKeyboardButton(f"⬜️ {panel['name']}", callback_data=f"panel_{panel['id']}")
-                ])
-            
-            # Add confirmation button
-            keyboard.append([InlineKeyboardButton("✅ تایید پنل ها", callback_data="confirm_panels")])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
             await update.message.reply_text(
                 f"📌 انتخاب پنل‌ها برای دسته بندی «{category_name}»\n\n"
                 f"پنل های مورد نظر را انتخاب کنید:\n"
@@ -151,6 +152,143 @@ class AddCategoryScene:
             await self.shop_menu.show(update, context)
             return ConversationHandler.END
     
+    async def load_inbounds(self, panels, refresh=False):
+        """Read the inbounds of several panels from the local snapshot
+        
+        Panels that were never synced (or all panels, with refresh) are synced
+        from the panel first; a panel that fails keeps its previous snapshot.
+        
+        Args:
+            panels (list): Panel dictionaries
+            refresh (bool): Sync every panel before reading
+            
+        Returns:
+            tuple: (dict of panel_id -> inbounds, list of (panel name, reason) for
+                failed panels, time of the oldest sync of the shown panels or None)
+        """
+        panel_ids = [panel['id'] for panel in panels]
+        failed_panels = []
+        if refresh:
+            _, failed_panels = await inbound_syncer.sync_panels(panels)
+        else:
+            _, sync_info = await self.inbound_service.get_inbounds_snapshot(panel_ids)
+            missing = [panel for panel in panels if not (sync_info.get(panel['id']) or {}).get('synced_at')]
+            if missing:
+                _, failed_panels = await inbound_syncer.sync_panels(missing)
+        
+        available_inbounds, sync_info = await self.inbound_service.get_inbounds_snapshot(panel_ids)
+        
+        # Panels whose last background sync failed are shown from their older snapshot
+        failed_names = {name for name, _ in failed_panels}
+        for panel in panels:
+            error = (sync_info.get(panel['id']) or {}).get('error')
+            if error and panel['name'] not in failed_names:
+                failed_panels.append((panel['name'], error))
+        
+        synced_times = [
+            info['synced_at'] for panel_id, info in sync_info.items()
+            if info.get('synced_at') and panel_id in available_inbounds
+        ]
+        return available_inbounds, failed_panels, min(synced_times, default=None)
+    
+    def _store_inbounds(self, context, available_inbounds, failed_panels, synced_at):
+        """Save the loaded inbounds, also indexed by "{panel_id}_{inbound_id}"
+        
+        Selected inbounds that no longer exist are dropped.
+        """
+        context.user_data['available_inbounds'] = available_inbounds
+        context.user_data['inbound_index'] = {
+            f"{panel_id}_{inbound.get('id')}": inbound
+            for panel_id, inbounds in available_inbounds.items()
+            for inbound in inbounds
+        }
+        context.user_data['failed_panels'] = failed_panels
+        context.user_data['inbounds_synced_at'] = synced_at
+        context.user_data['selected_inbounds'] = {
+            inbound_key for inbound_key in context.user_data.get('selected_inbounds', set())
+            if inbound_key in context.user_data['inbound_index']
+        }
+    
+    @staticmethod
+    def _freshness_text(synced_at):
+        """Build the line showing when the shown inbounds were read from the panels"""
+        if synced_at is None:
+            return ""
+        return f"🕒 آخرین به‌روزرسانی: {synced_at:%Y-%m-%d %H:%M}\n\n"
+    
+    @staticmethod
+    def _failed_panels_text(failed_panels):
+        """Build the warning line listing panels whose inbounds could not be fetched"""
+        if not failed_panels:
+            return ""
+        lines = "\n".join(f"• {name}: {reason}" for name, reason in failed_panels)
+        return f"⚠️ پنل‌های بدون پاسخ:\n{lines}\n\n"
+    
+    async def _panels_keyboard(self, context):
+        """Build the panel checkbox keyboard for the page stored in user_data
+        
+        Returns:
+            tuple: (Page, InlineKeyboardMarkup)
+        """
+        page = await self.shop_service.get_panels_page(**context.user_data.get('panels_page', {}))
+        selected_panels = context.user_data['selected_panels']
+        reply_markup = create_checkbox_keyboard(
+            items=page,
+            is_selected_callback=lambda panel_id: panel_id in selected_panels,
+            item_callback_prefix="panel_",
+            confirm_text="✅ تایید پنل ها",
+            confirm_callback="confirm_panels",
+            page_callback_prefix="panels"
+        )
+        return page, reply_markup
+    
+    async def _show_panels(self, query, context):
+        """Show the current page of the panel selection (the message text stays the same)"""
+        _, reply_markup = await self._panels_keyboard(context)
+        await edit_reply_markup_if_changed(query, reply_markup)
+    
+    def _inbounds_keyboard(self, context, panels):
+        """Build the inbound keyboard for the page stored in user_data"""
+        return create_grouped_inbound_keyboard(
+            panel_inbounds_dict=context.user_data['available_inbounds'],
+            panel_dict=panels,
+            selected_inbounds=context.user_data['selected_inbounds'],
+            page_number=context.user_data.get('inbounds_page', 0),
+            refresh_callback="refresh_inbounds"
+        )
+    
+    async def _update_checkbox(self, query, selected, show_page):
+        """Re-render only the tapped checkbox
+        
+        The other buttons of the message are reused as they are; the page is
+        rebuilt only if the message does not contain the button.
+        """
+        current_markup = query.message.reply_markup if query.message is not None else None
+        reply_markup = set_checkbox_state(current_markup, query.data, selected)
+        if reply_markup is None:
+            await show_page()
+        else:
+            await edit_reply_markup_if_changed(query, reply_markup)
+    
+    async def _show_inbounds(self, query, context):
+        """Show the current page of the inbound selection"""
+        panels = await self.shop_service.get_all_panels()
+        reply_markup = self._inbounds_keyboard(context, panels)
+        
+        # Get selected panel names for display
+        selected_panel_names = [
+            p['name'] for p in panels if p['id'] in context.user_data['selected_panels']
+        ]
+        
+        await query.edit_message_text(
+            f"📌 انتخاب اینباندها برای دسته بندی «{context.user_data['category_name']}»\n\n"
+            f"پنل های انتخاب شده: {', '.join(selected_panel_names)}\n\n"
+            f"{self._failed_panels_text(context.user_data.get('failed_panels', []))}"
+            f"{self._freshness_text(context.user_data.get('inbounds_synced_at'))}"
+            f"لطفاً اینباندهای مورد نظر را انتخاب کنید:",
+            reply_markup=reply_markup
+        )
+    
     async def select_panels(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle panel selection"""
         query = update.callback_query
@@ -168,55 +306,41 @@ class AddCategoryScene:
                 )
                 return ConversationHandler.END
 
-            # اطمینان از اینکه selected_panels وجود دارد
-            if 'selected_panels' not in context.user_data:
-                context.user_data['selected_panels'] = []
-                
             # Get available inbounds for selected panels
-            panels = self.shop_service.get_all_panels()
-            available_inbounds = {}
-            selected_panel_names = []
+            panels = await self.shop_service.get_all_panels()
+            selected_panels = [
+                panel for panel in panels
+                if panel['id'] in context.user_data['selected_panels']
+            ]
             
-            for panel in panels:
-                if panel['id'] in context.user_data['selected_panels']:
-                    selected_panel_names.append(panel['name'])
-                    # Get inbounds for this panel
-                    inbounds = self.shop_service.get_panel_inbounds(panel)
-                    if inbounds:
-                        available_inbounds[panel['id']] = inbounds
-                    else:
-                        logger.warning(f"No inbounds found for panel {panel['id']} ({panel['name']})")
+            # اینباندها از نسخه ذخیره شده خوانده می‌شوند؛ پنل‌هایی که هنوز همگام نشده‌اند همین حالا خوانده می‌شوند
+            available_inbounds, failed_panels, synced_at = await self.load_inbounds(selected_panels)
             
             if not available_inbounds:
                 logger.warning(f"No available inbounds found for selected panels: {context.user_data['selected_panels']}")
                 await query.edit_message_text(
                     "❌ هیچ اینباندی در پنل‌های انتخاب شده یافت نشد.\n"
+                    f"{self._failed_panels_text(failed_panels)}"
                     "لطفاً پنل‌های دیگری انتخاب کنید یا اینباندها را در پنل بررسی کنید."
                 )
                 return ConversationHandler.END
             
-            # Save available inbounds for later use
-            context.user_data['available_inbounds'] = available_inbounds
+            self._store_inbounds(context, available_inbounds, failed_panels, synced_at)
+            context.user_data['inbounds_page'] = 0
             
             # ساخت کیبورد اینباندها با استفاده از تابع کمکی
-            if 'selected_inbounds' not in context.user_data:
-                context.user_data['selected_inbounds'] = []
-                
-            reply_markup = create_grouped_inbound_keyboard(
-                panel_inbounds_dict=available_inbounds,
-                panel_dict=panels,
-                selected_inbounds=context.user_data.get('selected_inbounds', [])
-            )
+            context.user_data.setdefault('selected_inbounds', set())
             
-            await query.edit_message_text(
-                f"📌 انتخاب اینباندها برای دسته بندی «{context.user_data['category_name']}»\n\n"
-                f"پنل های انتخاب شده: {', '.join(selected_panel_names)}\n\n"
-                f"لطفاً اینباندهای مورد نظر را انتخاب کنید:",
-                reply_markup=reply_markup
-            )
+            await self._show_inbounds(query, context)
             
             return ADD_SELECT_INBOUNDS
             
+        elif parse_page_callback(callback_data, "panels") is not None:
+            # رفتن به صفحه قبل یا بعد پنل‌ها
+            context.user_data['panels_page'] = parse_page_callback(callback_data, "panels")
+            await self._show_panels(query, context)
+            return ADD_SELECT_PANELS
+            
         # اضافه کردن شرط برای 'panel_list' برای جلوگیری از خطا
         elif callback_data == "panel_list":
             # کاربر دکمه برگشت به لیست پنل ها را زده است - به منوی اصلی برگردیم
@@ -231,36 +355,19 @@ class AddCategoryScene:
                 panel_id = int(callback_data.split('_')[1])
                 
                 # اطمینان از اینکه selected_panels وجود دارد
-                if 'selected_panels' not in context.user_data:
-                    context.user_data['selected_panels'] = []
+                selected_panels = context.user_data.setdefault('selected_panels', set())
                 
                 # Toggle panel selection
-                if panel_id in context.user_data['selected_panels']:
-                    context.user_data['selected_panels'].remove(panel_id)
-                    logger.info(f"Removed panel {panel_id} from selection, now have {context.user_data['selected_panels']}")
+                if panel_id in selected_panels:
+                    selected_panels.discard(panel_id)
+                    logger.info(f"Removed panel {panel_id} from selection, now have {len(selected_panels)}")
                 else:
-                    context.user_data['selected_panels'].append(panel_id)
-                    logger.info(f"Added panel {panel_id} to selection, now have {context.user_data['selected_panels']}")
+                    selected_panels.add(panel_id)
+                    logger.info(f"Added panel {panel_id} to selection, now have {len(selected_panels)}")
                 
-                # استفاده از تابع کمکی برای ساخت کیبورد
-                panels = self.shop_service.get_all_panels()
-                
-                # تابع بررسی انتخاب پنل
-                is_panel_selected = lambda panel_id: panel_id in context.user_data['selected_panels']
-                
-                reply_markup = create_checkbox_keyboard(
-                    items=panels,
-                    is_selected_callback=is_panel_selected,
-                    item_callback_prefix="panel_",
-                    confirm_text="✅ تایید پنل ها",
-                    confirm_callback="confirm_panels"
-                )
-                
-                await query.edit_message_text(
-                    f"📌 انتخاب پنل‌ها برای دسته بندی «{context.user_data['category_name']}»\n\n"
-                    f"پنل های مورد نظر را انتخاب کنید:\n"
-                    f"می‌توانید چندین پنل را انتخاب کنید.",
-                    reply_markup=reply_markup
+                # فقط دکمه همین پنل دوباره ساخته می‌شود
+                await self._update_checkbox(
+                    query, panel_id in selected_panels, lambda: self._show_panels(query, context)
                 )
                 
                 return ADD_SELECT_PANELS
@@ -288,46 +395,41 @@ class AddCategoryScene:
                 )
                 return ConversationHandler.END
             
-            # Process selected inbounds to extract port numbers
-            inbound_ports = []
-            for inbound_key in context.user_data['selected_inbounds']:
-                panel_id, inbound_id = map(int, inbound_key.split('_'))
-                
-                # Find the inbound in available_inbounds
-                for inbound in context.user_data['available_inbounds'].get(panel_id, []):
-                    if inbound.get('id') == inbound_id:
-                        port = inbound.get('port')
-                        if port and port not in inbound_ports:
-                            inbound_ports.append(port)
+            # Selected inbounds in keyboard order, looked up in the index
+            selected_inbounds = context.user_data['selected_inbounds']
+            chosen_inbounds = [
+                inbound for inbound_key, inbound in context.user_data['inbound_index'].items()
+                if inbound_key in selected_inbounds
+            ]
+            
+            # Process selected inbounds to extract port numbers (without duplicates)
+            inbound_ports = list(dict.fromkeys(
+                inbound.get('port') for inbound in chosen_inbounds if inbound.get('port')
+            ))
             
             # Try to add the category to database
             try:
                 # Pass both the panel IDs and inbound ports
-                category_id = self.shop_service.add_category(
+                category_id = await self.shop_service.add_category(
                     context.user_data['category_name'],
                     "",  # Empty description for now
-                    context.user_data['selected_panels'],
+                    sorted(context.user_data['selected_panels']),
                     inbound_ports
                 )
                 
                 # Get panel names for display
-                panels = self.shop_service.get_all_panels()
+                panels = await self.shop_service.get_all_panels()
                 selected_panel_names = [
                     p['name'] for p in panels if p['id'] in context.user_data['selected_panels']
                 ]
                 
                 # Format inbound information with more details
-                inbound_details = []
-                for inbound_key in context.user_data['selected_inbounds']:
-                    panel_id, inbound_id = map(int, inbound_key.split('_'))
-                    
-                    # Find the inbound in available_inbounds
-                    for inbound in context.user_data['available_inbounds'].get(panel_id, []):
-                        if inbound.get('id') == inbound_id:
-                            port = inbound.get('port', 'نامشخص')
-                            protocol = inbound.get('protocol', 'نامشخص')
-                            remark = inbound.get('remark', 'بدون توضیحات')
-                            inbound_details.append(f"پورت {port} | {remark} | {protocol}")
+                inbound_details = [
+                    f"پورت {inbound.get('port', 'نامشخص')} | "
+                    f"{inbound.get('remark', 'بدون توضیحات')} | "
+                    f"{inbound.get('protocol', 'نامشخص')}"
+                    for inbound in chosen_inbounds
+                ]
                 
                 await query.edit_message_text(
                     f"✅ دسته بندی «{context.user_data['category_name']}» با موفقیت اضافه گردید.\n\n"
@@ -344,6 +446,9 @@ class AddCategoryScene:
                     del context.user_data['selected_inbounds']
                 if 'available_inbounds' in context.user_data:
                     del context.user_data['available_inbounds']
+                context.user_data.pop('failed_panels', None)
+                for key in ('inbound_index', 'inbounds_synced_at', 'panels_page', 'inbounds_page'):
+                    context.user_data.pop(key, None)
                 
                 # Reset conversation flag
                 context.user_data['in_conversation'] = False
@@ -353,7 +458,6 @@ class AddCategoryScene:
                 await self.shop_menu.show_with_chat_id(chat_id, context)
                 
                 # تنظیم وضعیت کاربر به "shop"
-                from src.bot.index import user_states
                 user_states[update.effective_user.id] = "shop"
                 
                 return ConversationHandler.END
@@ -374,34 +478,50 @@ class AddCategoryScene:
             # User selected/deselected an inbound
             inbound_key = callback_data.split('_', 1)[1]
             
+            # دکمه‌های قدیمی که اینباند آن‌ها دیگر در لیست نیست نادیده گرفته می‌شوند
+            if inbound_key not in context.user_data.get('inbound_index', {}):
+                return ADD_SELECT_INBOUNDS
+            
             # Toggle inbound selection
-            if inbound_key in context.user_data['selected_inbounds']:
-                context.user_data['selected_inbounds'].remove(inbound_key)
+            selected_inbounds = context.user_data['selected_inbounds']
+            if inbound_key in selected_inbounds:
+                selected_inbounds.discard(inbound_key)
             else:
-                context.user_data['selected_inbounds'].append(inbound_key)
-            
-            # Get panels for panel names
-            panels = self.shop_service.get_all_panels()
+                selected_inbounds.add(inbound_key)
             
-            # ساخت کیبورد با استفاده از تابع کمکی
-            reply_markup = create_grouped_inbound_keyboard(
-                panel_inbounds_dict=context.user_data['available_inbounds'],
-                panel_dict=panels,
-                selected_inbounds=context.user_data['selected_inbounds']
+            # فقط دکمه همین اینباند دوباره ساخته می‌شود
+            await self._update_checkbox(
+                query, inbound_key in selected_inbounds, lambda: self._show_inbounds(query, context)
             )
             
-            # Get selected panel names for display
-            selected_panel_names = [
-                p['name'] for p in panels if p['id'] in context.user_data['selected_panels']
+            return ADD_SELECT_INBOUNDS
+        
+        elif callback_data == "refresh_inbounds":
+            # خواندن دوباره اینباندها از پنل‌های انتخاب شده
+            panels = await self.shop_service.get_all_panels()
+            selected_panels = [
+                panel for panel in panels
+                if panel['id'] in context.user_data['selected_panels']
             ]
-            
-            await query.edit_message_text(
-                f"📌 انتخاب اینباندها برای دسته بندی «{context.user_data['category_name']}»\n\n"
-                f"پنل های انتخاب شده: {', '.join(selected_panel_names)}\n\n"
-                f"لطفاً اینباندهای مورد نظر را انتخاب کنید:",
-                reply_markup=reply_markup
-            )
-            
+            available_inbounds, failed_panels, synced_at = await self.load_inbounds(selected_panels, refresh=True)
+            if available_inbounds:
+                self._store_inbounds(context, available_inbounds, failed_panels, synced_at)
+            else:
+                # اینباندهای قبلی نگه داشته می‌شوند و فقط خطاها نمایش داده می‌شوند
+                context.user_data['failed_panels'] = failed_panels
+            try:
+                await self._show_inbounds(query, context)
+            except BadRequest as e:
+                # Nothing changed since the last refresh
+                if 'not modified' not in str(e).lower():
+                    raise
+            return ADD_SELECT_INBOUNDS
+        
+        elif parse_page_callback(callback_data, "inbounds") is not None:
+            # رفتن به صفحه قبل یا بعد اینباندها
+            context.user_data['inbounds_page'] = parse_page_callback(callback_data, "inbounds")['number']
+            panels = await self.shop_service.get_all_panels()
+            await edit_reply_markup_if_changed(query, self._inbounds_keyboard(context, panels))
             return ADD_SELECT_INBOUNDS
     
     async def confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -423,6 +543,9 @@ class AddCategoryScene:
             del context.user_data['selected_inbounds']
         if 'available_inbounds' in context.user_data:
             del context.user_data['available_inbounds']
+        context.user_data.pop('failed_panels', None)
+        for key in ('inbound_index', 'inbounds_synced_at', 'panels_page', 'inbounds_page'):
+            context.user_data.pop(key, None)
         
         # Reset conversation flag
         context.user_data['in_conversation'] = False
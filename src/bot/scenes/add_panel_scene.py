@@ -13,8 +13,11 @@ from telegram.ext import (
 import logging
 
 from src.services.panel import PanelService
+from src.services.async_service import AsyncService
+from src.services.xui_client import XUIClient, XUIError, XUIAuthError
 from src.bot.menus.add_panel_menu import AddPanelMenu
 from src.bot.menus.admin_menu import AdminMenu
+from src.bot.utils.persistence import user_states
 
 # Setup logging
 logging.basicConfig(
@@ -30,7 +33,7 @@ class AddPanelScene:
     """Scene for adding a new panel"""
     
     def __init__(self):
-        self.panel_service = PanelService()
+        self.panel_service = AsyncService(PanelService())
         self.add_panel_menu = AddPanelMenu()
         self.admin_menu = AdminMenu()
     
@@ -201,96 +204,52 @@ class AddPanelScene:
                 'panel_type': context.user_data['panel_type']
             }
             
-            # Send request to panel to check if login works
-            url = panel_data['url']
-            # Ensure URL has http:// or https:// prefix
-            if not url.startswith(('http://', 'https://')):
-                url = 'http://' + url
-                
-            # Append /login path if it doesn't have it and it's a 3x-ui panel
+            # Check login on the panel before saving it
             if panel_data['panel_type'] == '3x-ui':
-                if not url.endswith('/login'):
-                    url = url.rstrip('/') + '/login'
-                    
-                # Prepare login payload
-                payload = {
-                    'username': panel_data['username'],
-                    'password': panel_data['password']
-                }
-                
-                # Send POST request to panel login URL
-                import requests
-                from requests.exceptions import RequestException
-                import json
-                
                 try:
-                    response = requests.post(url, data=payload, timeout=10)
-                    
-                    if response.status_code == 200:
-                        try:
-                            result = response.json()
-                            if 'success' in result and result['success'] is True:
-                                # Login successful, add panel to database
-                                panel_id = self.panel_service.add_panel(
-                                    panel_data['name'],
-                                    panel_data['url'],
-                                    panel_data['username'],
-                                    panel_data['password'],
-                                    panel_data['panel_type']
-                                )
-                                
-                                await update.message.reply_text(
-                                    f"✅ پنل با موفقیت به ربات اضافه شد.\n"
-                                    f"🆔 شناسه پنل: {panel_id}\n"
-                                    f"📝 نام پنل: {panel_data['name']}\n"
-                                    f"🔧 نوع پنل: {panel_data['panel_type']}\n"
-                                    f"🔗 آدرس پنل: {panel_data['url']}"
-                                )
-                                
-                                # Reset conversation flag
-                                context.user_data['in_conversation'] = False
-                                
-                                # Return to admin menu
-                                await self.admin_menu.show(update, context)
-                                return ConversationHandler.END
-                            else:
-                                await update.message.reply_text(
-                                    "❌ نام کاربری یا رمز عبور اشتباه است."
-                                )
-                                # Ask for password again
-                                return PANEL_PASSWORD
-                        except json.JSONDecodeError:
-                            # Response is not JSON, try to check if it's a redirection to dashboard
-                            await update.message.reply_text(
-                                "⚠️ پاسخ پنل قابل تشخیص نیست.\n"
-                                "لطفاً آدرس پنل را بررسی کنید و دوباره تلاش کنید."
-                            )
-                            # Go back to URL step
-                            return PANEL_URL
-                    elif response.status_code == 401:
-                        await update.message.reply_text(
-                            "❌ نام کاربری یا رمز عبور اشتباه است."
-                        )
-                        # Ask for password again
-                        return PANEL_PASSWORD
-                    else:
-                        await update.message.reply_text(
-                            f"❌ خطا در اتصال به پنل. کد خطا: {response.status_code}\n"
-                            f"لطفاً آدرس پنل را بررسی کنید و دوباره تلاش کنید."
-                        )
-                        # Go back to URL step
-                        return PANEL_URL
-                except RequestException as e:
+                    async with XUIClient(panel_data) as client:
+                        await client.login()
+                except XUIAuthError:
                     await update.message.reply_text(
-                        f"❌ خطا در اتصال به پنل: {str(e)}\n"
+                        "❌ نام کاربری یا رمز عبور اشتباه است."
+                    )
+                    # Ask for password again
+                    return PANEL_PASSWORD
+                except XUIError as e:
+                    await update.message.reply_text(
+                        f"❌ {str(e)}\n"
                         f"لطفاً آدرس پنل را بررسی کنید و دوباره تلاش کنید."
                     )
                     # Go back to URL step
                     return PANEL_URL
+                
+                # Login successful, add panel to database
+                panel_id = await self.panel_service.add_panel(
+                    panel_data['name'],
+                    panel_data['url'],
+                    panel_data['username'],
+                    panel_data['password'],
+                    panel_data['panel_type']
+                )
+                
+                await update.message.reply_text(
+                    f"✅ پنل با موفقیت به ربات اضافه شد.\n"
+                    f"🆔 شناسه پنل: {panel_id}\n"
+                    f"📝 نام پنل: {panel_data['name']}\n"
+                    f"🔧 نوع پنل: {panel_data['panel_type']}\n"
+                    f"🔗 آدرس پنل: {panel_data['url']}"
+                )
+                
+                # Reset conversation flag
+                context.user_data['in_conversation'] = False
+                
+                # Return to admin menu
+                await self.admin_menu.show(update, context)
+                return ConversationHandler.END
             elif panel_data['panel_type'] == 'marzban':
                 # For Marzban panels, we'll implement the connection check later
                 # For now, just add it to the database
-                panel_id = self.panel_service.add_panel(
+                panel_id = await self.panel_service.add_panel(
                     panel_data['name'],
                     panel_data['url'],
                     panel_data['username'],
@@ -342,7 +301,7 @@ class AddPanelScene:
             chat_id=chat_id,
             context=context,
             user_id=user_id,
-            user_states_dict=context.user_data.get('user_states', {}),
+            user_states_dict=user_states,
             target_state="admin_panel"
         )
         return ConversationHandler.END 
\ No newline at end of file
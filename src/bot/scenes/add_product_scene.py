@@ -14,9 +14,11 @@ import logging
 import traceback
 
 from src.services.shop_service import ShopService
+from src.services.async_service import AsyncService
 from src.bot.menus.shop_menu import ShopMenu
 from src.bot.menus.admin_menu import AdminMenu
 from src.bot.menus.add_product_menu import AddProductMenu
+from src.bot.utils.persistence import user_states
 
 # Setup logging
 logging.basicConfig(
@@ -39,7 +41,7 @@ class AddProductScene:
     """Scene for adding a new product"""
     
     def __init__(self):
-        self.shop_service = ShopService()
+        self.shop_service = AsyncService(ShopService())
         self.shop_menu = ShopMenu()
         self.admin_menu = AdminMenu()
         self.add_product_menu = AddProductMenu()
@@ -66,8 +68,7 @@ class AddProductScene:
         logger.info(f"Starting add_product scene for user {update.effective_user.id}")
         
         # تنظیم کیبورد با دکمه بازگشت بدون ارسال پیام اضافی
-        self.add_product_menu.setup_menu()
-        keyboard_markup = self.add_product_menu.create_keyboard_markup()
+        _, keyboard_markup = self.add_product_menu.render()
         
         # ارسال پیام اصلی با کیبورد بازگشت
         await update.message.reply_text(
@@ -99,7 +100,7 @@ class AddProductScene:
             context.user_data['product_name'] = product_name
             
             # Get all categories
-            categories = self.shop_service.get_all_categories()
+            categories = await self.shop_service.get_all_categories()
             
             if not categories or len(categories) == 0:
                 await update.message.reply_text(
@@ -169,7 +170,7 @@ class AddProductScene:
                 chat_id=chat_id,
                 context=context,
                 user_id=user_id,
-                user_states_dict=context.user_data.get('user_states', {}),
+                user_states_dict=user_states,
                 target_state="shop_management"
             )
             return ConversationHandler.END
@@ -186,8 +187,7 @@ class AddProductScene:
         category_id = int(callback_data.split('_')[1])
         
         # Get category details
-        categories = self.shop_service.get_all_categories()
-        selected_category = next((c for c in categories if c['id'] == category_id), None)
+        selected_category = await self.shop_service.get_category_by_id(category_id)
         
         if not selected_category:
             await query.edit_message_text(
@@ -330,7 +330,7 @@ class AddProductScene:
             
             # Try to add the product to the database
             try:
-                product_id = self.shop_service.add_product(
+                product_id = await self.shop_service.add_product(
                     context.user_data['product_name'],
                     context.user_data['data_limit'],
                     context.user_data['price'],
@@ -407,7 +407,7 @@ class AddProductScene:
             chat_id=chat_id,
             context=context,
             user_id=user_id,
-            user_states_dict=context.user_data.get('user_states', {}),
+            user_states_dict=user_states,
             target_state="shop_management"
         )
         return ConversationHandler.END 
\ No newline at end of file
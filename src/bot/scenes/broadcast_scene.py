@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, ConversationHandler
+import logging
+
+from src.services.async_service import AsyncService
+from src.services.broadcast_service import BroadcastService
+from src.services.user_service import UserService
+from src.bot.menus.admin_menu import AdminMenu
+from src.bot.middlewares.admin_middleware import AdminMiddleware
+from src.bot.utils.broadcaster import broadcaster
+from src.bot.utils.persistence import user_states
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Define states
+(
+    BROADCAST_MESSAGE,
+    BROADCAST_CONFIRM
+) = range(2)
+
+class BroadcastScene:
+    """Scene for sending a message to all users"""
+
+    def __init__(self):
+        self.broadcast_service = AsyncService(BroadcastService())
+        self.user_service = AsyncService(UserService())
+        self.admin_menu = AdminMenu()
+        self.admin_middleware = AdminMiddleware()
+
+    async def start_scene(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Start the scene"""
+        if not self.admin_middleware.is_admin(update.effective_user.id):
+            await update.message.reply_text("⛔ شما دسترسی به این بخش را ندارید.")
+            return ConversationHandler.END
+
+        context.user_data['in_conversation'] = True
+        users_count = await self.user_service.count_active_users()
+        await update.message.reply_text(
+            "📢 ارسال پیام همگانی\n\n"
+            f"👥 تعداد کاربران فعال: {users_count}\n\n"
+            "متن پیام را ارسال کنید (برای لغو /cancel):"
+        )
+        return BROADCAST_MESSAGE
+
+    async def broadcast_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the message text and ask for confirmation"""
+        context.user_data['broadcast_text'] = update.message.text
+
+        keyboard = [[
+            InlineKeyboardButton("✅ ارسال", callback_data="broadcast_confirm"),
+            InlineKeyboardButton("❌ لغو", callback_data="broadcast_cancel")
+        ]]
+        await update.message.reply_text(
+            "📝 پیش‌نمایش پیام:\n\n"
+            f"{update.message.text}\n\n"
+            "آیا این پیام برای همه کاربران ارسال شود؟",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return BROADCAST_CONFIRM
+
+    async def confirmation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Create the broadcast and start sending in the background"""
+        query = update.callback_query
+        await query.answer()
+
+        text = context.user_data.pop('broadcast_text', None)
+        context.user_data['in_conversation'] = False
+
+        if query.data != "broadcast_confirm" or not text:
+            await query.edit_message_text("❌ ارسال پیام همگانی لغو شد.")
+            return ConversationHandler.END
+
+        try:
+            broadcast_id, lease_token = await self.broadcast_service.create_broadcast(
+                text, update.effective_user.id, broadcaster.lease_seconds
+            )
+        except Exception as e:
+            logger.error(f"Error creating broadcast: {e}")
+            await query.edit_message_text(f"❌ {e}")
+            return ConversationHandler.END
+
+        broadcaster.start(context.application, broadcast_id, lease_token)
+        await query.edit_message_text(
+            "✅ ارسال پیام همگانی شروع شد.\n"
+            "گزارش پیشرفت در پیام بعدی به‌روزرسانی می‌شود."
+        )
+        return ConversationHandler.END
+
+    async def stop_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+        """Stop a running broadcast from the progress message (routed by handle_callback_query)"""
+        # The sending worker notices the status after its current chunk and updates the report
+        await self.broadcast_service.finish_broadcast(action['broadcast_id'], 'cancelled')
+        await update.callback_query.edit_message_reply_markup(reply_markup=None)
+
+    async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cancel the conversation"""
+        context.user_data.pop('broadcast_text', None)
+        context.user_data['in_conversation'] = False
+
+        await update.effective_message.reply_text("❌ عملیات لغو شد.")
+        await self.admin_menu.show_with_chat_id(
+            chat_id=update.effective_chat.id,
+            context=context,
+            user_id=update.effective_user.id,
+            user_states_dict=user_states,
+            target_state="admin"
+        )
+        return ConversationHandler.END
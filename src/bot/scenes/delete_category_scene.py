@@ -14,7 +14,9 @@ import logging
 import traceback
 
 from src.services.shop_service import ShopService
+from src.services.async_service import AsyncService
 from src.bot.menus.shop_menu import ShopMenu
+from src.bot.utils.persistence import user_states
 
 # Setup logging
 logging.basicConfig(
@@ -33,7 +35,7 @@ class DeleteCategoryScene:
     """Scene for deleting categories"""
     
     def __init__(self):
-        self.shop_service = ShopService()
+        self.shop_service = AsyncService(ShopService())
         self.shop_menu = ShopMenu()
     
     def get_handler(self):
@@ -55,7 +57,7 @@ class DeleteCategoryScene:
         logger.info(f"Starting delete_category scene for user {update.effective_user.id}")
         
         # Get all categories
-        categories = self.shop_service.get_all_categories()
+        categories = await self.shop_service.get_all_categories()
         
         if not categories or len(categories) == 0:
             await update.message.reply_text("❌ هیچ دسته بندی یافت نشد.")
@@ -133,7 +135,7 @@ class DeleteCategoryScene:
                 chat_id=chat_id,
                 context=context,
                 user_id=user_id,
-                user_states_dict=context.user_data.get('user_states', {}),
+                user_states_dict=user_states,
                 target_state="shop_management"
             )
             return ConversationHandler.END
@@ -154,7 +156,7 @@ class DeleteCategoryScene:
                 return SHOW_CATEGORIES
             
             # دریافت اطلاعات دسته‌بندی‌های انتخاب شده
-            categories = self.shop_service.get_all_categories()
+            categories = await self.shop_service.get_all_categories()
             selected_names = []
             
             for cat_id in selected_categories:
@@ -202,7 +204,7 @@ class DeleteCategoryScene:
                 selected_categories.append(category_id)
             
             # دریافت همه دسته‌بندی‌ها
-            categories = self.shop_service.get_all_categories()
+            categories = await self.shop_service.get_all_categories()
             
             # ایجاد صفحه کلید با وضعیت جدید
             keyboard = []
@@ -265,7 +267,7 @@ class DeleteCategoryScene:
         
         if callback_data == "confirm_delete":
             # Delete selected categories
-            result = self.shop_service.delete_multiple_categories(context.user_data['selected_categories'])
+            result = await self.shop_service.delete_multiple_categories(context.user_data['selected_categories'])
             
             if result['success']:
                 await query.edit_message_text(f"✅ {result['message']}")
@@ -281,7 +283,7 @@ class DeleteCategoryScene:
             
         else:  # cancel_delete
             # Return to category selection
-            categories = self.shop_service.get_all_categories()
+            categories = await self.shop_service.get_all_categories()
             keyboard = self._create_categories_keyboard(categories, context.user_data['selected_categories'])
             
             await query.edit_message_text(
@@ -311,7 +313,7 @@ class DeleteCategoryScene:
             chat_id=chat_id,
             context=context,
             user_id=user_id,
-            user_states_dict=context.user_data.get('user_states', {}),
+            user_states_dict=user_states,
             target_state="shop_management"
         )
         
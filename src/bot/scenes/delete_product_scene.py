@@ -14,7 +14,10 @@ import logging
 import traceback
 
 from src.services.shop_service import ShopService
+from src.services.async_service import AsyncService
 from src.bot.menus.shop_menu import ShopMenu
+from src.bot.utils.keyboard_helpers import create_pagination_row, parse_page_callback
+from src.bot.utils.persistence import user_states
 
 # Setup logging
 logging.basicConfig(
@@ -37,7 +40,7 @@ class DeleteProductScene:
     """Scene for deleting products"""
     
     def __init__(self):
-        self.shop_service = ShopService()
+        self.shop_service = AsyncService(ShopService())
         self.shop_menu = ShopMenu()
     
     def get_handler(self):
@@ -61,69 +64,120 @@ class DeleteProductScene:
         logger.info(f"Starting delete_product scene for user {update.effective_user.id}")
         logger.info(f"Setting in_conversation to True")
         
-        # Get all categories for displaying
-        categories = self.shop_service.get_all_categories()
+        # Only the first page of categories is read
+        context.user_data['categories_page'] = {}
+        page = await self.shop_service.get_categories_page()
         
-        if not categories or len(categories) == 0:
+        if not page.items:
             await update.message.reply_text("❌ هیچ دسته‌بندی یافت نشد. ابتدا یک دسته‌بندی اضافه کنید.")
             context.user_data['in_conversation'] = False
             return ConversationHandler.END
         
-        # Create keyboard with categories
+        await update.message.reply_text(
+            "❌ حذف محصول\n\n"
+            "📌 لطفاً ابتدا دسته‌بندی محصولات را انتخاب کنید:",
+            reply_markup=self._categories_markup(page)
+        )
+        
+        return SELECT_CATEGORY
+    
+    def _categories_markup(self, page):
+        """Create keyboard with one page of categories"""
         keyboard = []
-        for category in categories:
+        for category in page.items:
             keyboard.append([
                 InlineKeyboardButton(category['name'], callback_data=f"cat_{category['id']}")
             ])
         
+        navigation = create_pagination_row(page, "cats")
+        if navigation:
+            keyboard.append(navigation)
+        
         keyboard.append([
             InlineKeyboardButton("🔙 بازگشت", callback_data="back")
         ])
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
+        return InlineKeyboardMarkup(keyboard)
+    
+    async def _show_categories(self, query, context):
+        """Show the current page of categories"""
+        page = await self.shop_service.get_categories_page(**context.user_data.get('categories_page', {}))
+        await query.edit_message_text(
             "❌ حذف محصول\n\n"
             "📌 لطفاً ابتدا دسته‌بندی محصولات را انتخاب کنید:",
-            reply_markup=reply_markup
+            reply_markup=self._categories_markup(page)
         )
-        
-        return SELECT_CATEGORY
     
-    def _create_products_keyboard(self, products, selected_products):
-        """Create keyboard with products"""
-        keyboard = []
+    async def _show_products(self, query, context):
+        """Show the current page of products of the selected category
+        
+        Selected products are kept in user_data, so the selection survives
+        moving between pages.
+        
+        Returns:
+            bool: False if the category has no products
+        """
+        category_id = context.user_data.get('selected_category')
+        page = await self.shop_service.get_products_page(
+            category_id, **context.user_data.get('products_page', {})
+        )
         
-        # Add products
-        for product in products:
-            product_id = product.get('id', 0)
-            product_name = product.get('name', 'بدون نام')
+        if not page.items:
+            await query.edit_message_text(
+                "❌ هیچ محصولی در این دسته‌بندی یافت نشد.",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_categories")
+                ]])
+            )
+            return False
+        
+        # ایجاد فهرست انتخاب‌ها اگر وجود ندارد
+        if 'selected_products' not in context.user_data:
+            context.user_data['selected_products'] = []
+        
+        keyboard = []
+        for product in page.items:
+            product_id = product['id']
+            product_name = product['name']
+            
+            # نشان دادن وضعیت انتخاب
+            is_selected = product_id in context.user_data['selected_products']
+            prefix = "✅" if is_selected else "⬜️"
             
-            # فقط نام محصول نمایش داده شود
-            checkbox = "☑️" if product_id in selected_products else "⬜️"
             keyboard.append([
-                InlineKeyboardButton(
-                    f"{checkbox} {product_name}", 
-                    callback_data=f"product_{product_id}"
-                )
+                InlineKeyboardButton(f"{prefix} {product_name}", callback_data=f"prod_{product_id}")
             ])
         
-        # Add control buttons
-        control_buttons = []
+        # دکمه‌های صفحه قبل و بعد
+        navigation = create_pagination_row(page, "prods")
+        if navigation:
+            keyboard.append(navigation)
         
-        if selected_products:
-            control_buttons = [
-                InlineKeyboardButton("❌ حذف موارد انتخاب شده", callback_data="delete_selected"),
-                InlineKeyboardButton("🔄 پاک کردن انتخاب‌ها", callback_data="clear_selection")
-            ]
-        else:
-            control_buttons = [
-                InlineKeyboardButton("🔙 بازگشت", callback_data="back")
-            ]
+        # دکمه‌های عملیات
+        action_row = []
         
-        keyboard.append(control_buttons)
+        # فقط زمانی دکمه حذف موارد انتخاب شده را نشان بده که حداقل یک محصول انتخاب شده باشد
+        if context.user_data['selected_products']:
+            action_row.append(
+                InlineKeyboardButton("❌ حذف موارد انتخاب شده", callback_data="delete_selected")
+            )
         
-        return keyboard
+        action_row.append(
+            InlineKeyboardButton("🔙 بازگشت به دسته‌بندی‌ها", callback_data="back_to_categories")
+        )
+        
+        keyboard.append(action_row)
+        
+        category = await self.shop_service.get_category_by_id(category_id)
+        selected_category_name = category['name'] if category else "نامشخص"
+        
+        await query.edit_message_text(
+            f"❌ حذف محصول از دسته‌بندی: {selected_category_name}\n\n"
+            f"📌 محصولات مورد نظر برای حذف را انتخاب کنید:\n"
+            f"می‌توانید چندین محصول را انتخاب کنید.",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return True
     
     async def handle_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle product selection"""
@@ -145,102 +199,46 @@ class DeleteProductScene:
             context.user_data['in_conversation'] = False
             if 'selected_products' in context.user_data:
                 del context.user_data['selected_products']
+            for key in ('categories_page', 'products_page'):
+                context.user_data.pop(key, None)
             
             # استفاده از show_with_chat_id به جای show
             await self.shop_menu.show_with_chat_id(
                 chat_id=chat_id,
                 context=context,
                 user_id=user_id,
-                user_states_dict=context.user_data.get('user_states', {}),
+                user_states_dict=user_states,
                 target_state="shop_management"
             )
             return ConversationHandler.END
         
-        # گرفتن دسته‌بندی‌ها
-        categories = self.shop_service.get_all_categories()
-        
         # اگر دکمه انتخاب دسته‌بندی زده شده
         if callback_data.startswith('cat_'):
             category_id = int(callback_data.split('_')[1])
             
-            # ذخیره دسته‌بندی انتخاب شده
+            # ذخیره دسته‌بندی انتخاب شده و شروع از صفحه اول محصولات
             context.user_data['selected_category'] = category_id
+            context.user_data['products_page'] = {}
             
-            # گرفتن محصولات دسته‌بندی
-            products = self.shop_service.get_products_by_category(category_id)
-            
-            if not products:
-                await query.edit_message_text(
-                    "❌ هیچ محصولی در این دسته‌بندی یافت نشد.",
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_categories")
-                    ]])
-                )
-                return SELECT_PRODUCT
-            
-            # ایجاد کیبورد محصولات
-            keyboard = []
-            # ایجاد فهرست انتخاب‌ها اگر وجود ندارد
-            if 'selected_products' not in context.user_data:
-                context.user_data['selected_products'] = []
-                
-            for product in products:
-                product_id = product['id']
-                product_name = product['name']
-                
-                # نشان دادن وضعیت انتخاب
-                is_selected = product_id in context.user_data['selected_products']
-                prefix = "✅" if is_selected else "⬜️"
-                
-                keyboard.append([
-                    InlineKeyboardButton(f"{prefix} {product_name}", callback_data=f"prod_{product_id}")
-                ])
-            
-            # دکمه‌های عملیات
-            action_row = []
-            
-            # فقط زمانی دکمه حذف موارد انتخاب شده را نشان بده که حداقل یک محصول انتخاب شده باشد
-            if context.user_data.get('selected_products', []):
-                action_row.append(
-                    InlineKeyboardButton("❌ حذف موارد انتخاب شده", callback_data="delete_selected")
-                )
-            
-            action_row.append(
-                InlineKeyboardButton("🔙 بازگشت به دسته‌بندی‌ها", callback_data="back_to_categories")
-            )
-            
-            keyboard.append(action_row)
-            
-            selected_category_name = next((c['name'] for c in categories if c['id'] == category_id), "نامشخص")
-            
-            await query.edit_message_text(
-                f"❌ حذف محصول از دسته‌بندی: {selected_category_name}\n\n"
-                f"📌 محصولات مورد نظر برای حذف را انتخاب کنید:\n"
-                f"می‌توانید چندین محصول را انتخاب کنید.",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            
+            await self._show_products(query, context)
+            return SELECT_PRODUCT
+        
+        # اگر دکمه صفحه قبل یا بعد دسته‌بندی‌ها زده شده
+        elif parse_page_callback(callback_data, 'cats') is not None:
+            context.user_data['categories_page'] = parse_page_callback(callback_data, 'cats')
+            await self._show_categories(query, context)
+            return SELECT_CATEGORY
+        
+        # اگر دکمه صفحه قبل یا بعد محصولات زده شده
+        elif parse_page_callback(callback_data, 'prods') is not None:
+            context.user_data['products_page'] = parse_page_callback(callback_data, 'prods')
+            await self._show_products(query, context)
             return SELECT_PRODUCT
         
         # اگر دکمه بازگشت به دسته‌بندی‌ها زده شده
         elif callback_data == 'back_to_categories':
             # نمایش دسته‌بندی‌ها
-            keyboard = []
-            for category in categories:
-                keyboard.append([
-                    InlineKeyboardButton(category['name'], callback_data=f"cat_{category['id']}")
-                ])
-            
-            keyboard.append([
-                InlineKeyboardButton("🔙 بازگشت", callback_data="back")
-            ])
-            
-            await query.edit_message_text(
-                "❌ حذف محصول\n\n"
-                "📌 لطفاً ابتدا دسته‌بندی محصولات را انتخاب کنید:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            
+            await self._show_categories(query, context)
             return SELECT_CATEGORY
         
         # اگر دکمه حذف موارد انتخاب شده زده شده
@@ -259,7 +257,7 @@ class DeleteProductScene:
             
             # دریافت اطلاعات محصولات انتخاب شده
             category_id = context.user_data.get('selected_category')
-            products = self.shop_service.get_products_by_category(category_id)
+            products = await self.shop_service.get_products_by_category(category_id)
             
             selected_product_names = []
             for product_id in selected_products:
@@ -294,7 +292,7 @@ class DeleteProductScene:
                 return ConversationHandler.END
             
             # حذف محصولات
-            result = self.shop_service.delete_multiple_products(selected_products)
+            result = await self.shop_service.delete_multiple_products(selected_products)
             
             if result['success']:
                 await query.edit_message_text(
@@ -331,46 +329,8 @@ class DeleteProductScene:
             else:
                 context.user_data['selected_products'].append(product_id)
             
-            # نمایش دوباره محصولات با وضعیت جدید
-            category_id = context.user_data.get('selected_category')
-            products = self.shop_service.get_products_by_category(category_id)
-            
-            keyboard = []
-            for product in products:
-                product_id = product['id']
-                product_name = product['name']
-                
-                # نشان دادن وضعیت انتخاب
-                is_selected = product_id in context.user_data['selected_products']
-                prefix = "✅" if is_selected else "⬜️"
-                
-                keyboard.append([
-                    InlineKeyboardButton(f"{prefix} {product_name}", callback_data=f"prod_{product_id}")
-                ])
-            
-            # دکمه‌های عملیات
-            action_row = []
-            
-            # فقط زمانی دکمه حذف موارد انتخاب شده را نشان بده که حداقل یک محصول انتخاب شده باشد
-            if context.user_data.get('selected_products', []):
-                action_row.append(
-                    InlineKeyboardButton("❌ حذف موارد انتخاب شده", callback_data="delete_selected")
-                )
-            
-            action_row.append(
-                InlineKeyboardButton("🔙 بازگشت به دسته‌بندی‌ها", callback_data="back_to_categories")
-            )
-            
-            keyboard.append(action_row)
-            
-            selected_category_name = next((c['name'] for c in categories if c['id'] == category_id), "نامشخص")
-            
-            await query.edit_message_text(
-                f"❌ حذف محصول از دسته‌بندی: {selected_category_name}\n\n"
-                f"📌 محصولات مورد نظر برای حذف را انتخاب کنید:\n"
-                f"می‌توانید چندین محصول را انتخاب کنید.",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            # نمایش دوباره همان صفحه محصولات با وضعیت جدید
+            await self._show_products(query, context)
             
             return SELECT_PRODUCT
     
@@ -393,7 +353,7 @@ class DeleteProductScene:
         
         if callback_data == "confirm_delete":
             # Delete selected products
-            result = self.shop_service.delete_multiple_products(context.user_data['selected_products'])
+            result = await self.shop_service.delete_multiple_products(context.user_data['selected_products'])
             
             if result['success']:
                 await query.edit_message_text(f"✅ {result['message']}")
@@ -404,20 +364,14 @@ class DeleteProductScene:
             context.user_data['in_conversation'] = False
             if 'selected_products' in context.user_data:
                 del context.user_data['selected_products']
+            for key in ('categories_page', 'products_page'):
+                context.user_data.pop(key, None)
             
             return ConversationHandler.END
             
         else:  # cancel_delete
-            # Return to product selection
-            products = self.shop_service.get_all_products()
-            keyboard = self._create_products_keyboard(products, context.user_data['selected_products'])
-            
-            await query.edit_message_text(
-                "❌ حذف محصول\n\n"
-                "📌 محصولات مورد نظر برای حذف را انتخاب کنید:\n"
-                "می‌توانید چندین محصول را انتخاب کنید.",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+            # Return to the product page of the selected category
+            await self._show_products(query, context)
             
             return SELECT_PRODUCT
     
@@ -427,6 +381,8 @@ class DeleteProductScene:
         context.user_data['in_conversation'] = False
         if 'selected_products' in context.user_data:
             del context.user_data['selected_products']
+        for key in ('categories_page', 'products_page'):
+            context.user_data.pop(key, None)
         
         # Get chat_id and user_id
         chat_id = update.effective_chat.id
@@ -439,7 +395,7 @@ class DeleteProductScene:
             chat_id=chat_id, 
             context=context,
             user_id=user_id,
-            user_states_dict=context.user_data.get('user_states', {}),
+            user_states_dict=user_states,
             target_state="shop_management"
         )
         
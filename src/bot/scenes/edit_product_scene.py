@@ -14,9 +14,11 @@ import logging
 import traceback
 
 from src.services.shop_service import ShopService
+from src.services.async_service import AsyncService
 from src.bot.menus.shop_menu import ShopMenu
 from src.bot.menus.admin_menu import AdminMenu
 from src.bot.menus.edit_product_menu import EditProductMenu
+from src.bot.utils.persistence import user_states
 
 # Setup logging
 logging.basicConfig(
@@ -51,7 +53,7 @@ class EditProductScene:
     """Scene for editing products"""
     
     def __init__(self):
-        self.shop_service = ShopService()
+        self.shop_service = AsyncService(ShopService())
         self.shop_menu = ShopMenu()
         self.admin_menu = AdminMenu()
         self.edit_product_menu = EditProductMenu()
@@ -64,7 +66,7 @@ class EditProductScene:
         logger.info(f"Starting edit_product scene for user {update.effective_user.id}")
         
         # Get all categories
-        categories = self.shop_service.get_all_categories()
+        categories = await self.shop_service.get_all_categories()
         
         if not categories or len(categories) == 0:
             # شناسایی نوع update (پیام یا callback query)
@@ -83,7 +85,7 @@ class EditProductScene:
                     chat_id=chat_id,
                     context=context,
                     user_id=user_id,
-                    user_states_dict=context.user_data.get('user_states', {}),
+                    user_states_dict=user_states,
                     target_state='shop_management'
                 )
             else:
@@ -146,7 +148,7 @@ class EditProductScene:
                 chat_id=chat_id, 
                 context=context, 
                 user_id=user_id,
-                user_states_dict=context.user_data.get('user_states', {}),
+                user_states_dict=user_states,
                 target_state='shop_management'
             )
             
@@ -156,8 +158,7 @@ class EditProductScene:
         category_id = int(callback_data.split('_')[2])
         
         # Get category details
-        categories = self.shop_service.get_all_categories()
-        selected_category = next((c for c in categories if c['id'] == category_id), None)
+        selected_category = await self.shop_service.get_category_by_id(category_id)
         
         if not selected_category:
             await query.edit_message_text(INVALID_CATEGORY_ERROR)
@@ -169,8 +170,7 @@ class EditProductScene:
         context.user_data['edit_product']['category_name'] = selected_category['name']
         
         # Get products in this category
-        products = self.shop_service.get_all_products()
-        category_products = [p for p in products if p.get('category_id') == category_id]
+        category_products = await self.shop_service.get_products_by_category(category_id)
         
         if not category_products:
             await query.edit_message_text(NO_PRODUCTS_ERROR.format(selected_category['name']))
@@ -221,7 +221,7 @@ class EditProductScene:
         product_id = int(callback_data.split('_')[2])
         
         # Get product details
-        product = self.shop_service.get_product_by_id(product_id)
+        product = await self.shop_service.get_product_by_id(product_id)
         
         if not product:
             await query.edit_message_text(
@@ -250,8 +250,7 @@ class EditProductScene:
         await query.message.delete()
         
         # Setup edit options menu
-        self.edit_product_menu.setup_edit_options_menu(product['name'])
-        keyboard_markup = self.edit_product_menu.create_keyboard_markup()
+        keyboard_markup = self.edit_product_menu.edit_options_markup()
         
         # ارسال پیام جدید با کیبورد فیزیکی و اطلاعات محصول
         await query.message.reply_text(
@@ -309,7 +308,7 @@ class EditProductScene:
                 
             elif message_text == "دسته بندی":
                 # Get all categories
-                categories = self.shop_service.get_all_categories()
+                categories = await self.shop_service.get_all_categories()
                 
                 if not categories:
                     await update.message.reply_text(NO_CATEGORIES_ERROR)
@@ -380,7 +379,7 @@ class EditProductScene:
     async def _update_product_and_show_result(self, update, context, field_name, old_value_str, new_value_str, return_state):
         """متد کمکی برای به‌روزرسانی محصول و نمایش نتیجه"""
         try:
-            success = self.shop_service.update_product(
+            success = await self.shop_service.update_product(
                 context.user_data['edit_product']['product_id'],
                 context.user_data['edit_product']['product_name'],
                 context.user_data['edit_product']['data_limit'],
@@ -391,8 +390,7 @@ class EditProductScene:
             
             if success:
                 # Setup edit options menu
-                self.edit_product_menu.setup_edit_options_menu(context.user_data['edit_product']['product_name'])
-                keyboard_markup = self.edit_product_menu.create_keyboard_markup()
+                keyboard_markup = self.edit_product_menu.edit_options_markup()
                 
                 await update.message.reply_text(
                     UPDATE_SUCCESS_TEMPLATE.format(field_name, old_value_str, new_value_str),
@@ -447,8 +445,7 @@ class EditProductScene:
             await query.edit_message_reply_markup(reply_markup=None)
             
             # نمایش پیام با کیبورد فیزیکی
-            self.edit_product_menu.setup_edit_options_menu(context.user_data['edit_product']['product_name'])
-            keyboard_markup = self.edit_product_menu.create_keyboard_markup()
+            keyboard_markup = self.edit_product_menu.edit_options_markup()
             
             await query.message.reply_text(
                 "لطفاً بخش مورد نظر برای ویرایش را انتخاب کنید:",
@@ -460,8 +457,7 @@ class EditProductScene:
         category_id = int(callback_data.split('_')[2])
         
         # Get category details
-        categories = self.shop_service.get_all_categories()
-        selected_category = next((c for c in categories if c['id'] == category_id), None)
+        selected_category = await self.shop_service.get_category_by_id(category_id)
         
         if not selected_category:
             await query.edit_message_text(INVALID_CATEGORY_ERROR)
@@ -476,7 +472,7 @@ class EditProductScene:
         
         # Update product in database
         try:
-            success = self.shop_service.update_product(
+            success = await self.shop_service.update_product(
                 context.user_data['edit_product']['product_id'],
                 context.user_data['edit_product']['product_name'],
                 context.user_data['edit_product']['data_limit'],
@@ -493,8 +489,7 @@ class EditProductScene:
                 await query.message.delete()
                 
                 # تنظیم منوی ویرایش
-                self.edit_product_menu.setup_edit_options_menu(context.user_data['edit_product']['product_name'])
-                keyboard_markup = self.edit_product_menu.create_keyboard_markup()
+                keyboard_markup = self.edit_product_menu.edit_options_markup()
                 
                 # نمایش فقط پیام موفقیت و برگشت به منوی ویرایش
                 sent_message = await query.message.reply_text(
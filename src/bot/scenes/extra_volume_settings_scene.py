@@ -13,7 +13,9 @@ from telegram.ext import (
 import logging
 
 from src.services.shop_service import ShopService
+from src.services.async_service import AsyncService
 from src.bot.menus.shop_menu import ShopMenu
+from src.bot.utils.persistence import user_states
 
 # Setup logging
 logging.basicConfig(
@@ -35,7 +37,7 @@ class ExtraVolumeSettingsScene:
     """Scene for configuring extra volume settings"""
     
     def __init__(self):
-        self.shop_service = ShopService()
+        self.shop_service = AsyncService(ShopService())
         self.shop_menu = ShopMenu()
     
     # متدهای کمکی جدید برای کاهش تکرار کد
@@ -82,7 +84,7 @@ class ExtraVolumeSettingsScene:
         
         # Save to database
         category_id = context.user_data['extra_volume_settings']['category_id']
-        success = update_method(category_id, new_value)
+        success = await update_method(category_id, new_value)
         
         if success:
             old_display = format_func(old_value) if format_func else old_value
@@ -108,7 +110,7 @@ class ExtraVolumeSettingsScene:
         logger.info(f"Starting extra_volume_settings scene for user {update.effective_user.id}")
         
         # Get all categories
-        categories = self.shop_service.get_all_categories()
+        categories = await self.shop_service.get_all_categories()
         
         if not categories or len(categories) == 0:
             await update.message.reply_text("❌ هیچ دسته‌بندی یافت نشد. ابتدا یک دسته‌بندی اضافه کنید.")
@@ -164,7 +166,7 @@ class ExtraVolumeSettingsScene:
                 chat_id=chat_id,
                 context=context,
                 user_id=user_id,
-                user_states_dict=context.user_data.get('user_states', {}),
+                user_states_dict=user_states,
                 target_state="shop_management"
             )
             return ConversationHandler.END
@@ -173,8 +175,7 @@ class ExtraVolumeSettingsScene:
         category_id = int(callback_data.split('_')[2])
         
         # Get category details
-        categories = self.shop_service.get_all_categories()
-        selected_category = next((c for c in categories if c['id'] == category_id), None)
+        selected_category = await self.shop_service.get_category_by_id(category_id)
         
         if not selected_category:
             await query.edit_message_text(
@@ -189,7 +190,7 @@ class ExtraVolumeSettingsScene:
         context.user_data['extra_volume_settings']['category_name'] = selected_category['name']
         
         # Get current extra volume settings for this category
-        settings = self.shop_service.get_extra_volume_settings(category_id)
+        settings = await self.shop_service.get_extra_volume_settings(category_id)
         
         if settings:
             # Save current settings
@@ -414,7 +415,7 @@ class ExtraVolumeSettingsScene:
             chat_id=chat_id,
             context=context,
             user_id=user_id,
-            user_states_dict=context.user_data.get('user_states', {}),
+            user_states_dict=user_states,
             target_state="shop_management"
         )
         return ConversationHandler.END
@@ -463,7 +464,7 @@ class ExtraVolumeSettingsScene:
         context.user_data['extra_volume_settings']['is_enabled'] = is_enabled
         
         # Save to database
-        success = self.shop_service.set_extra_volume_enabled(category_id, is_enabled)
+        success = await self.shop_service.set_extra_volume_enabled(category_id, is_enabled)
         
         if success:
             old_status_text = "فعال ✅" if old_status else "غیرفعال ❌"
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import asyncio
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Forbidden, BadRequest
+
+from src.services.async_service import AsyncService
+from src.services.broadcast_service import BroadcastLeaseLost, BroadcastService
+from src.bot.utils.rate_limiter import PRIORITY_BULK
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def classify_send_error(error):
+    """Map a send error to a delivery status ('blocked', 'deleted' or 'failed')"""
+    message = str(error).lower()
+    if isinstance(error, Forbidden):
+        return 'deleted' if 'deactivated' in message else 'blocked'
+    if isinstance(error, BadRequest) and 'chat not found' in message:
+        return 'deleted'
+    return 'failed'
+
+
+class Broadcaster:
+    """Sends broadcasts to all active users
+
+    Recipients are read in keyset-paginated chunks (the next chunk is loaded
+    while the current one is sent) and sent by a bounded number of concurrent
+    sends through the bot's rate limiter in the bulk lane, so interactive
+    replies stay fast. After each chunk the outcomes and the checkpoint are
+    stored in one transaction; a broadcast interrupted by a crash or restart
+    is continued after the last stored chunk by resume() once its lease
+    expires. Every claim gets its own lease token; a run whose lease expired
+    stops at its next checkpoint without storing it and is only continued
+    by whichever process claims the broadcast next.
+
+    Args:
+        chunk_size (int): Recipients read and checkpointed at a time
+        concurrency (int): Sends in flight at the same time
+        lease_seconds (int): Seconds a process owns a running broadcast
+            without storing a chunk
+    """
+
+    def __init__(self, chunk_size=200, concurrency=30, lease_seconds=120):
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.broadcast_service = AsyncService(BroadcastService())
+        self._tasks = {}
+
+    def start(self, application, broadcast_id, lease_token):
+        """Send a broadcast in the background
+
+        Args:
+            application: The bot application
+            broadcast_id (int): Broadcast ID
+            lease_token (str): Token of the caller's lease on the broadcast
+        """
+        if broadcast_id in self._tasks:
+            return
+        task = application.create_task(self._run(application, broadcast_id, lease_token))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def resume(self, application):
+        """Continue broadcasts left running by a previous process"""
+        for broadcast in await self.broadcast_service.get_running_broadcasts():
+            application.create_task(
+                self._resume_after(application, broadcast['id'], broadcast['lease_left'])
+            )
+
+    async def _resume_after(self, application, broadcast_id, delay):
+        # Wait for the lease of the previous owner, which may still be alive
+        await asyncio.sleep(delay + 1)
+        while True:
+            try:
+                lease_token = await self.broadcast_service.claim_broadcast(broadcast_id, self.lease_seconds)
+                break
+            except Exception as e:
+                # E.g. the database error that stopped the broadcast has not cleared yet
+                logger.error(f"Error claiming broadcast {broadcast_id}, retrying in {self.lease_seconds}s: {e}")
+                await asyncio.sleep(self.lease_seconds)
+        if lease_token:
+            logger.info(f"Resuming broadcast {broadcast_id}")
+            self.start(application, broadcast_id, lease_token)
+
+    def _send_kwargs(self, bot):
+        # rate_limit_args may only be passed when the bot has a rate limiter
+        return {'rate_limit_args': {'priority': PRIORITY_BULK}} if bot.rate_limiter else {}
+
+    async def _send(self, bot, semaphore, user_id, telegram_id, text):
+        async with semaphore:
+            try:
+                await bot.send_message(chat_id=telegram_id, text=text, **self._send_kwargs(bot))
+                return user_id, 'ok', None
+            except Exception as e:
+                return user_id, classify_send_error(e), str(e)[:255]
+
+    async def _run(self, application, broadcast_id, lease_token):
+        bot = application.bot
+        broadcast = await self.broadcast_service.get_broadcast(broadcast_id)
+        if broadcast is None or broadcast['status'] != 'running':
+            return
+
+        text = broadcast['message_text']
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_user_id = broadcast['last_user_id']
+        started = time.monotonic()
+        handled = 0
+        progress = await self._send_progress(bot, broadcast, None)
+        status = 'completed'
+
+        next_chunk = None
+        try:
+            next_chunk = asyncio.ensure_future(
+                self.broadcast_service.get_recipients(last_user_id, self.chunk_size)
+            )
+            while True:
+                chunk = await next_chunk
+                if not chunk:
+                    break
+                # Load the following chunk while this one is sent
+                next_chunk = asyncio.ensure_future(
+                    self.broadcast_service.get_recipients(chunk[-1][0], self.chunk_size)
+                )
+                results = await asyncio.gather(*(
+                    self._send(bot, semaphore, user_id, telegram_id, text)
+                    for user_id, telegram_id in chunk
+                ))
+                last_user_id = chunk[-1][0]
+                await self.broadcast_service.record_chunk(
+                    broadcast_id, results, last_user_id, lease_token, self.lease_seconds
+                )
+
+                handled += len(chunk)
+                rate = handled / max(time.monotonic() - started, 0.001)
+                logger.info(f"Broadcast {broadcast_id}: {handled} sent this run, {rate:.1f} msg/s")
+                broadcast = await self.broadcast_service.get_broadcast(broadcast_id)
+                progress = await self._send_progress(bot, broadcast, progress, rate)
+
+                # Cancelled through BroadcastService.finish_broadcast, possibly by another worker
+                if broadcast['status'] != 'running':
+                    next_chunk.cancel()
+                    status = broadcast['status']
+                    break
+        except BroadcastLeaseLost:
+            next_chunk.cancel()
+            # The chunk was not stored; a new claim only succeeds if no other process took the broadcast over
+            logger.warning(f"Broadcast {broadcast_id} lost its lease after user {broadcast['last_user_id']}, stopping this run")
+            application.create_task(self._resume_after(application, broadcast_id, 0))
+            return
+        except Exception as e:
+            if next_chunk is not None:
+                next_chunk.cancel()
+            # Resumed from the checkpoint once the lease expires (by this or another process)
+            logger.error(f"Broadcast {broadcast_id} stopped at user {last_user_id}, resuming in {self.lease_seconds}s: {e}")
+            application.create_task(self._resume_after(application, broadcast_id, self.lease_seconds))
+            return
+
+        await self.broadcast_service.finish_broadcast(broadcast_id, status, lease_token)
+        elapsed = time.monotonic() - started
+        broadcast = await self.broadcast_service.get_broadcast(broadcast_id)
+        logger.info(f"Broadcast {broadcast_id} {status}: {handled} recipients in {elapsed:.0f}s")
+        await self._send_progress(bot, broadcast, progress, handled / max(elapsed, 0.001), finished=True)
+
+    async def _send_progress(self, bot, broadcast, message, rate=0.0, finished=False):
+        """Send or update the progress report in the admin's chat"""
+        done = (broadcast['sent_count'] + broadcast['blocked_count']
+                + broadcast['deleted_count'] + broadcast['failed_count'])
+        if finished:
+            title = "✅ ارسال پیام همگانی به پایان رسید" if broadcast['status'] == 'completed' else "⏹ ارسال پیام همگانی متوقف شد"
+        else:
+            title = "📢 در حال ارسال پیام همگانی..."
+        text = (
+            f"{title}\n\n"
+            f"📊 پیشرفت: {done} از {broadcast['total_recipients']}\n"
+            f"✅ ارسال شده: {broadcast['sent_count']}\n"
+            f"🚫 مسدود کرده: {broadcast['blocked_count']}\n"
+            f"🗑 حذف شده: {broadcast['deleted_count']}\n"
+            f"❌ خطا: {broadcast['failed_count']}\n"
+            f"⚡️ سرعت: {rate:.1f} پیام در ثانیه"
+        )
+        reply_markup = None
+        if not finished:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("⏹ توقف ارسال", callback_data=f"broadcast_stop_{broadcast['id']}")
+            ]])
+        try:
+            if message is None:
+                return await bot.send_message(
+                    chat_id=broadcast['created_by'], text=text, reply_markup=reply_markup
+                )
+            await bot.edit_message_text(
+                chat_id=message.chat_id, message_id=message.message_id,
+                text=text, reply_markup=reply_markup
+            )
+        except Exception as e:
+            logger.error(f"Error sending broadcast progress: {e}")
+        return message
+
+
+# Shared by the broadcast scene and the startup code
+broadcaster = Broadcaster(
+    chunk_size=int(os.getenv('BROADCAST_CHUNK_SIZE', '200')),
+    concurrency=int(os.getenv('BROADCAST_CONCURRENCY', '30')),
+    lease_seconds=int(os.getenv('BROADCAST_LEASE_SECONDS', '120'))
+)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def update_key(update):
+    """Identity of an incoming event
+
+    Messages are identified by chat and message id and callback queries by
+    their id, so a redelivered update is recognized even if Telegram gives it
+    a new update_id. Everything else uses the update_id.
+    """
+    if update.message is not None:
+        return ('message', update.message.chat_id, update.message.message_id)
+    if update.callback_query is not None:
+        return ('callback', update.callback_query.id)
+    return ('update', update.update_id)
+
+
+class UpdateDeduplicator:
+    """Bounded set of recently seen keys (LRU with TTL)
+
+    Args:
+        max_size (int): Keys remembered at most; the oldest are dropped first
+        ttl (float): Seconds a key is remembered
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> expiry time, oldest first
+        self._seen = OrderedDict()
+        self._stats = {'checked': 0, 'duplicates': 0}
+
+    def _expire(self, now):
+        while self._seen:
+            key, expires = next(iter(self._seen.items()))
+            if expires > now and len(self._seen) <= self.max_size:
+                break
+            del self._seen[key]
+
+    def add(self, key):
+        """Remember a key
+
+        Returns:
+            bool: True if the key is new, False if it was seen within the TTL
+        """
+        now = time.monotonic()
+        self._stats['checked'] += 1
+        expires = self._seen.get(key)
+        if expires is not None and expires > now:
+            self._stats['duplicates'] += 1
+            return False
+        self._seen[key] = now + self.ttl
+        self._seen.move_to_end(key)
+        self._expire(now)
+        return True
+
+    def claim(self, update, action):
+        """Claim an action (e.g. rendering a menu) for an update once
+
+        Several handler groups may process the same update; only the first
+        claim of an action per update succeeds.
+
+        Returns:
+            bool: True if the caller should perform the action
+        """
+        if not isinstance(update, Update):
+            return True
+        return self.add((update_key(update), action))
+
+    def stats(self):
+        """Get counters and the number of remembered keys"""
+        return dict(self._stats, size=len(self._seen))
+
+
+# Shared by the dispatch filter, BaseMenu and the navigation helpers
+update_dedup = UpdateDeduplicator(
+    max_size=int(os.getenv('DEDUP_MAX_SIZE', '10000')),
+    ttl=float(os.getenv('DEDUP_TTL', '300'))
+)
+
+
+async def drop_duplicate_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop processing of an update that was already received
+
+    Registered as a TypeHandler in a group before all other handlers.
+    """
+    if not update_dedup.add(update_key(update)):
+        logger.info(f"Dropping duplicate update {update.update_id}")
+        raise ApplicationHandlerStop
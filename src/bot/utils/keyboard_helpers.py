@@ -4,6 +4,8 @@
 import logging
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from src.utils.pagination import Page, paginate_list
+
 # تنظیم لاگینگ
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -11,83 +13,213 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def create_checkbox_keyboard(items, is_selected_callback, item_callback_prefix, confirm_text="✅ تایید", confirm_callback="confirm"):
+# علامت چک‌باکس انتخاب شده و انتخاب نشده
+CHECKED = "☑️"
+UNCHECKED = "⬜️"
+
+def create_pagination_row(page, callback_prefix):
+    """
+    ساخت ردیف دکمه‌های صفحه قبل و بعد
+    
+    صفحه‌های keyset با شناسه اولین/آخرین ردیف ({prefix}_p_{id} و {prefix}_n_{id})
+    و صفحه‌های شماره‌دار با شماره صفحه ({prefix}_pg_{number}) آدرس‌دهی می‌شوند.
+    
+    Args:
+        page: صفحه (Page)
+        callback_prefix: پیشوند callback_data دکمه‌ها
+    
+    Returns:
+        list: ردیف دکمه‌ها (خالی اگر فقط یک صفحه وجود دارد)
+    """
+    row = []
+    if page.number is None:
+        if page.has_prev:
+            row.append(InlineKeyboardButton("◀️ قبلی", callback_data=f"{callback_prefix}_p_{page.first_id}"))
+        if page.has_next:
+            row.append(InlineKeyboardButton("بعدی ▶️", callback_data=f"{callback_prefix}_n_{page.last_id}"))
+    else:
+        if page.has_prev:
+            row.append(InlineKeyboardButton("◀️ قبلی", callback_data=f"{callback_prefix}_pg_{page.number - 1}"))
+        if page.has_next:
+            row.append(InlineKeyboardButton("بعدی ▶️", callback_data=f"{callback_prefix}_pg_{page.number + 1}"))
+    return row
+
+def parse_page_callback(callback_data, callback_prefix):
+    """
+    خواندن مکان‌نمای صفحه از callback_data دکمه‌های create_pagination_row
+    
+    Args:
+        callback_data: داده دکمه فشرده شده
+        callback_prefix: پیشوند استفاده شده برای دکمه‌ها
+    
+    Returns:
+        dict: {'after_id': ...}، {'before_id': ...} یا {'number': ...}؛ None اگر دکمه صفحه نیست
+    """
+    if not callback_data.startswith(f"{callback_prefix}_"):
+        return None
+    kind, _, value = callback_data[len(callback_prefix) + 1:].partition('_')
+    if not value.isdigit():
+        return None
+    key = {'n': 'after_id', 'p': 'before_id', 'pg': 'number'}.get(kind)
+    return {key: int(value)} if key else None
+
+def create_checkbox_keyboard(items, is_selected_callback, item_callback_prefix, confirm_text="✅ تایید", confirm_callback="confirm", page_callback_prefix="page"):
     """
     ساخت کیبورد با چک‌باکس‌ها و دکمه تایید
     
     Args:
-        items: لیست آیتم‌های قابل انتخاب (باید id و name داشته باشند)
+        items: لیست آیتم‌های قابل انتخاب (باید id و name داشته باشند) یا یک صفحه (Page) از آن‌ها
         is_selected_callback: تابعی که مشخص می‌کند آیا آیتم انتخاب شده است
         item_callback_prefix: پیشوند callback_data برای هر آیتم
         confirm_text: متن دکمه تایید
         confirm_callback: callback_data برای دکمه تایید
+        page_callback_prefix: پیشوند callback_data دکمه‌های صفحه (وقتی items یک Page است)
     
     Returns:
         InlineKeyboardMarkup: کیبورد ساخته شده
     """
     keyboard = []
     
+    page = items if isinstance(items, Page) else None
+    if page is not None:
+        items = page.items
+    
     for item in items:
         item_id = item.get('id', 0)
         item_name = item.get('name', 'بدون نام')
         
         # تعیین علامت چک‌باکس بر اساس انتخاب یا عدم انتخاب
-        checkbox = "☑️" if is_selected_callback(item_id) else "⬜️"
+        checkbox = CHECKED if is_selected_callback(item_id) else UNCHECKED
         
         # اضافه کردن دکمه به کیبورد
         keyboard.append([
             InlineKeyboardButton(f"{checkbox} {item_name}", callback_data=f"{item_callback_prefix}{item_id}")
         ])
     
+    # اضافه کردن دکمه‌های صفحه (انتخاب‌ها در user_data و بین صفحه‌ها حفظ می‌شوند)
+    if page is not None:
+        navigation = create_pagination_row(page, page_callback_prefix)
+        if navigation:
+            keyboard.append(navigation)
+    
     # اضافه کردن دکمه تایید
     keyboard.append([InlineKeyboardButton(confirm_text, callback_data=confirm_callback)])
     
     return InlineKeyboardMarkup(keyboard)
 
-def create_grouped_inbound_keyboard(panel_inbounds_dict, panel_dict, selected_inbounds, confirm_text="✅ تایید اینباند ها", confirm_callback="confirm_inbounds"):
+def create_grouped_inbound_keyboard(panel_inbounds_dict, panel_dict, selected_inbounds, confirm_text="✅ تایید اینباند ها", confirm_callback="confirm_inbounds", page_number=0, page_callback_prefix="inbounds", refresh_callback=None):
     """
     ساخت کیبورد اینباندها گروه‌بندی شده بر اساس پنل
     
+    فقط اینباندهای یک صفحه نمایش داده می‌شوند و هدر پنل در ابتدای هر صفحه تکرار می‌شود.
+    
     Args:
         panel_inbounds_dict: دیکشنری اینباندها با کلید panel_id
         panel_dict: دیکشنری پنل‌ها برای دریافت نام پنل
-        selected_inbounds: لیست اینباندهای انتخاب شده
+        selected_inbounds: مجموعه کلیدهای اینباندهای انتخاب شده ({panel_id}_{inbound_id})
         confirm_text: متن دکمه تایید
         confirm_callback: callback_data برای دکمه تایید
+        page_number: شماره صفحه
+        page_callback_prefix: پیشوند callback_data دکمه‌های صفحه
+        refresh_callback: callback_data دکمه به‌روزرسانی اینباندها (اختیاری)
     
     Returns:
         InlineKeyboardMarkup: کیبورد ساخته شده
     """
     keyboard = []
     
-    for panel_id, inbounds in panel_inbounds_dict.items():
-        # پیدا کردن نام پنل
-        panel_name = "پنل"
-        for panel in panel_dict:
-            if panel.get('id') == panel_id:
-                panel_name = panel.get('name', 'پنل')
-                break
+    panel_names = {panel.get('id'): panel.get('name', 'پنل') for panel in panel_dict}
+    rows = [
+        (panel_id, inbound)
+        for panel_id, inbounds in panel_inbounds_dict.items()
+        for inbound in inbounds
+    ]
+    page = paginate_list(rows, page_number)
+    
+    current_panel_id = None
+    for panel_id, inbound in page.items:
+        if panel_id != current_panel_id:
+            # اضافه کردن هدر پنل
+            current_panel_id = panel_id
+            panel_name = panel_names.get(panel_id, "پنل")
+            keyboard.append([InlineKeyboardButton(f"📌 {panel_name}", callback_data=f"panel_header_{panel_id}")])
+        
+        # اضافه کردن اینباند
+        port = inbound.get('port', 'نامشخص')
+        protocol = inbound.get('protocol', 'نامشخص')
+        remark = inbound.get('remark', 'بدون توضیحات')
         
-        # اضافه کردن هدر پنل
-        keyboard.append([InlineKeyboardButton(f"📌 {panel_name}", callback_data=f"panel_header_{panel_id}")])
+        inbound_key = f"{panel_id}_{inbound.get('id', '0')}"
+        checkbox = CHECKED if inbound_key in selected_inbounds else UNCHECKED
         
-        # اضافه کردن اینباندها
-        for inbound in inbounds:
-            port = inbound.get('port', 'نامشخص')
-            protocol = inbound.get('protocol', 'نامشخص')
-            remark = inbound.get('remark', 'بدون توضیحات')
-            
-            inbound_key = f"{panel_id}_{inbound.get('id', '0')}"
-            checkbox = "☑️" if inbound_key in selected_inbounds else "⬜️"
-            
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{checkbox} پورت: {port} | {protocol} | {remark}", 
-                    callback_data=f"inbound_{inbound_key}"
-                )
-            ])
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{checkbox} پورت: {port} | {protocol} | {remark}", 
+                callback_data=f"inbound_{inbound_key}"
+            )
+        ])
+    
+    # اضافه کردن دکمه‌های صفحه
+    navigation = create_pagination_row(page, page_callback_prefix)
+    if navigation:
+        keyboard.append(navigation)
+    
+    # اضافه کردن دکمه به‌روزرسانی از پنل‌ها
+    if refresh_callback:
+        keyboard.append([InlineKeyboardButton("🔄 به‌روزرسانی از پنل‌ها", callback_data=refresh_callback)])
     
     # اضافه کردن دکمه تایید
     keyboard.append([InlineKeyboardButton(confirm_text, callback_data=confirm_callback)])
     
-    return InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+    return InlineKeyboardMarkup(keyboard)
+
+def set_checkbox_state(reply_markup, callback_data, selected):
+    """
+    تغییر علامت چک‌باکس فقط در دکمه‌ای که زده شده است
+    
+    بقیه ردیف‌ها و دکمه‌ها بدون ساخت دوباره استفاده می‌شوند، بنابراین برای
+    هر انتخاب نیازی به خواندن دوباره داده‌ها و ساخت کل کیبورد نیست.
+    
+    Args:
+        reply_markup: کیبورد فعلی پیام (یا None)
+        callback_data: callback_data دکمه زده شده
+        selected: وضعیت جدید انتخاب
+    
+    Returns:
+        InlineKeyboardMarkup: کیبورد جدید، یا None اگر دکمه در کیبورد نبود
+    """
+    rows = reply_markup.inline_keyboard if reply_markup is not None else ()
+    for row_index, row in enumerate(rows):
+        for button_index, button in enumerate(row):
+            if button.callback_data != callback_data:
+                continue
+            label = button.text
+            if label.startswith((CHECKED, UNCHECKED)):
+                label = label.split(' ', 1)[1] if ' ' in label else ""
+            checkbox = CHECKED if selected else UNCHECKED
+            new_row = (
+                row[:button_index]
+                + (InlineKeyboardButton(f"{checkbox} {label}", callback_data=callback_data),)
+                + row[button_index + 1:]
+            )
+            return InlineKeyboardMarkup(rows[:row_index] + (new_row,) + rows[row_index + 1:])
+    return None
+
+async def edit_reply_markup_if_changed(query, reply_markup):
+    """
+    ویرایش کیبورد پیام فقط وقتی با کیبورد فعلی فرق دارد
+    
+    تلگرام ویرایش بدون تغییر را با خطای "message is not modified" رد می‌کند؛
+    با این مقایسه درخواست اضافه‌ای ارسال نمی‌شود.
+    
+    Args:
+        query: CallbackQuery
+        reply_markup: کیبورد جدید
+    
+    Returns:
+        bool: True اگر پیام ویرایش شد
+    """
+    if query.message is not None and query.message.reply_markup == reply_markup:
+        return False
+    await query.edit_message_reply_markup(reply_markup=reply_markup)
+    return True
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import logging
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class LoopBlockMonitor:
+    """Watchdog that logs code blocking the asyncio event loop
+
+    A callback on the loop updates a heartbeat every ``interval`` seconds. A
+    separate thread checks the heartbeat; when it is older than ``threshold``
+    the loop is stuck in synchronous code, and the stack of the loop thread is
+    logged so the blocking handler can be identified.
+
+    Args:
+        threshold (float): Seconds without a heartbeat before a block is reported
+        interval (float): Seconds between heartbeats
+    """
+
+    def __init__(self, threshold=0.5, interval=0.1):
+        self.threshold = float(threshold)
+        self.interval = float(interval)
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self._handle = None
+        self.blocks = 0
+
+    def _beat(self):
+        """Heartbeat callback running on the event loop"""
+        self._last_beat = time.monotonic()
+        if not self._stop.is_set():
+            self._handle = self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        """Watchdog thread body"""
+        reported = False
+        while not self._stop.wait(self.interval):
+            lag = time.monotonic() - self._last_beat
+            if lag < self.threshold:
+                if reported:
+                    logger.warning(f"Event loop unblocked after {lag:.2f}s")
+                reported = False
+                continue
+            if reported:
+                continue
+
+            # Report each block once, with the stack that is holding the loop
+            reported = True
+            self.blocks += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else 'unavailable'
+            logger.warning(
+                f"Event loop blocked for more than {self.threshold:.2f}s, loop thread stack:\n{stack}"
+            )
+
+    def start(self, loop=None):
+        """Start monitoring; must be called from the thread running the loop"""
+        if self._thread is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._handle = self._loop.call_soon(self._beat)
+        self._thread = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop block monitor started (threshold={self.threshold}s)")
+
+    def stop(self):
+        """Stop monitoring"""
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+
+def start_loop_monitor(loop=None):
+    """Start a LoopBlockMonitor when LOOP_BLOCK_THRESHOLD is set
+
+    LOOP_BLOCK_THRESHOLD is the number of seconds the loop may be blocked
+    before a warning is logged; 0 or unset disables monitoring.
+
+    Returns:
+        LoopBlockMonitor: The running monitor or None if disabled
+    """
+    threshold = float(os.getenv('LOOP_BLOCK_THRESHOLD', '0'))
+    if threshold <= 0:
+        return None
+    monitor = LoopBlockMonitor(threshold=threshold, interval=min(0.1, threshold / 2))
+    monitor.start(loop)
+    return monitor
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import asyncio
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
+from src.bot.utils.dedup import update_dedup
+
 # تنظیم لاگینگ
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -37,24 +38,11 @@ async def handle_back_to_menu(
     """
     logger.info(f"Handling back to {menu_name} menu")
     
-    # بررسی تکراری بودن پردازش
-    flag_key = f'back_to_{target_state}_handled'
-    if context.user_data.get(flag_key):
+    # بررسی تکراری بودن پردازش (همین آپدیت توسط هندلر دیگری پردازش شده)
+    if not update_dedup.claim(update, f"back_to:{target_state}"):
         logger.debug(f"Back to {menu_name} command already handled, skipping duplicate")
         return ConversationHandler.END if context.user_data.get('in_conversation', False) else None
     
-    # علامت‌گذاری پردازش
-    context.user_data[flag_key] = True
-    
-    # پاک کردن علامت پس از مدتی
-    async def reset_handler_flag():
-        await asyncio.sleep(1)
-        if flag_key in context.user_data:
-            del context.user_data[flag_key]
-    
-    # شروع تایمر پاک کردن علامت
-    asyncio.create_task(reset_handler_flag())
-    
     # پاک کردن وضعیت مکالمه
     was_in_conversation = context.user_data.get('in_conversation', False)
     context.user_data['in_conversation'] = False
@@ -85,18 +73,15 @@ async def show_menu_with_chat_id(menu_obj, chat_id, context: ContextTypes.DEFAUL
     نمایش منو با استفاده از chat_id
     
     Args:
-        menu_obj: شیء منو که متد setup_menu و create_keyboard_markup دارد
+        menu_obj: شیء منو (BaseMenu)
         chat_id: شناسه چت برای ارسال منو
         context: شیء Context تلگرام
         user_id: شناسه کاربر برای تنظیم وضعیت (اختیاری)
         user_states_dict: دیکشنری وضعیت‌های کاربر (اختیاری)
         target_state: وضعیت هدف برای تنظیم (اختیاری)
     """
-    # تنظیم منو
-    menu_obj.setup_menu()
-    
-    # ایجاد کیبورد
-    keyboard_markup = menu_obj.create_keyboard_markup()
+    # دریافت پیام و کیبورد منو از کش
+    message, keyboard_markup = menu_obj.render()
     
     # تنظیم وضعیت کاربر اگر اطلاعات داده شده باشد
     if user_id is not None and user_states_dict is not None and target_state is not None:
@@ -105,6 +90,6 @@ async def show_menu_with_chat_id(menu_obj, chat_id, context: ContextTypes.DEFAUL
     # ارسال پیام منو
     await context.bot.send_message(
         chat_id=chat_id,
-        text=menu_obj.message,
+        text=message,
         reply_markup=keyboard_markup
     ) 
\ No newline at end of file
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import pickle
+import sqlite3
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from src.services.async_service import run_blocking
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Kinds of stored state
+USER_DATA = 'user_data'
+CONVERSATION = 'conversation'
+
+# Key in user_data holding the menu state exposed through user_states
+MENU_STATE_KEY = 'menu_state'
+
+
+class MemoryStateBackend:
+    """State kept in process memory (lost on restart)"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def load(self, kind, key):
+        with self._lock:
+            return self._data.get((kind, key))
+
+    def load_all(self, kind):
+        with self._lock:
+            return {k: v for (stored_kind, k), v in self._data.items() if stored_kind == kind}
+
+    def save_many(self, kind, items):
+        """Store serialized values; None deletes the key"""
+        with self._lock:
+            for key, value in items.items():
+                if value is None:
+                    self._data.pop((kind, key), None)
+                else:
+                    self._data[(kind, key)] = value
+
+
+class SQLiteStateBackend:
+    """State kept in a local SQLite file (single host, survives restarts)
+
+    Args:
+        path (str): Database file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bot_state ("
+            "kind TEXT NOT NULL, state_key TEXT NOT NULL, data BLOB NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (kind, state_key))"
+        )
+        self._conn.commit()
+
+    def load(self, kind, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM bot_state WHERE kind = ? AND state_key = ?", (kind, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_all(self, kind):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state_key, data FROM bot_state WHERE kind = ?", (kind,)
+            ).fetchall()
+        return dict(rows)
+
+    def save_many(self, kind, items):
+        """Store serialized values in one transaction; None deletes the key"""
+        now = time.time()
+        upserts = [(kind, k, v, now) for k, v in items.items() if v is not None]
+        deletes = [(kind, k) for k, v in items.items() if v is None]
+        with self._lock, self._conn:
+            if upserts:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO bot_state (kind, state_key, data, updated_at) "
+                    "VALUES (?, ?, ?, ?)", upserts
+                )
+            if deletes:
+                self._conn.executemany(
+                    "DELETE FROM bot_state WHERE kind = ? AND state_key = ?", deletes
+                )
+
+
+class MySQLStateBackend:
+    """State kept in the bot_state table (shared by several bot workers)"""
+
+    def load(self, kind, key):
+        from src.utils.db import db_cursor
+        with db_cursor() as cursor:
+            cursor.execute(
+                "SELECT data FROM bot_state WHERE kind = %s AND state_key = %s", (kind, key)
+            )
+            row = cursor.fetchone()
+        return bytes(row[0]) if row else None
+
+    def load_all(self, kind):
+        from src.utils.db import db_cursor
+        with db_cursor() as cursor:
+            cursor.execute("SELECT state_key, data FROM bot_state WHERE kind = %s", (kind,))
+            return {key: bytes(data) for key, data in cursor.fetchall()}
+
+    def save_many(self, kind, items):
+        """Store serialized values in one transaction; None deletes the key"""
+        from src.utils.db import db_transaction
+        upserts = [(kind, k, v) for k, v in items.items() if v is not None]
+        deletes = [(kind, k) for k, v in items.items() if v is None]
+        with db_transaction() as cursor:
+            if upserts:
+                cursor.executemany(
+                    "INSERT INTO bot_state (kind, state_key, data) VALUES (%s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE data = VALUES(data)", upserts
+                )
+            if deletes:
+                cursor.executemany(
+                    "DELETE FROM bot_state WHERE kind = %s AND state_key = %s", deletes
+                )
+
+
+class UserStateStore(MutableMapping):
+    """Menu state per user ("main", "admin", "shop"), stored in user_data
+
+    Keeps the ``user_states[user_id]`` interface of the old module-level dict
+    while the values live in the persisted user_data, so they survive restarts
+    and are shared between workers. Bound to the application in main().
+    """
+
+    def __init__(self):
+        self._user_data = None
+
+    def bind(self, user_data):
+        """Attach the application's user_data mapping"""
+        self._user_data = user_data
+
+    def __getitem__(self, user_id):
+        data = self._user_data.get(user_id) if self._user_data is not None else None
+        if not data or MENU_STATE_KEY not in data:
+            raise KeyError(user_id)
+        return data[MENU_STATE_KEY]
+
+    def __setitem__(self, user_id, state):
+        if self._user_data is None:
+            raise RuntimeError("user_states is not bound to an application")
+        # application.user_data creates missing entries on access
+        self._user_data[user_id][MENU_STATE_KEY] = state
+
+    def __delitem__(self, user_id):
+        data = self._user_data.get(user_id) if self._user_data is not None else None
+        if not data or MENU_STATE_KEY not in data:
+            raise KeyError(user_id)
+        del data[MENU_STATE_KEY]
+
+    def __iter__(self):
+        if self._user_data is None:
+            return iter(())
+        return (uid for uid, data in list(self._user_data.items()) if MENU_STATE_KEY in data)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class StatePersistence(BasePersistence):
+    """PTB persistence for user_data and conversation states
+
+    user_data is loaded lazily when a user's update arrives (refresh_user_data)
+    and evicted again after the user has been idle, so memory only holds
+    recently active users. Changes handed over by the application every
+    ``update_interval`` seconds are batched and written behind in one backend
+    call from the service executor.
+
+    Args:
+        backend: MemoryStateBackend, SQLiteStateBackend or MySQLStateBackend
+        update_interval (float): Seconds between the application's persistence runs
+        max_users (int): Loaded users kept before the least recently used are evicted
+        evict_idle (float): Seconds after which an idle user is evicted (0 disables)
+        refresh_after (float): Reload a loaded user's data older than this many
+            seconds, to pick up changes from other workers (0 disables)
+    """
+
+    def __init__(self, backend, update_interval=10, max_users=1000, evict_idle=300, refresh_after=0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.backend = backend
+        self.max_users = max_users
+        self.evict_idle = evict_idle
+        self.refresh_after = refresh_after
+        # Never evict users touched within this window, their changes may not be staged yet
+        self._min_idle = max(30.0, 2 * update_interval)
+        # user_id -> [user_data dict, last access, loaded at], least recently used first
+        self._loaded = OrderedDict()
+        # (kind, key) -> serialized value or None (delete), waiting for the next write
+        self._pending = {}
+        # Batch currently being written, still readable until the write finishes
+        self._writing = {}
+        self._flush_task = None
+        self._stats = {'loads': 0, 'writes': 0, 'written_keys': 0, 'evictions': 0}
+
+    # --- serialization ---
+
+    @staticmethod
+    def _user_key(user_id):
+        return str(user_id)
+
+    @staticmethod
+    def _conversation_kind(name):
+        return f"{CONVERSATION}:{name}"
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    async def _load(self, kind, key):
+        """Load one value, preferring writes that are not stored yet"""
+        for batch in (self._pending, self._writing):
+            if (kind, key) in batch:
+                value = batch[(kind, key)]
+                return None if value is None else pickle.loads(value)
+        self._stats['loads'] += 1
+        value = await run_blocking(self.backend.load, kind, key)
+        return None if value is None else pickle.loads(value)
+
+    # --- write-behind ---
+
+    def _stage(self, kind, key, value):
+        self._pending[(kind, key)] = None if value is None else self._dumps(value)
+        if self._flush_task is None or self._flush_task.done():
+            # Runs after the other update coroutines gathered by the application
+            self._flush_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        while self._pending:
+            self._writing, self._pending = self._pending, {}
+            by_kind = {}
+            for (kind, key), value in self._writing.items():
+                by_kind.setdefault(kind, {})[key] = value
+            try:
+                for kind, items in by_kind.items():
+                    await run_blocking(self.backend.save_many, kind, items)
+                    self._stats['writes'] += 1
+                    self._stats['written_keys'] += len(items)
+            except Exception as e:
+                logger.error(f"Error writing bot state: {e}")
+                # Keep the batch for the next attempt unless newer values were staged
+                for item_key, value in self._writing.items():
+                    self._pending.setdefault(item_key, value)
+                self._writing = {}
+                return
+            self._writing = {}
+        self._evict()
+
+    def _evict(self):
+        """Clear the user_data of idle users in place; it is reloaded on their next update"""
+        now = time.monotonic()
+        while self._loaded:
+            user_id, (data, last_access, _) = next(iter(self._loaded.items()))
+            idle = now - last_access
+            over_limit = len(self._loaded) > self.max_users
+            expired = self.evict_idle > 0 and idle > self.evict_idle
+            if idle < self._min_idle or not (over_limit or expired):
+                break
+            if (USER_DATA, self._user_key(user_id)) in self._pending:
+                break
+            del self._loaded[user_id]
+            data.clear()
+            self._stats['evictions'] += 1
+
+    # --- BasePersistence ---
+
+    async def get_user_data(self):
+        # Loaded per user in refresh_user_data
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        stored = await run_blocking(self.backend.load_all, self._conversation_kind(name))
+        return {tuple(json.loads(key)): pickle.loads(value) for key, value in stored.items()}
+
+    async def update_conversation(self, name, key, new_state):
+        self._stage(self._conversation_kind(name), json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._stage(USER_DATA, self._user_key(user_id), data or None)
+
+    async def drop_user_data(self, user_id):
+        self._loaded.pop(user_id, None)
+        self._stage(USER_DATA, self._user_key(user_id), None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        now = time.monotonic()
+        entry = self._loaded.get(user_id)
+        if entry is not None and entry[0] is user_data:
+            entry[1] = now
+            self._loaded.move_to_end(user_id)
+            key = (USER_DATA, self._user_key(user_id))
+            stale = self.refresh_after > 0 and now - entry[2] > self.refresh_after
+            if not stale or key in self._pending or key in self._writing:
+                return
+
+        stored = await self._load(USER_DATA, self._user_key(user_id))
+        user_data.clear()
+        if stored:
+            user_data.update(stored)
+        self._loaded[user_id] = [user_data, now, now]
+        self._loaded.move_to_end(user_id)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        if self._pending:
+            await self._write_pending()
+        if self._pending:
+            logger.error(f"{len(self._pending)} bot state entries could not be written")
+
+    def stats(self):
+        """Get loading, writing and eviction counters"""
+        return dict(self._stats, loaded_users=len(self._loaded), pending=len(self._pending))
+
+
+def build_persistence():
+    """Create the persistence configured by PERSISTENCE_BACKEND
+
+    PERSISTENCE_BACKEND is "memory" (default), "sqlite" (PERSISTENCE_SQLITE_PATH)
+    or "mysql" (bot_state table, required for several workers).
+
+    Returns:
+        StatePersistence: Persistence for the application builder
+    """
+    backend_name = os.getenv('PERSISTENCE_BACKEND', 'memory').lower()
+    if backend_name == 'mysql':
+        backend = MySQLStateBackend()
+    elif backend_name == 'sqlite':
+        backend = SQLiteStateBackend(os.getenv('PERSISTENCE_SQLITE_PATH', 'bot_state.sqlite3'))
+    else:
+        if backend_name != 'memory':
+            logger.warning(f"Unknown PERSISTENCE_BACKEND '{backend_name}', using memory")
+        backend = MemoryStateBackend()
+
+    logger.info(f"Bot state persistence: {type(backend).__name__}")
+    return StatePersistence(
+        backend,
+        update_interval=float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '10')),
+        max_users=int(os.getenv('PERSISTENCE_MAX_USERS', '1000')),
+        evict_idle=float(os.getenv('PERSISTENCE_EVICT_IDLE', '300')),
+        refresh_after=float(os.getenv('PERSISTENCE_REFRESH_AFTER', '0'))
+    )
+
+
+# Menu state of each user, shared by the bot handlers and scenes
+user_states = UserStateStore()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Priority lanes; lower values are sent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Edits of the same message that may replace each other while waiting
+COALESCED_ENDPOINTS = frozenset({'editMessageText', 'editMessageReplyMarkup'})
+
+
+class TokenBucket:
+    """Token bucket refilled continuously
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Maximum tokens (burst size)
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Hand out no tokens for the given time (after a 429)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self):
+        return self.delay() == 0 and self.tokens >= self.capacity
+
+
+class _PriorityGate:
+    """Global token bucket that serves waiting requests by priority, then arrival"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._waiters = []
+        self._counter = itertools.count()
+        self._drain_task = None
+
+    async def acquire(self, priority):
+        if not self._waiters and self.bucket.delay() == 0:
+            self.bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+        await future
+
+    async def _drain(self):
+        while self._waiters:
+            wait = self.bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.bucket.take()
+                future.set_result(None)
+
+    def __len__(self):
+        return len(self._waiters)
+
+
+class _ChatSlot:
+    __slots__ = ('lock', 'bucket', 'users')
+
+    def __init__(self, bucket):
+        self.lock = asyncio.Lock()
+        self.bucket = bucket
+        self.users = 0
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Rate limiter for every Bot API call made by the application
+
+    * A global token bucket (Telegram allows about 30 messages per second)
+      serves waiting requests by priority, so interactive replies overtake
+      broadcasts. Pass ``rate_limit_args={'priority': PRIORITY_BULK}`` for
+      bulk sends.
+    * Each chat has its own bucket (about 1 message per second in private
+      chats, 20 per minute in groups); requests of one chat keep their order.
+    * A RetryAfter (429) pauses the chat, or everything for calls without a
+      chat, and the request is repeated up to ``max_retries`` times.
+    * While an edit of a message waits, a newer edit of the same message
+      replaces it; both callers get the result of the newer edit.
+
+    Args:
+        global_rate (float): Requests per second for all chats together
+        chat_rate (float): Requests per second per private chat
+        chat_burst (int): Requests a chat may send at once
+        group_rate (float): Requests per second per group chat
+        max_retries (int): Retries after RetryAfter errors
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, group_rate=20 / 60, max_retries=3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        # Created here rather than in initialize(): the bot may send before the application is initialized
+        self._gate = _PriorityGate(TokenBucket(global_rate, global_rate))
+        self._chats = {}
+        # (endpoint, chat_id, message_id) -> [sequence of the newest edit, future of its result]
+        self._edits = {}
+        self._edit_counter = itertools.count()
+        self._stats = {'requests': 0, 'retries': 0, 'coalesced': 0, 'delayed': 0}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._chats.clear()
+        self._edits.clear()
+
+    @staticmethod
+    def _priority(rate_limit_args):
+        if isinstance(rate_limit_args, dict):
+            return rate_limit_args.get('priority', PRIORITY_INTERACTIVE)
+        if isinstance(rate_limit_args, int):
+            return rate_limit_args
+        return PRIORITY_INTERACTIVE
+
+    def _chat_bucket(self, chat_id):
+        # Group and channel ids are negative (or @username for channels)
+        is_group = isinstance(chat_id, str) or int(chat_id) < 0
+        rate = self.group_rate if is_group else self.chat_rate
+        return TokenBucket(rate, self.chat_burst)
+
+    def _prune_chats(self):
+        """Forget chats without requests whose bucket is full again"""
+        for chat_id in [c for c, slot in self._chats.items() if slot.users == 0 and slot.bucket.is_idle()]:
+            del self._chats[chat_id]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        self._stats['requests'] += 1
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await self._send(callback, args, kwargs, None, self._priority(rate_limit_args))
+
+        slot = self._chats.get(chat_id)
+        if slot is None:
+            if len(self._chats) >= 1000:
+                self._prune_chats()
+            slot = self._chats[chat_id] = _ChatSlot(self._chat_bucket(chat_id))
+        slot.users += 1
+
+        edit = None
+        if endpoint in COALESCED_ENDPOINTS and data.get('message_id') is not None:
+            key = (endpoint, chat_id, data['message_id'])
+            edit = self._edits.get(key)
+            if edit is None or edit[1].done():
+                edit = self._edits[key] = [None, asyncio.get_running_loop().create_future()]
+            sequence = next(self._edit_counter)
+            edit[0] = sequence
+
+        try:
+            async with slot.lock:
+                wait = slot.bucket.delay()
+                if wait > 0:
+                    self._stats['delayed'] += 1
+                    await asyncio.sleep(wait)
+
+                superseded = edit is not None and edit[0] != sequence
+                if superseded:
+                    # A newer edit of this message is waiting; it carries our change too
+                    self._stats['coalesced'] += 1
+                else:
+                    slot.bucket.take()
+                    if edit is not None and self._edits.get(key) is edit:
+                        # From here on a newer edit has to be sent separately
+                        del self._edits[key]
+                    try:
+                        result = await self._send(
+                            callback, args, kwargs, slot.bucket, self._priority(rate_limit_args)
+                        )
+                    except Exception as e:
+                        if edit is not None:
+                            edit[1].set_exception(e)
+                            # Marked as retrieved; superseded callers re-raise it
+                            edit[1].exception()
+                        raise
+                    if edit is not None:
+                        edit[1].set_result(result)
+                    return result
+
+            if superseded:
+                return await asyncio.shield(edit[1])
+        finally:
+            slot.users -= 1
+            if slot.users == 0 and slot.bucket.is_idle():
+                self._chats.pop(chat_id, None)
+
+    async def _send(self, callback, args, kwargs, chat_bucket, priority):
+        """Pass the global gate and call the API, repeating after RetryAfter"""
+        for attempt in itertools.count():
+            await self._gate.acquire(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = float(e.retry_after)
+                self._stats['retries'] += 1
+                logger.warning(f"Rate limited by Telegram, retrying in {retry_after}s")
+                (chat_bucket or self._gate.bucket).block(retry_after)
+                if chat_bucket is not None:
+                    await asyncio.sleep(retry_after)
+
+    def stats(self):
+        """Get request counters and the number of waiting requests"""
+        return dict(
+            self._stats,
+            waiting_global=len(self._gate),
+            active_chats=len(self._chats)
+        )
+
+
+def build_rate_limiter():
+    """Create the outbound rate limiter configured by the RATE_LIMIT_* variables
+
+    Returns:
+        OutboundRateLimiter: Limiter or None when RATE_LIMIT_GLOBAL is 0
+    """
+    global_rate = float(os.getenv('RATE_LIMIT_GLOBAL', '30'))
+    if global_rate <= 0:
+        return None
+    return OutboundRateLimiter(
+        global_rate=global_rate,
+        chat_rate=float(os.getenv('RATE_LIMIT_PER_CHAT', '1')),
+        chat_burst=int(os.getenv('RATE_LIMIT_CHAT_BURST', '3')),
+        group_rate=float(os.getenv('RATE_LIMIT_GROUP_PER_MINUTE', '20')) / 60,
+        max_retries=int(os.getenv('RATE_LIMIT_MAX_RETRIES', '3'))
+    )
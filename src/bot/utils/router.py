@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import time
+import logging
+from dataclasses import dataclass, field
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Converters for typed callback parameters, e.g. "panel_{panel_id:int}"
+PARAM_TYPES = {
+    'int': lambda token: int(token) if token.isdigit() else None,
+    'str': lambda token: token or None,
+}
+
+
+@dataclass(frozen=True)
+class CallbackAction:
+    """Callback data parsed once into a route name and typed parameters"""
+    route: str
+    params: dict = field(default_factory=dict)
+
+    def __getitem__(self, name):
+        return self.params[name]
+
+    def get(self, name, default=None):
+        return self.params.get(name, default)
+
+
+class RouteStats:
+    """Per-route call counters and timings"""
+
+    def __init__(self):
+        self._stats = {}
+        self.slow_threshold = float(os.getenv('ROUTE_SLOW_THRESHOLD', '0'))
+
+    def record(self, name, elapsed):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'calls': 0, 'total_time': 0.0, 'max_time': 0.0}
+        stats['calls'] += 1
+        stats['total_time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        if self.slow_threshold > 0 and elapsed > self.slow_threshold:
+            logger.warning(f"Route '{name}' took {elapsed:.3f}s")
+
+    def snapshot(self):
+        """Get a copy of the statistics with average times"""
+        result = {}
+        for name, stats in self._stats.items():
+            result[name] = dict(stats, avg_time=stats['total_time'] / stats['calls'])
+        return result
+
+
+@dataclass
+class _TextRoute:
+    name: str
+    handler: object
+    states: frozenset = None
+    in_conversation: bool = False
+
+
+class TextRouter:
+    """Dispatch reply-keyboard texts with a single dict lookup
+
+    Each text may have several routes that differ by user state; the first
+    route whose filters match is called.
+
+    Example:
+        @router.route("🎁 ساخت کد هدیه", states="shop")
+        async def create_gift_code(update, context): ...
+    """
+
+    def __init__(self, stats=None):
+        self._routes = {}
+        self.stats = stats or RouteStats()
+
+    def add(self, texts, handler, states=None, in_conversation=False, name=None):
+        """Register a handler for one or more texts
+
+        Args:
+            texts (str or list): Message texts to match exactly
+            handler (callable): async handler(update, context)
+            states (str or list): User states the route is limited to (None for any)
+            in_conversation (bool): Also run while a scene conversation is active
+            name (str): Name used in the timing statistics
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        if isinstance(states, str):
+            states = [states]
+        for text in texts:
+            route = _TextRoute(
+                name=name or handler.__name__,
+                handler=handler,
+                states=frozenset(states) if states else None,
+                in_conversation=in_conversation
+            )
+            self._routes.setdefault(text, []).append(route)
+        return handler
+
+    def route(self, *texts, states=None, in_conversation=False, name=None):
+        """Decorator form of add()"""
+        def decorator(handler):
+            return self.add(list(texts), handler, states, in_conversation, name)
+        return decorator
+
+    def resolve(self, text, state, in_conversation=False):
+        """Find the route for a text in the given user state"""
+        for route in self._routes.get(text, ()):
+            if route.states is not None and state not in route.states:
+                continue
+            if in_conversation and not route.in_conversation:
+                continue
+            return route
+        return None
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE, state):
+        """Run the matching route
+
+        Returns:
+            bool: True if a route handled the message
+        """
+        route = self.resolve(
+            update.message.text, state, bool(context.user_data.get('in_conversation'))
+        )
+        if route is None:
+            return False
+
+        started = time.perf_counter()
+        try:
+            await route.handler(update, context)
+        finally:
+            self.stats.record(route.name, time.perf_counter() - started)
+        return True
+
+
+class _TrieNode:
+    __slots__ = ('literals', 'params', 'route')
+
+    def __init__(self):
+        self.literals = {}
+        self.params = []
+        self.route = None
+
+
+@dataclass
+class _CallbackRoute:
+    name: str
+    handler: object
+    param_names: tuple
+
+
+class CallbackRouter:
+    """Dispatch callback data through a trie of "_"-separated tokens
+
+    Patterns mix literal tokens and typed parameters, e.g.
+    ``"toggle_panel_{panel_id:int}"``. Literal tokens win over parameters,
+    so ``"panel_list"`` and ``"panel_{panel_id:int}"`` can coexist. The
+    callback data is split once and the handler receives a CallbackAction.
+    """
+
+    def __init__(self, stats=None, separator='_'):
+        self._root = _TrieNode()
+        self.separator = separator
+        self.stats = stats or RouteStats()
+
+    @staticmethod
+    def _parse_token(token):
+        """Return (param name, converter) for "{name:type}" tokens, else None"""
+        if not (token.startswith('{') and token.endswith('}')):
+            return None
+        name, _, type_name = token[1:-1].partition(':')
+        converter = PARAM_TYPES.get(type_name or 'str')
+        if converter is None:
+            raise ValueError(f"Unknown parameter type in callback pattern: {token}")
+        return name, converter
+
+    def add(self, pattern, handler, name=None):
+        """Register a handler for a callback pattern
+
+        Args:
+            pattern (str): Pattern such as "delete_panel_{panel_id:int}"
+            handler (callable): async handler(update, context, action)
+            name (str): Route name; defaults to the pattern
+        """
+        node = self._root
+        param_names = []
+        # Split on separators outside of {...} so parameter names may contain them
+        tokens = re.split(re.escape(self.separator) + r'(?![^{]*\})', pattern)
+        for token in tokens:
+            param = self._parse_token(token)
+            if param is None:
+                node = node.literals.setdefault(token, _TrieNode())
+                continue
+            param_names.append(param[0])
+            for existing_name, converter, child in node.params:
+                if existing_name == param[0] and converter is param[1]:
+                    node = child
+                    break
+            else:
+                child = _TrieNode()
+                node.params.append((param[0], param[1], child))
+                node = child
+
+        if node.route is not None:
+            raise ValueError(f"Duplicate callback pattern: {pattern}")
+        node.route = _CallbackRoute(name or pattern, handler, tuple(param_names))
+        return handler
+
+    def route(self, pattern, name=None):
+        """Decorator form of add()"""
+        def decorator(handler):
+            return self.add(pattern, handler, name)
+        return decorator
+
+    def _match(self, node, tokens, index, values):
+        if index == len(tokens):
+            return node.route
+        token = tokens[index]
+        child = node.literals.get(token)
+        if child is not None:
+            route = self._match(child, tokens, index + 1, values)
+            if route is not None:
+                return route
+        for _, converter, child in node.params:
+            value = converter(token)
+            if value is None:
+                continue
+            values.append(value)
+            route = self._match(child, tokens, index + 1, values)
+            if route is not None:
+                return route
+            values.pop()
+        return None
+
+    def parse(self, data):
+        """Parse callback data
+
+        Returns:
+            tuple: (route, CallbackAction) or (None, None) if nothing matches
+        """
+        values = []
+        route = self._match(self._root, data.split(self.separator), 0, values)
+        if route is None:
+            return None, None
+        return route, CallbackAction(route.name, dict(zip(route.param_names, values)))
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Run the route matching update.callback_query.data
+
+        Returns:
+            bool: True if a route handled the callback
+        """
+        route, action = self.parse(update.callback_query.data)
+        if route is None:
+            return False
+
+        started = time.perf_counter()
+        try:
+            await route.handler(update, context, action)
+        finally:
+            self.stats.record(route.name, time.perf_counter() - started)
+        return True
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different users concurrently, each user's in order
+
+    Updates of one user wait for the previous one to finish, so the
+    ConversationHandler states and the user_data flags (in_conversation)
+    only ever see one update of that user at a time.
+
+    A waiting update does not occupy a processing slot: the per-user lock is
+    taken before the ``max_concurrent_updates`` limit, so a user sending many
+    updates cannot block everybody else.
+
+    Args:
+        max_concurrent_updates (int): Updates processed at the same time
+        max_pending_updates (int): Updates accepted from the queue, including
+            those waiting for their user's previous update
+    """
+
+    def __init__(self, max_concurrent_updates, max_pending_updates=None):
+        super().__init__(max(max_pending_updates or 0, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._concurrency = max_concurrent_updates
+        # ordering key -> [lock, number of updates holding or waiting for it]
+        self._locks = {}
+
+    @staticmethod
+    def ordering_key(update):
+        """Key whose updates must be processed in order (user, else chat)"""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ('user', update.effective_user.id)
+            if update.effective_chat:
+                return ('chat', update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.ordering_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self):
+        logger.info(
+            f"Concurrent update processing enabled "
+            f"({self._concurrency} at a time, {self.max_concurrent_updates} pending)"
+        )
+
+    async def shutdown(self):
+        self._locks.clear()
+
+    def stats(self):
+        """Get the number of users with updates in progress or waiting"""
+        return {
+            'active_keys': len(self._locks),
+            'waiting': sum(count - 1 for _, count in self._locks.values())
+        }
+
+
+def build_update_processor():
+    """Create the update processor configured by CONCURRENT_UPDATES
+
+    CONCURRENT_UPDATES is the number of updates processed at the same time;
+    1 or less keeps PTB's sequential processing. CONCURRENT_UPDATES_PENDING
+    bounds the updates taken from the queue while waiting.
+
+    Returns:
+        PerUserUpdateProcessor: Processor or None for sequential processing
+    """
+    concurrency = int(os.getenv('CONCURRENT_UPDATES', '8'))
+    if concurrency <= 1:
+        return None
+    pending = int(os.getenv('CONCURRENT_UPDATES_PENDING', str(concurrency * 32)))
+    return PerUserUpdateProcessor(concurrency, pending)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# What to do with an update when the queue is full
+OVERLOAD_REJECT = 'reject'  # answer 503, Telegram delivers the update again later
+OVERLOAD_DROP = 'drop'      # acknowledge and discard the update
+
+
+class QueueFullError(Exception):
+    """Raised by UpdateQueue.put when the queue is full and the policy is reject"""
+    pass
+
+
+class UpdateQueue:
+    """Bounded queue between the webhook receiver and the bot
+
+    The webhook handler only parses and enqueues an update, so Telegram gets
+    its answer at once and never retries because of a slow handler. Workers
+    take updates in arrival order and pass them to the application's update
+    processor, which keeps the updates of one user in order.
+
+    Args:
+        application: PTB Application (initialized and started by the caller)
+        maxsize (int): Updates waiting at most
+        workers (int): Number of worker tasks
+        overload_policy (str): OVERLOAD_REJECT or OVERLOAD_DROP
+    """
+
+    def __init__(self, application, maxsize=1000, workers=8, overload_policy=OVERLOAD_REJECT):
+        if overload_policy not in (OVERLOAD_REJECT, OVERLOAD_DROP):
+            raise ValueError(f"Unknown overload policy: {overload_policy}")
+        self.application = application
+        self.maxsize = maxsize
+        self.workers = workers
+        self.overload_policy = overload_policy
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+        self._accepting = False
+        self._stats = {
+            'received': 0, 'processed': 0, 'failed': 0,
+            'rejected': 0, 'dropped': 0, 'max_lag': 0.0
+        }
+        # Queue lag (enqueue -> processing start) of the most recent updates
+        self._recent_lags = deque(maxlen=200)
+
+    def put(self, update):
+        """Enqueue an update without waiting
+
+        Returns:
+            bool: True if queued, False if dropped by the overload policy
+
+        Raises:
+            QueueFullError: If the queue is full and the policy is reject
+        """
+        self._stats['received'] += 1
+        if not self._accepting:
+            self._stats['rejected'] += 1
+            raise QueueFullError("Update queue is not accepting updates")
+        try:
+            self._queue.put_nowait((time.monotonic(), update))
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        update_id = getattr(update, 'update_id', None)
+        if self.overload_policy == OVERLOAD_DROP:
+            self._stats['dropped'] += 1
+            logger.warning(f"Update queue full ({self.maxsize}), dropped update {update_id}")
+            return False
+        self._stats['rejected'] += 1
+        logger.warning(f"Update queue full ({self.maxsize}), rejected update {update_id}")
+        raise QueueFullError("Update queue is full")
+
+    async def _worker(self):
+        processor = self.application.update_processor
+        while True:
+            enqueued_at, update = await self._queue.get()
+            lag = time.monotonic() - enqueued_at
+            self._recent_lags.append(lag)
+            self._stats['max_lag'] = max(self._stats['max_lag'], lag)
+            try:
+                await processor.process_update(update, self.application.process_update(update))
+                self._stats['processed'] += 1
+            except Exception as e:
+                # Handler errors go to the application's error handler; this is the rest
+                self._stats['failed'] += 1
+                logger.error(f"Error processing update {getattr(update, 'update_id', None)}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        """Start the worker tasks and accept updates"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._accepting = True
+        logger.info(f"Update queue started ({self.workers} workers, {self.maxsize} slots, "
+                    f"overload policy: {self.overload_policy})")
+
+    async def stop(self, timeout=10):
+        """Stop accepting updates, let the queued ones finish and stop the workers
+
+        Args:
+            timeout (float): Seconds to wait for queued updates
+        """
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._queue.qsize()} queued updates not processed before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        """Get queue depth, lag and counters"""
+        lags = sorted(self._recent_lags)
+        oldest_age = 0.0
+        if not self._queue.empty():
+            # asyncio.Queue keeps its items in a deque; the first one is the oldest
+            oldest_age = time.monotonic() - self._queue._queue[0][0]
+        return dict(
+            self._stats,
+            depth=self._queue.qsize(),
+            capacity=self.maxsize,
+            workers=self.workers,
+            overload_policy=self.overload_policy,
+            oldest_age=round(oldest_age, 3),
+            lag_avg=round(sum(lags) / len(lags), 3) if lags else 0.0,
+            lag_p95=round(lags[min(len(lags) - 1, int(len(lags) * 0.95))], 3) if lags else 0.0,
+            max_lag=round(self._stats['max_lag'], 3)
+        )
+
+
+def build_update_queue(application):
+    """Create the update queue configured by WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+    and WEBHOOK_OVERLOAD_POLICY
+
+    Args:
+        application: PTB Application the updates are processed by
+
+    Returns:
+        UpdateQueue: Queue, not started yet
+    """
+    # Default: one worker per update the processor accepts (waiting ones included)
+    default_workers = max(1, application.update_processor.max_concurrent_updates)
+    return UpdateQueue(
+        application,
+        maxsize=int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000')),
+        workers=int(os.getenv('WEBHOOK_WORKERS', str(min(default_workers, 64)))),
+        overload_policy=os.getenv('WEBHOOK_OVERLOAD_POLICY', OVERLOAD_REJECT).lower()
+    )
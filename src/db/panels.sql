@@ -129,5 +129,158 @@ CREATE TABLE IF NOT EXISTS extra_volume_settings (
     is_enabled BOOLEAN DEFAULT TRUE COMMENT 'Whether extra volume purchase is enabled for this category',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
-);
\ No newline at end of file
+    FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL,
+    UNIQUE KEY uq_extra_volume_category (category_id) COMMENT 'One settings row per category'
+);
+
+-- Users of the bot (registered on /start)
+CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    telegram_id BIGINT NOT NULL,
+    username VARCHAR(255) NULL,
+    role ENUM('admin', 'reseller', 'customer') DEFAULT 'customer',
+    balance DECIMAL(10, 2) DEFAULT 0.00,
+    is_active BOOLEAN DEFAULT TRUE COMMENT 'FALSE once the user blocked the bot or deleted the account',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_users_telegram_id (telegram_id)
+);
+
+-- Broadcast messages to all users
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    message_text TEXT NOT NULL,
+    created_by BIGINT NOT NULL COMMENT 'Telegram id of the admin, receives the progress report',
+    status VARCHAR(20) DEFAULT 'running' COMMENT 'running, completed, cancelled',
+    last_user_id INT NOT NULL DEFAULT 0 COMMENT 'Checkpoint: users.id of the last finished recipient chunk',
+    total_recipients INT NOT NULL DEFAULT 0,
+    sent_count INT NOT NULL DEFAULT 0,
+    blocked_count INT NOT NULL DEFAULT 0,
+    deleted_count INT NOT NULL DEFAULT 0,
+    failed_count INT NOT NULL DEFAULT 0,
+    locked_until DATETIME NULL COMMENT 'Lease of the bot process sending the broadcast',
+    locked_by VARCHAR(32) NULL COMMENT 'Token of the claim that holds the lease',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME NULL
+);
+
+-- Outcome per broadcast recipient
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    broadcast_id INT NOT NULL,
+    user_id INT NOT NULL,
+    status ENUM('ok', 'blocked', 'deleted', 'failed') NOT NULL,
+    error VARCHAR(255) NULL,
+    PRIMARY KEY (broadcast_id, user_id),
+    FOREIGN KEY (broadcast_id) REFERENCES broadcasts(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS bot_state (
+    kind VARCHAR(64) NOT NULL COMMENT 'user_data or conversation:<handler name>',
+    state_key VARCHAR(255) NOT NULL COMMENT 'User id or conversation key',
+    data LONGBLOB NOT NULL COMMENT 'Pickled state',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (kind, state_key)
+);
+
+-- Snapshot of the inbounds of each panel, mirrored by the inbound sync job
+CREATE TABLE IF NOT EXISTS inbounds (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    panel_id INT NOT NULL,
+    inbound_id INT NOT NULL COMMENT 'ID from the 3x-ui API',
+    protocol VARCHAR(50) NULL,
+    port INT NULL,
+    tag VARCHAR(255) NULL,
+    settings TEXT NULL COMMENT 'JSON',
+    stream_settings TEXT NULL COMMENT 'JSON',
+    sniffing TEXT NULL COMMENT 'JSON',
+    remark VARCHAR(255) NULL,
+    listen VARCHAR(255) NULL,
+    total_bandwidth BIGINT DEFAULT 0,
+    enable BOOLEAN DEFAULT TRUE,
+    client_count INT DEFAULT 0,
+    content_hash CHAR(40) NOT NULL COMMENT 'SHA-1 of the synced fields; rows are only rewritten when it changes',
+    deleted_at DATETIME NULL COMMENT 'Set when the inbound disappeared from the panel',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_inbounds_panel_inbound (panel_id, inbound_id),
+    FOREIGN KEY (panel_id) REFERENCES panels(id) ON DELETE CASCADE
+);
+
+-- Last inbound sync per panel (freshness of the snapshot)
+CREATE TABLE IF NOT EXISTS inbound_sync (
+    panel_id INT PRIMARY KEY,
+    synced_at DATETIME NULL COMMENT 'Last successful sync',
+    attempted_at DATETIME NOT NULL,
+    error VARCHAR(255) NULL COMMENT 'Error of the last attempt, NULL if it succeeded',
+    FOREIGN KEY (panel_id) REFERENCES panels(id) ON DELETE CASCADE
+);
+
+-- Clients created on the panels by the provisioning service
+CREATE TABLE IF NOT EXISTS clients (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NULL,
+    order_id INT NULL,
+    panel_id INT NOT NULL,
+    inbound_id INT NOT NULL COMMENT 'ID from the 3x-ui API',
+    client_id VARCHAR(255) NOT NULL COMMENT 'Key of the client on the panel: UUID, trojan password or shadowsocks email',
+    email VARCHAR(255) NOT NULL COMMENT 'Unique per panel in 3x-ui',
+    sub_id VARCHAR(255) NULL COMMENT 'Shared by the clients of one account',
+    limit_ip INT DEFAULT 0,
+    total_bandwidth BIGINT DEFAULT 0 COMMENT 'Traffic limit in bytes, 0 = unlimited',
+    expire_time BIGINT DEFAULT 0 COMMENT 'Unix time in milliseconds, 0 = never',
+    enable BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_clients_panel_email (panel_id, email),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
+    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE SET NULL,
+    FOREIGN KEY (panel_id) REFERENCES panels(id) ON DELETE CASCADE
+);
+
+-- Last counters and accumulated usage per client, written by the traffic collector
+CREATE TABLE IF NOT EXISTS client_traffic (
+    panel_id INT NOT NULL,
+    email VARCHAR(255) NOT NULL COMMENT 'Client email, unique per panel in 3x-ui',
+    inbound_id INT NOT NULL COMMENT 'ID from the 3x-ui API',
+    up BIGINT NOT NULL DEFAULT 0 COMMENT 'Counter last read from the panel',
+    down BIGINT NOT NULL DEFAULT 0 COMMENT 'Counter last read from the panel',
+    total_up BIGINT NOT NULL DEFAULT 0 COMMENT 'Usage summed over all deltas, survives counter resets',
+    total_down BIGINT NOT NULL DEFAULT 0 COMMENT 'Usage summed over all deltas, survives counter resets',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (panel_id, email),
+    FOREIGN KEY (panel_id) REFERENCES panels(id) ON DELETE CASCADE
+);
+
+-- Usage per client and sweep (only clients whose counters moved)
+CREATE TABLE IF NOT EXISTS client_usage (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    panel_id INT NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    up_delta BIGINT NOT NULL,
+    down_delta BIGINT NOT NULL,
+    recorded_at DATETIME NOT NULL
+);
+
+-- Indexes
+
+-- Category-scoped product listing (WHERE category_id = ? ORDER BY name)
+CREATE INDEX IF NOT EXISTS idx_products_category_name ON products (category_id, name);
+
+-- Paginated product keyboards (WHERE category_id = ? AND id > ? ORDER BY id LIMIT ?)
+CREATE INDEX IF NOT EXISTS idx_products_category_id ON products (category_id, id);
+
+-- Target of the extra volume upserts (for databases created before the key was added)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_extra_volume_category ON extra_volume_settings (category_id);
+
+-- Broadcast recipients are read in keyset chunks (WHERE id > ? AND is_active ORDER BY id)
+CREATE INDEX IF NOT EXISTS idx_users_active_id ON users (is_active, id);
+
+-- Usage history of a client (WHERE panel_id = ? AND email = ? ORDER BY recorded_at)
+CREATE INDEX IF NOT EXISTS idx_client_usage_client ON client_usage (panel_id, email, recorded_at);
+
+-- Accounts of one subscription (WHERE sub_id = ?)
+CREATE INDEX IF NOT EXISTS idx_clients_sub_id ON clients (sub_id);
+
+-- category_panel lookups by category_id use the UNIQUE (category_id, panel_id) key
+-- orders lookups by product_id use the index InnoDB creates for its foreign key
+-- inbounds snapshot reads by panel use the UNIQUE (panel_id, inbound_id) key
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import inspect
+import functools
+import contextvars
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_service_executor():
+    """Get the bounded thread pool that runs blocking service calls
+
+    The size comes from SERVICE_EXECUTOR_WORKERS and should not exceed the
+    database pool capacity, otherwise extra workers only wait for connections.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(os.getenv('SERVICE_EXECUTOR_WORKERS', '10'))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='service')
+                logger.info(f"Service executor created with {workers} workers")
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable in the service executor and await its result
+
+    Args:
+        func (callable): Synchronous function to run
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Whatever func returns; exceptions raised by func propagate to the caller
+    """
+    loop = asyncio.get_running_loop()
+    # Keep context variables (e.g. logging context) visible inside the worker thread
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_service_executor(), call)
+
+
+class AsyncService:
+    """Async facade over a synchronous service
+
+    Every public method of the wrapped service becomes awaitable and runs in
+    the shared service executor, so MySQL queries and panel HTTP calls never
+    block the bot event loop. Methods that are already coroutines are
+    returned unchanged. Non-callable attributes are passed through.
+
+    Example:
+        shop_service = AsyncService(ShopService())
+        categories = await shop_service.get_all_categories()
+    """
+
+    def __init__(self, service):
+        self._service = service
+        self._methods = {}
+
+    @property
+    def sync(self):
+        """The wrapped synchronous service"""
+        return self._service
+
+    def __getattr__(self, name):
+        attr = getattr(self._service, name)
+        if not callable(attr) or inspect.iscoroutinefunction(attr):
+            return attr
+
+        method = self._methods.get(name)
+        if method is None:
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                return await run_blocking(getattr(self._service, name), *args, **kwargs)
+            self._methods[name] = method
+        return method
+
+    def __repr__(self):
+        return f"AsyncService({self._service.__class__.__name__})"
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import secrets
+import mysql.connector
+import logging
+
+from src.utils.db import db_cursor, db_transaction
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Delivery outcomes and the broadcast counter each one increments
+DELIVERY_COUNTERS = {
+    'ok': 'sent_count',
+    'blocked': 'blocked_count',
+    'deleted': 'deleted_count',
+    'failed': 'failed_count',
+}
+
+
+class BroadcastLeaseLost(Exception):
+    """The lease of a broadcast expired and may have been claimed by another process"""
+
+
+class BroadcastService:
+    """Service for broadcast messages and their delivery records"""
+
+    def create_broadcast(self, message_text, created_by, lease_seconds):
+        """Create a running broadcast leased to the calling process
+
+        Args:
+            message_text (str): Text sent to every user
+            created_by (int): Telegram id of the admin
+            lease_seconds (int): Seconds the caller owns the broadcast
+
+        Returns:
+            tuple: (broadcast ID, lease token of the caller)
+        """
+        lease_token = secrets.token_hex(16)
+        try:
+            with db_cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO broadcasts (message_text, created_by, status, total_recipients, locked_until, locked_by)
+                    SELECT %s, %s, 'running', COUNT(*), NOW() + INTERVAL %s SECOND, %s
+                    FROM users WHERE is_active = TRUE
+                    """,
+                    (message_text, created_by, lease_seconds, lease_token)
+                )
+                return cursor.lastrowid, lease_token
+        except mysql.connector.Error as e:
+            logger.error(f"Database error creating broadcast: {e}")
+            # Persian error message for Telegram, but error is logged in English
+            raise Exception(f"خطا در ایجاد پیام همگانی: {e}")
+
+    def get_broadcast(self, broadcast_id):
+        """Get a broadcast with its counters
+
+        Args:
+            broadcast_id (int): Broadcast ID
+
+        Returns:
+            dict: Broadcast row or None if not found
+        """
+        try:
+            with db_cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT * FROM broadcasts WHERE id = %s", (broadcast_id,))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error getting broadcast {broadcast_id}: {e}")
+            return None
+
+    def get_recipients(self, after_user_id, limit):
+        """Get the next chunk of active users ordered by id (keyset pagination)
+
+        Args:
+            after_user_id (int): users.id of the last recipient already handled
+            limit (int): Chunk size
+
+        Returns:
+            list: (users.id, telegram_id) tuples
+        """
+        with db_cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, telegram_id FROM users
+                WHERE is_active = TRUE AND id > %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (after_user_id, limit)
+            )
+            return cursor.fetchall()
+
+    def record_chunk(self, broadcast_id, results, last_user_id, lease_token, lease_seconds):
+        """Store the outcomes of a chunk and move the checkpoint in one transaction
+
+        Users that blocked the bot or were deleted are marked inactive so later
+        broadcasts skip them. The lease is renewed.
+
+        Args:
+            broadcast_id (int): Broadcast ID
+            results (list): (users.id, status, error) tuples; status is a DELIVERY_COUNTERS key
+            last_user_id (int): users.id of the last recipient of the chunk
+            lease_token (str): Token returned by create_broadcast or claim_broadcast
+            lease_seconds (int): Seconds the caller owns the broadcast from now
+
+        Raises:
+            BroadcastLeaseLost: If the caller's lease expired or was claimed by
+                another process; nothing is stored
+        """
+        counts = dict.fromkeys(DELIVERY_COUNTERS.values(), 0)
+        for _, status, _ in results:
+            counts[DELIVERY_COUNTERS[status]] += 1
+
+        with db_transaction() as cursor:
+            # Checkpoint first: it locks the row against a concurrent claim
+            cursor.execute(
+                """
+                UPDATE broadcasts
+                SET last_user_id = %s,
+                    sent_count = sent_count + %s,
+                    blocked_count = blocked_count + %s,
+                    deleted_count = deleted_count + %s,
+                    failed_count = failed_count + %s,
+                    locked_until = NOW() + INTERVAL %s SECOND
+                WHERE id = %s AND locked_by = %s AND locked_until >= NOW()
+                """,
+                (last_user_id, counts['sent_count'], counts['blocked_count'],
+                 counts['deleted_count'], counts['failed_count'], lease_seconds,
+                 broadcast_id, lease_token)
+            )
+            if cursor.rowcount == 0:
+                # Raising rolls the transaction back
+                raise BroadcastLeaseLost(f"Lease of broadcast {broadcast_id} was lost")
+            if results:
+                cursor.executemany(
+                    """
+                    INSERT INTO broadcast_deliveries (broadcast_id, user_id, status, error)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE status = VALUES(status), error = VALUES(error)
+                    """,
+                    [(broadcast_id, user_id, status, error) for user_id, status, error in results]
+                )
+            unreachable = [(user_id,) for user_id, status, _ in results if status in ('blocked', 'deleted')]
+            if unreachable:
+                cursor.executemany("UPDATE users SET is_active = FALSE WHERE id = %s", unreachable)
+
+    def finish_broadcast(self, broadcast_id, status='completed', lease_token=None):
+        """Mark a broadcast completed or cancelled and release its lease
+
+        Args:
+            broadcast_id (int): Broadcast ID
+            status (str): 'completed' or 'cancelled'
+            lease_token (str, optional): Only finish it while this lease is held
+        """
+        query = """
+            UPDATE broadcasts SET status = %s, finished_at = NOW(), locked_until = NULL, locked_by = NULL
+            WHERE id = %s AND status = 'running'
+        """
+        params = [status, broadcast_id]
+        if lease_token is not None:
+            query += " AND locked_by = %s"
+            params.append(lease_token)
+        with db_cursor() as cursor:
+            cursor.execute(query, params)
+
+    def claim_broadcast(self, broadcast_id, lease_seconds):
+        """Take over a running broadcast whose lease has expired
+
+        Each claim gets a new token, so the previous owner can no longer
+        store chunks once the broadcast has been claimed.
+
+        Args:
+            broadcast_id (int): Broadcast ID
+            lease_seconds (int): Seconds the caller owns the broadcast
+
+        Returns:
+            str: Lease token of the caller, or None if the broadcast is not claimable
+        """
+        lease_token = secrets.token_hex(16)
+        with db_cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE broadcasts SET locked_until = NOW() + INTERVAL %s SECOND, locked_by = %s
+                WHERE id = %s AND status = 'running'
+                  AND (locked_until IS NULL OR locked_until < NOW())
+                """,
+                (lease_seconds, lease_token, broadcast_id)
+            )
+            return lease_token if cursor.rowcount == 1 else None
+
+    def get_running_broadcasts(self):
+        """Get running broadcasts with the seconds left on their lease
+
+        Returns:
+            list: Dicts with id and lease_left
+        """
+        try:
+            with db_cursor(dictionary=True) as cursor:
+                cursor.execute(
+                    """
+                    SELECT id, GREATEST(COALESCE(TIMESTAMPDIFF(SECOND, NOW(), locked_until), 0), 0) AS lease_left
+                    FROM broadcasts WHERE status = 'running'
+                    ORDER BY id
+                    """
+                )
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting running broadcasts: {e}")
+            return []
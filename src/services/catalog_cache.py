@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+import logging
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Namespaces used by the services
+CATEGORIES = 'categories'
+CATEGORY_PANELS = 'category_panels'
+PRODUCTS = 'products'
+PANELS = 'panels'
+EXTRA_VOLUME = 'extra_volume'
+
+
+def _copy(value):
+    """Copy cached rows so callers can modify the result freely"""
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, dict):
+        return {k: list(v) if isinstance(v, list) else v for k, v in value.items()}
+    return value
+
+
+class CatalogCache:
+    """In-process read-through cache for catalog data
+
+    Entries are grouped in namespaces (categories, products, panels, ...) and
+    dropped by the service methods that change the underlying tables. The TTL
+    only guards against changes made outside the services.
+
+    Args:
+        ttl (float): Seconds an entry stays valid (0 disables caching)
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = float(ttl)
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get_or_load(self, namespace, key, loader):
+        """Return a cached value or load and cache it
+
+        Args:
+            namespace (str): Namespace of the entry
+            key: Hashable key within the namespace
+            loader (callable): Called without arguments on a miss; exceptions
+                propagate and nothing is cached
+
+        Returns:
+            A copy of the cached value
+        """
+        if self.ttl <= 0:
+            return loader()
+
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and entry[1] > time.monotonic():
+                self._stats['hits'] += 1
+                return _copy(entry[0])
+            self._stats['misses'] += 1
+            generation = self._generations.get(namespace, 0)
+
+        value = loader()
+
+        with self._lock:
+            # Skip storing if the namespace was invalidated while loading
+            if self._generations.get(namespace, 0) == generation:
+                self._entries[(namespace, key)] = (value, time.monotonic() + self.ttl)
+        return _copy(value)
+
+    def invalidate(self, namespace, key=None):
+        """Drop one entry or a whole namespace
+
+        Args:
+            namespace (str): Namespace to invalidate
+            key: Entry to drop; None drops the whole namespace
+        """
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self._stats['invalidations'] += 1
+            if key is not None:
+                self._entries.pop((namespace, key), None)
+                return
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[entry_key]
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            for namespace in {k[0] for k in self._entries}:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self._entries.clear()
+
+    def stats(self):
+        """Get cache statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+# Shared by PanelService and ShopService
+catalog_cache = CatalogCache(ttl=float(os.getenv('CATALOG_CACHE_TTL', '300')))
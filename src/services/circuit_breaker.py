@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import random
+import logging
+from collections import deque
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class RetryBudget:
+    """Limits retries to a fraction of the recent requests
+
+    Retries are allowed while the retries of the last ``window`` seconds stay
+    below ``ratio`` times the requests of that window (at least
+    ``min_retries``), so a struggling panel is not flooded with retries.
+
+    Args:
+        ratio (float): Allowed retries per request
+        min_retries (int): Retries always allowed per window
+        window (float): Seconds of history
+    """
+
+    def __init__(self, ratio=0.2, min_retries=3, window=10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+
+    def _trim(self, now):
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_retry(self):
+        """Take a retry from the budget
+
+        Returns:
+            bool: True if the caller may retry
+        """
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= max(self.min_retries, self.ratio * len(self._requests)):
+            return False
+        self._retries.append(now)
+        return True
+
+
+class CircuitBreaker:
+    """Circuit breaker and adaptive timeout of one panel
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail immediately. After the reset timeout one probe call is let
+    through (half-open); its success closes the circuit, its failure opens
+    it again with a doubled, jittered reset timeout.
+
+    The request timeout follows the panel: ``timeout_multiplier`` times the
+    95th percentile of the recent successful latencies, kept between
+    ``min_timeout`` and ``max_timeout``.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the circuit
+        reset_timeout (float): Seconds the circuit stays open at first
+        max_reset_timeout (float): Upper bound of the growing reset timeout
+        min_timeout (float): Lower bound of the request timeout
+        max_timeout (float): Upper bound (and initial value) of the request timeout
+        timeout_multiplier (float): Factor applied to the latency percentile
+        window (int): Successful latencies kept
+        retry_budget (RetryBudget): Budget for retries of this panel
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, max_reset_timeout=300,
+                 min_timeout=2, max_timeout=10, timeout_multiplier=3, window=50, retry_budget=None):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.retry_budget = retry_budget or RetryBudget()
+
+        self.state = CLOSED
+        self._failures = 0
+        self._reset_timeout = reset_timeout
+        self._opened_at = None
+        self._open_for = 0.0
+        self._probe_in_flight = False
+        self._latencies = deque(maxlen=window)
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @classmethod
+    def from_env(cls):
+        """Create a breaker configured from XUI_* environment variables"""
+        return cls(
+            failure_threshold=int(os.getenv('XUI_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.getenv('XUI_BREAKER_RESET', '30')),
+            max_reset_timeout=float(os.getenv('XUI_BREAKER_MAX_RESET', '300')),
+            min_timeout=float(os.getenv('XUI_MIN_TIMEOUT', '2')),
+            max_timeout=float(os.getenv('XUI_TIMEOUT', '10')),
+            timeout_multiplier=float(os.getenv('XUI_TIMEOUT_MULTIPLIER', '3')),
+            retry_budget=RetryBudget(ratio=float(os.getenv('XUI_RETRY_BUDGET', '0.2')))
+        )
+
+    def retry_after(self):
+        """Seconds until an open circuit lets a probe through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(self._opened_at + self._open_for - time.monotonic(), 0.0)
+
+    def allow(self):
+        """Check whether a call may be sent now
+
+        Returns:
+            bool: False if the call must fail fast
+        """
+        if self.state == OPEN and self.retry_after() == 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self._stats['rejected'] += 1
+                return False
+            self._probe_in_flight = True
+            return True
+        if self.state == OPEN:
+            self._stats['rejected'] += 1
+            return False
+        return True
+
+    def record_success(self, latency):
+        """Record a call the panel answered"""
+        self._stats['successes'] += 1
+        self._latencies.append(latency)
+        self._failures = 0
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            logger.info(f"Circuit closed after a successful probe ({latency:.2f}s)")
+            self.state = CLOSED
+            self._reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        """Record a call that failed to reach the panel or timed out"""
+        self._stats['failures'] += 1
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            # The probe failed: stay open longer, with jitter so panels do not probe in lockstep
+            self._reset_timeout = min(self._reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self.state == CLOSED and self._failures >= self.failure_threshold:
+            self._open()
+
+    def record_cancelled(self):
+        """Release the half-open probe slot of a call that was cancelled"""
+        self._probe_in_flight = False
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._open_for = self._reset_timeout * random.uniform(0.8, 1.2)
+        self._stats['opened'] += 1
+        logger.warning(f"Circuit opened after {self._failures} failures for {self._open_for:.0f}s")
+
+    def latency_percentile(self, percentile=0.95):
+        """Percentile of the recent successful latencies, or None without samples"""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(int(len(ordered) * percentile), len(ordered) - 1)]
+
+    def timeout(self):
+        """Request timeout derived from the recent latencies"""
+        if len(self._latencies) < 5:
+            return self.max_timeout
+        adaptive = self.latency_percentile() * self.timeout_multiplier
+        return min(max(adaptive, self.min_timeout), self.max_timeout)
+
+    def snapshot(self):
+        """State, timeout and counters for the admin menu and metrics"""
+        p95 = self.latency_percentile()
+        return dict(
+            self._stats,
+            state=self.state,
+            consecutive_failures=self._failures,
+            retry_after=round(self.retry_after(), 1),
+            timeout=round(self.timeout(), 2),
+            p95_latency=round(p95, 3) if p95 is not None else None
+        )
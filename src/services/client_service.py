@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+
+from src.utils.db import db_transaction
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class ClientService:
+    """Service for the clients created on the panels"""
+
+    def record_clients(self, clients, user_id=None, order_id=None, batch_size=1000):
+        """Store provisioned clients in one transaction
+
+        Args:
+            clients (list): (panel_id, inbound_id, protocol, InboundClient) tuples
+            user_id (int, optional): Owner (users.id)
+            order_id (int, optional): Order the clients were sold with
+            batch_size (int): Rows per INSERT statement
+
+        Returns:
+            int: Number of stored clients
+        """
+        rows = [
+            (
+                user_id, order_id, panel_id, inbound_id, client.key(protocol), client.email, client.sub_id,
+                client.limit_ip, client.total_gb, client.expiry_time, client.enable
+            )
+            for panel_id, inbound_id, protocol, client in clients
+        ]
+        with db_transaction() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(
+                    """
+                    INSERT INTO clients (
+                        user_id, order_id, panel_id, inbound_id, client_id, email, sub_id,
+                        limit_ip, total_bandwidth, expire_time, enable
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        user_id = VALUES(user_id), order_id = VALUES(order_id), inbound_id = VALUES(inbound_id),
+                        client_id = VALUES(client_id), sub_id = VALUES(sub_id), limit_ip = VALUES(limit_ip),
+                        total_bandwidth = VALUES(total_bandwidth), expire_time = VALUES(expire_time),
+                        enable = VALUES(enable)
+                    """,
+                    rows[start:start + batch_size]
+                )
+        logger.info(f"Recorded {len(rows)} provisioned clients")
+        return len(rows)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+
+from src.services.async_service import AsyncService
+from src.services.inbound_service import InboundService
+from src.services.shop_service import ShopService
+from src.services.xui_client import InboundClient, xui_clients
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Reasons a client is disabled
+EXPIRED = 'expired'
+QUOTA = 'quota'
+
+NOTIFY_TEXTS = {
+    EXPIRED: "⛔ مهلت سرویس {email} به پایان رسید و سرویس غیرفعال شد.",
+    QUOTA: "⛔ حجم سرویس {email} به پایان رسید و سرویس غیرفعال شد.",
+}
+
+
+class ExpiryScheduler:
+    """Disables panel clients when they expire or use up their traffic
+
+    Deadlines are kept in a min-heap keyed by time and the job sleeps until
+    the earliest one instead of polling. Scheduling or moving a deadline is
+    a heap push (O(log n)); replaced entries stay in the heap and are
+    skipped when they come up. Clients that exceed their traffic limit are
+    pushed with a deadline of now by the traffic collector.
+
+    Due clients are handled per panel: the inbounds of the panel are read
+    once, clients that were renewed in the meantime are rescheduled and the
+    others are disabled and their Telegram owner (tgId) is notified.
+
+    Args:
+        concurrency (int): Panels handled at the same time
+        retry_delay (float): Seconds before retrying clients of a panel that failed
+        max_sleep (float): Longest sleep, so wall-clock changes are picked up
+    """
+
+    def __init__(self, concurrency=5, retry_delay=60, max_sleep=3600):
+        self.concurrency = concurrency
+        self.retry_delay = retry_delay
+        self.max_sleep = max_sleep
+        self.inbound_service = AsyncService(InboundService())
+        self.shop_service = AsyncService(ShopService())
+        # (deadline, panel_id, email, reason) entries; only those matching _deadlines are current
+        self._heap = []
+        # (panel_id, email) -> (deadline, reason)
+        self._deadlines = {}
+        # (panel_id, email) -> traffic limit in bytes
+        self._quotas = {}
+        self._wakeup = asyncio.Event()
+        self._application = None
+        self._task = None
+        self._stats = {'scheduled': 0, 'disabled': 0, 'renewed': 0, 'notified': 0, 'failed': 0}
+
+    def _push(self, key, deadline, reason):
+        if self._deadlines.get(key) == (deadline, reason):
+            return
+        self._deadlines[key] = (deadline, reason)
+        heapq.heappush(self._heap, (deadline, key[0], key[1], reason))
+        self._stats['scheduled'] += 1
+        if self._heap[0][0] == deadline:
+            # The new deadline is the earliest one: wake the job to sleep less
+            self._wakeup.set()
+        # Drop replaced entries once they make up most of the heap
+        if len(self._heap) > 2 * len(self._deadlines) + 1000:
+            self._heap = [entry for entry in self._heap if self._deadlines.get(entry[1:3]) == (entry[0], entry[3])]
+            heapq.heapify(self._heap)
+
+    def unschedule(self, panel_id, email):
+        """Forget a client (e.g. after it was deleted)"""
+        self._deadlines.pop((panel_id, email), None)
+        self._quotas.pop((panel_id, email), None)
+
+    def schedule_client(self, panel_id, client):
+        """Schedule or move the expiry of a client
+
+        Called for every client the inbound sync reads and by the code that
+        creates, renews or extends clients; a client whose deadline did not
+        change costs a dictionary lookup.
+
+        Args:
+            panel_id (int): Panel ID
+            client (InboundClient): Client with its current settings
+        """
+        key = (panel_id, client.email)
+        if client.total_gb > 0:
+            self._quotas[key] = client.total_gb
+        else:
+            self._quotas.pop(key, None)
+        pending_reason = self._deadlines.get(key, (None, None))[1]
+        if pending_reason == QUOTA:
+            # A pending quota check (or its retry) is not replaced; it reschedules the expiry if the client is renewed
+            if not client.enable:
+                self._deadlines.pop(key, None)
+            return
+        # Negative expiry times count from the first connection and are not known yet
+        if not client.enable or client.expiry_time <= 0:
+            if pending_reason == EXPIRED:
+                self._deadlines.pop(key, None)
+            return
+        self._push(key, client.expiry_time / 1000, EXPIRED)
+
+    def schedule_inbounds(self, panel_id, inbounds):
+        """Schedule the clients of all inbounds of a panel"""
+        for inbound in inbounds:
+            for client in inbound.clients:
+                self.schedule_client(panel_id, client)
+
+    def check_quota(self, panel_id, email, used):
+        """Disable a client as soon as possible if it used up its traffic limit
+
+        Args:
+            panel_id (int): Panel ID
+            email (str): Client email
+            used (int): Uploaded plus downloaded bytes counted by the panel
+        """
+        quota = self._quotas.get((panel_id, email))
+        if quota and used >= quota:
+            self._push((panel_id, email), time.time(), QUOTA)
+
+    async def load(self):
+        """Schedule the clients stored in the inbounds snapshot"""
+        for panel_id, client in await self.inbound_service.get_snapshot_clients():
+            self.schedule_client(panel_id, client)
+        logger.info(f"Expiry scheduler loaded {len(self._deadlines)} deadlines")
+
+    def start(self, application):
+        """Load the deadlines and run the scheduler in the background"""
+        if self._task is not None:
+            return
+        self._application = application
+        self._task = application.create_task(self._run())
+
+    async def stop(self):
+        """Stop the scheduler"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _pop_due(self, now):
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            deadline, panel_id, email, reason = heapq.heappop(self._heap)
+            key = (panel_id, email)
+            if self._deadlines.get(key) != (deadline, reason):
+                continue
+            del self._deadlines[key]
+            due.setdefault(panel_id, {})[email] = reason
+        return due
+
+    async def _run(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Error loading client deadlines: {e}")
+        while True:
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else self.max_sleep
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, self.max_sleep))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due = self._pop_due(time.time())
+            if due:
+                try:
+                    await self._enforce(due)
+                except Exception as e:
+                    logger.error(f"Error enforcing client deadlines: {e}")
+
+    async def _enforce(self, due):
+        panels = {panel['id']: panel for panel in await self.shop_service.get_all_panels()}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def enforce(panel_id, clients):
+            async with semaphore:
+                await self._enforce_panel(panels[panel_id], clients)
+
+        await asyncio.gather(*(
+            enforce(panel_id, clients) for panel_id, clients in due.items() if panel_id in panels
+        ))
+
+    async def _enforce_panel(self, panel, due):
+        """Disable the due clients of one panel
+
+        Args:
+            panel (dict): Panel dictionary
+            due (dict): email -> reason
+        """
+        xui = xui_clients.get(panel)
+        try:
+            inbounds = await xui.list_inbounds()
+        except Exception as e:
+            logger.warning(f"Failed to read panel {panel['id']} for expiry enforcement, retrying later: {e}")
+            retry_at = time.time() + self.retry_delay
+            for email, reason in due.items():
+                self._push((panel['id'], email), retry_at, reason)
+            return
+
+        now = time.time()
+        notifications = []
+        for inbound in inbounds:
+            used = {stat.email: stat.used for stat in inbound.client_stats}
+            for raw_client in inbound.settings.get('clients', []):
+                client = InboundClient.from_dict(raw_client)
+                reason = due.pop(client.email, None)
+                if reason is None or not client.enable:
+                    continue
+                renewed = (
+                    client.expiry_time <= 0 or client.expiry_time / 1000 > now
+                    if reason == EXPIRED else
+                    not client.total_gb or used.get(client.email, 0) < client.total_gb
+                )
+                if renewed:
+                    # Extended on the panel in the meantime
+                    self._stats['renewed'] += 1
+                    self.schedule_client(panel['id'], client)
+                    continue
+                # updateClient replaces the whole client: send the panel's own object with only enable changed
+                try:
+                    await xui.update_client(inbound.id, dict(raw_client, enable=False), inbound.protocol)
+                except Exception as e:
+                    logger.warning(f"Failed to disable client {client.email} on panel {panel['id']}: {e}")
+                    self._stats['failed'] += 1
+                    self._push((panel['id'], client.email), now + self.retry_delay, reason)
+                    continue
+                self._stats['disabled'] += 1
+                self._quotas.pop((panel['id'], client.email), None)
+                logger.info(f"Disabled client {client.email} on panel {panel['id']} ({reason})")
+                if client.tg_id:
+                    notifications.append((client.tg_id, NOTIFY_TEXTS[reason].format(email=client.email)))
+
+        # Clients that are no longer on the panel are forgotten
+        for email in due:
+            self.unschedule(panel['id'], email)
+
+        for chat_id, text in notifications:
+            try:
+                await self._application.bot.send_message(chat_id=chat_id, text=text)
+                self._stats['notified'] += 1
+            except Exception as e:
+                logger.warning(f"Failed to notify {chat_id} about a disabled client: {e}")
+
+    def stats(self):
+        """Get counters of the scheduler"""
+        next_deadline = self._heap[0][0] - time.time() if self._heap else None
+        return dict(
+            self._stats,
+            pending=len(self._deadlines),
+            heap_size=len(self._heap),
+            next_in=round(next_deadline, 1) if next_deadline is not None else None,
+            running=self._task is not None
+        )
+
+
+# Shared by the startup code, the inbound sync and the traffic collector
+expiry_scheduler = ExpiryScheduler(
+    concurrency=int(os.getenv('EXPIRY_CONCURRENCY', '5')),
+    retry_delay=float(os.getenv('EXPIRY_RETRY_DELAY', '60'))
+)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import hashlib
+import logging
+
+from src.utils.db import db_cursor, db_transaction
+from src.services.xui_client import InboundClient
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def _json(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def inbound_row(inbound):
+    """Column values of an Inbound for the inbounds table, ending with its content hash
+
+    Traffic counters are left out; they change all the time and would make
+    every sync rewrite every row.
+    """
+    values = (
+        inbound.protocol,
+        inbound.port,
+        inbound.tag,
+        _json(inbound.settings),
+        _json(inbound.stream_settings),
+        _json(inbound.sniffing),
+        inbound.remark,
+        inbound.listen,
+        inbound.total,
+        inbound.enable,
+        len(inbound.settings.get('clients', [])),
+    )
+    content_hash = hashlib.sha1(_json(values).encode('utf-8')).hexdigest()
+    return values + (content_hash,)
+
+
+class InboundService:
+    """Service for the local snapshot of the panels' inbounds"""
+
+    def sync_panel_inbounds(self, panel_id, inbounds):
+        """Mirror the inbounds fetched from a panel into the inbounds table
+
+        Only differences are written: new inbounds are inserted, inbounds
+        whose content hash changed (or that came back) are updated and
+        inbounds missing on the panel are soft-deleted.
+
+        Args:
+            panel_id (int): Panel ID
+            inbounds (list[Inbound]): Inbounds returned by the panel
+
+        Returns:
+            dict: Number of inserted, updated, deleted and unchanged inbounds
+        """
+        fetched = {inbound.id: inbound_row(inbound) for inbound in inbounds}
+
+        with db_transaction() as cursor:
+            cursor.execute(
+                """
+                SELECT inbound_id, content_hash, deleted_at IS NOT NULL
+                FROM inbounds WHERE panel_id = %s
+                """,
+                (panel_id,)
+            )
+            existing = {inbound_id: (content_hash, bool(deleted)) for inbound_id, content_hash, deleted in cursor.fetchall()}
+
+            inserted = [inbound_id for inbound_id in fetched if inbound_id not in existing]
+            updated = [
+                inbound_id for inbound_id, row in fetched.items()
+                if inbound_id in existing and (existing[inbound_id][0] != row[-1] or existing[inbound_id][1])
+            ]
+            deleted = [
+                inbound_id for inbound_id, (_, is_deleted) in existing.items()
+                if inbound_id not in fetched and not is_deleted
+            ]
+
+            changed = inserted + updated
+            if changed:
+                cursor.executemany(
+                    """
+                    INSERT INTO inbounds (
+                        panel_id, inbound_id, protocol, port, tag, settings, stream_settings,
+                        sniffing, remark, listen, total_bandwidth, enable, client_count, content_hash
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        protocol = VALUES(protocol), port = VALUES(port), tag = VALUES(tag),
+                        settings = VALUES(settings), stream_settings = VALUES(stream_settings),
+                        sniffing = VALUES(sniffing), remark = VALUES(remark), listen = VALUES(listen),
+                        total_bandwidth = VALUES(total_bandwidth), enable = VALUES(enable),
+                        client_count = VALUES(client_count), content_hash = VALUES(content_hash),
+                        deleted_at = NULL
+                    """,
+                    [(panel_id, inbound_id) + fetched[inbound_id] for inbound_id in changed]
+                )
+            if deleted:
+                placeholders = ','.join(['%s'] * len(deleted))
+                cursor.execute(
+                    f"""
+                    UPDATE inbounds SET deleted_at = NOW()
+                    WHERE panel_id = %s AND inbound_id IN ({placeholders})
+                    """,
+                    [panel_id] + deleted
+                )
+            cursor.execute(
+                """
+                INSERT INTO inbound_sync (panel_id, synced_at, attempted_at, error)
+                VALUES (%s, NOW(), NOW(), NULL)
+                ON DUPLICATE KEY UPDATE synced_at = NOW(), attempted_at = NOW(), error = NULL
+                """,
+                (panel_id,)
+            )
+
+        counts = {
+            'inserted': len(inserted),
+            'updated': len(updated),
+            'deleted': len(deleted),
+            'unchanged': len(fetched) - len(changed),
+        }
+        logger.info(f"Synced inbounds of panel {panel_id}: {counts}")
+        return counts
+
+    def record_sync_error(self, panel_id, error):
+        """Remember a failed sync attempt; the snapshot of the panel is kept
+
+        Args:
+            panel_id (int): Panel ID
+            error (str): Reason of the failure
+        """
+        try:
+            with db_cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO inbound_sync (panel_id, attempted_at, error)
+                    VALUES (%s, NOW(), %s)
+                    ON DUPLICATE KEY UPDATE attempted_at = NOW(), error = VALUES(error)
+                    """,
+                    (panel_id, str(error)[:255])
+                )
+        except Exception as e:
+            logger.error(f"Error recording inbound sync failure of panel {panel_id}: {e}")
+
+    def get_inbounds_snapshot(self, panel_ids):
+        """Read the stored inbounds of several panels in one query
+
+        Args:
+            panel_ids (list): Panel IDs
+
+        Returns:
+            tuple: (dict of panel_id -> inbound dictionaries shaped like
+                Inbound.to_dict(), dict of panel_id -> {'synced_at', 'error'}
+                for panels that were synced or attempted at least once)
+        """
+        if not panel_ids:
+            return {}, {}
+        placeholders = ','.join(['%s'] * len(panel_ids))
+        with db_cursor(dictionary=True) as cursor:
+            cursor.execute(
+                f"""
+                SELECT panel_id, inbound_id AS id, remark, protocol, port, enable
+                FROM inbounds
+                WHERE panel_id IN ({placeholders}) AND deleted_at IS NULL
+                ORDER BY panel_id, inbound_id
+                """,
+                list(panel_ids)
+            )
+            rows = cursor.fetchall()
+            cursor.execute(
+                f"""
+                SELECT panel_id, synced_at, error FROM inbound_sync
+                WHERE panel_id IN ({placeholders})
+                """,
+                list(panel_ids)
+            )
+            sync_rows = cursor.fetchall()
+
+        inbounds = {}
+        for row in rows:
+            panel_id = row.pop('panel_id')
+            row['enable'] = bool(row['enable'])
+            inbounds.setdefault(panel_id, []).append(row)
+        sync_info = {row['panel_id']: {'synced_at': row['synced_at'], 'error': row['error']} for row in sync_rows}
+        return inbounds, sync_info
+
+    def get_target_inbounds(self, panel_ids, ports):
+        """Read the enabled stored inbounds of several panels that listen on given ports
+
+        Args:
+            panel_ids (list): Panel IDs
+            ports (list): Ports
+
+        Returns:
+            dict: panel_id -> list of {'id', 'protocol', 'method'} (method is the
+                shadowsocks cipher of the inbound, empty for other protocols)
+        """
+        if not panel_ids or not ports:
+            return {}
+        panel_placeholders = ','.join(['%s'] * len(panel_ids))
+        port_placeholders = ','.join(['%s'] * len(ports))
+        with db_cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT panel_id, inbound_id, protocol, settings FROM inbounds
+                WHERE panel_id IN ({panel_placeholders}) AND port IN ({port_placeholders})
+                  AND enable AND deleted_at IS NULL
+                ORDER BY panel_id, inbound_id
+                """,
+                list(panel_ids) + list(ports)
+            )
+            rows = cursor.fetchall()
+
+        targets = {}
+        for panel_id, inbound_id, protocol, settings in rows:
+            try:
+                method = json.loads(settings or '{}').get('method') or ''
+            except ValueError:
+                method = ''
+            targets.setdefault(panel_id, []).append({'id': inbound_id, 'protocol': protocol, 'method': method})
+        return targets
+
+    def get_snapshot_clients(self):
+        """Read the clients configured in the stored inbounds of all panels
+
+        Returns:
+            list: (panel_id, InboundClient) tuples
+        """
+        with db_cursor() as cursor:
+            cursor.execute("SELECT panel_id, settings FROM inbounds WHERE deleted_at IS NULL AND client_count > 0")
+            rows = cursor.fetchall()
+
+        clients = []
+        for panel_id, settings in rows:
+            try:
+                entries = json.loads(settings or '{}').get('clients', [])
+            except ValueError:
+                logger.warning(f"Invalid settings JSON in the inbounds snapshot of panel {panel_id}")
+                continue
+            clients.extend((panel_id, InboundClient.from_dict(entry)) for entry in entries)
+        return clients
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import logging
+
+from src.services.async_service import AsyncService
+from src.services.expiry_scheduler import expiry_scheduler
+from src.services.inbound_service import InboundService
+from src.services.shop_service import ShopService
+from src.services.xui_client import xui_clients
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class InboundSyncer:
+    """Mirrors the inbounds of all active panels into the inbounds table
+
+    Runs every ``interval`` seconds in the background so the selection
+    screens read the local snapshot instead of querying every panel while
+    the admin waits. At most ``concurrency`` panels are queried at a time.
+    A panel that fails keeps its previous snapshot; the error is stored next
+    to the time of its last successful sync.
+
+    Args:
+        interval (float): Seconds between two syncs of all panels (0 disables the job)
+        concurrency (int): Panels queried at the same time
+        panel_timeout (float): Deadline for one panel in seconds
+    """
+
+    def __init__(self, interval=300, concurrency=5, panel_timeout=15):
+        self.interval = interval
+        self.concurrency = concurrency
+        self.panel_timeout = panel_timeout
+        self.inbound_service = AsyncService(InboundService())
+        self.shop_service = AsyncService(ShopService())
+        self._task = None
+        self._stats = {'runs': 0, 'synced': 0, 'failed': 0, 'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    async def sync_panel(self, panel):
+        """Fetch the inbounds of one panel and store the differences
+
+        Returns:
+            dict: Number of inserted, updated, deleted and unchanged inbounds
+
+        Raises:
+            XUIError: If the panel could not be queried
+        """
+        inbounds = await xui_clients.get(panel).list_inbounds()
+        counts = await self.inbound_service.sync_panel_inbounds(panel['id'], inbounds)
+        expiry_scheduler.schedule_inbounds(panel['id'], inbounds)
+        for key in ('inserted', 'updated', 'deleted'):
+            self._stats[key] += counts[key]
+        return counts
+
+    async def sync_panels(self, panels):
+        """Sync several panels concurrently
+
+        Args:
+            panels (list): Panel dictionaries
+
+        Returns:
+            tuple: (list of synced panel IDs, list of (panel name, reason) for failed panels)
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def sync(panel):
+            async with semaphore:
+                # Each panel gets its own deadline
+                return await asyncio.wait_for(self.sync_panel(panel), timeout=self.panel_timeout)
+
+        results = await asyncio.gather(*(sync(panel) for panel in panels), return_exceptions=True)
+
+        synced = []
+        failed = []
+        for panel, result in zip(panels, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning(f"Timed out syncing inbounds of panel {panel['id']} ({panel['name']}) after {self.panel_timeout}s")
+                failed.append((panel, "عدم پاسخ در مهلت تعیین شده"))
+            elif isinstance(result, Exception):
+                logger.warning(f"Failed to sync inbounds of panel {panel['id']} ({panel['name']}): {result}")
+                failed.append((panel, str(result)))
+            else:
+                synced.append(panel['id'])
+
+        for panel, reason in failed:
+            await self.inbound_service.record_sync_error(panel['id'], reason)
+
+        self._stats['synced'] += len(synced)
+        self._stats['failed'] += len(failed)
+        return synced, [(panel['name'], reason) for panel, reason in failed]
+
+    async def sync_all(self):
+        """Sync all active panels once"""
+        panels = await self.shop_service.get_all_panels()
+        synced, failed = await self.sync_panels(panels)
+        self._stats['runs'] += 1
+        logger.info(f"Inbound sync finished: {len(synced)} panels synced, {len(failed)} failed")
+
+    def start(self, application):
+        """Run the periodic sync in the background"""
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = application.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic sync"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync_all()
+            except Exception as e:
+                logger.error(f"Error syncing inbounds: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        """Get counters of the sync job"""
+        return dict(self._stats, interval=self.interval, running=self._task is not None)
+
+
+# Shared by the startup code and the category scenes
+inbound_syncer = InboundSyncer(
+    interval=float(os.getenv('INBOUND_SYNC_INTERVAL', '300')),
+    concurrency=int(os.getenv('INBOUND_SYNC_CONCURRENCY', '5')),
+    panel_timeout=float(os.getenv('PANEL_INBOUNDS_TIMEOUT', '15'))
+)
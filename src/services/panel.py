@@ -2,12 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import os
+import asyncio
 import mysql.connector
-from mysql.connector.cursor import MySQLCursorDict
 import logging
-import requests
-from requests.exceptions import RequestException
-import json
+
+from src.utils.db import get_db_connection, db_cursor
+from src.utils.pagination import Page, fetch_keyset_page, PAGE_SIZE
+from src.services.async_service import run_blocking
+from src.services.xui_client import (
+    xui_clients, XUIError, XUIAuthError, XUIConnectionError, XUICircuitOpenError
+)
+from src.services.catalog_cache import catalog_cache, PANELS, CATEGORY_PANELS
 
 # Setup logging
 logging.basicConfig(
@@ -19,41 +24,29 @@ logger = logging.getLogger(__name__)
 class PanelService:
     """Service for panel management"""
     
-    def __init__(self):
-        self.db_config = {
-            'host': os.getenv('DB_HOST'),
-            'database': os.getenv('DB_NAME'),
-            'user': os.getenv('DB_USER'),
-            'password': os.getenv('DB_PASSWORD')
-        }
-    
     def get_connection(self):
-        """Get database connection"""
-        try:
-            conn = mysql.connector.connect(**self.db_config)
-            conn.autocommit = True
-            return conn
-        except mysql.connector.Error as e:
-            logger.error(f"Database connection error: {e}")
-            # Persian error message for Telegram, but error is logged in English
-            raise Exception(f"خطا در اتصال به پایگاه داده: {e}")
+        """Get a pooled database connection (close() returns it to the pool)"""
+        return get_db_connection()
+    
+    def _invalidate_cache(self):
+        """Drop cached panel rows, including panels listed per category"""
+        catalog_cache.invalidate(PANELS)
+        catalog_cache.invalidate(CATEGORY_PANELS)
     
     def add_panel(self, name, url, username, password, panel_type='3x-ui'):
         """Add a new panel"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True)
             logger.info(f"Adding new panel: {name}, Type: {panel_type}")
-            cursor.execute(
-                """
-                INSERT INTO panels (name, url, username, password, panel_type, status)
-                VALUES (%s, %s, %s, %s, %s, 'active')
-                """,
-                (name, url, username, password, panel_type)
-            )
-            panel_id = cursor.lastrowid
-            cursor.close()
-            conn.close()
+            with db_cursor(dictionary=True) as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO panels (name, url, username, password, panel_type, status)
+                    VALUES (%s, %s, %s, %s, %s, 'active')
+                    """,
+                    (name, url, username, password, panel_type)
+                )
+                panel_id = cursor.lastrowid
+            self._invalidate_cache()
             logger.info(f"Panel added successfully with ID: {panel_id}")
             return panel_id
         except mysql.connector.Error as e:
@@ -70,19 +63,19 @@ class PanelService:
     
     def get_panel(self, panel_id):
         """Get panel by ID"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True)
+        def load():
             logger.info(f"Getting panel with ID: {panel_id}")
-            cursor.execute(
-                """
-                SELECT * FROM panels WHERE id = %s
-                """,
-                (panel_id,)
-            )
-            panel = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with db_cursor(dictionary=True) as cursor:
+                cursor.execute(
+                    """
+                    SELECT * FROM panels WHERE id = %s
+                    """,
+                    (panel_id,)
+                )
+                return cursor.fetchone()
+        
+        try:
+            panel = catalog_cache.get_or_load(PANELS, ('id', panel_id), load)
             if panel:
                 logger.info(f"Panel found: {panel['name']}")
             else:
@@ -94,29 +87,48 @@ class PanelService:
     
     def get_all_panels(self):
         """Get all panels"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True)
+        def load():
             logger.info("Retrieving all panels")
-            cursor.execute(
-                """
-                SELECT * FROM panels ORDER BY id
-                """
-            )
-            panels = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            with db_cursor(dictionary=True) as cursor:
+                cursor.execute(
+                    """
+                    SELECT * FROM panels ORDER BY id
+                    """
+                )
+                return cursor.fetchall()
+        
+        try:
+            panels = catalog_cache.get_or_load(PANELS, 'all', load)
             logger.info(f"Retrieved {len(panels)} panels")
             return panels
         except Exception as e:
             logger.error(f"Error getting all panels: {e}")
             return []
     
+    def get_panels_page(self, after_id=None, before_id=None, limit=PAGE_SIZE):
+        """Get one page of panels ordered by id
+        
+        Args:
+            after_id (int, optional): Page after this panel id
+            before_id (int, optional): Page before this panel id
+            limit (int): Panels per page
+            
+        Returns:
+            Page: Panels of the page (empty page on error)
+        """
+        try:
+            with db_cursor(dictionary=True) as cursor:
+                return fetch_keyset_page(
+                    cursor, "SELECT id, name, status FROM panels WHERE 1 = 1",
+                    after_id=after_id, before_id=before_id, limit=limit
+                )
+        except Exception as e:
+            logger.error(f"Error getting panels page: {e}")
+            return Page()
+    
     def update_panel(self, panel_id, name=None, url=None, username=None, password=None, status=None):
         """Update panel details"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(dictionary=True)
             logger.info(f"Updating panel with ID: {panel_id}")
             # Build the update query dynamically
             query_parts = []
@@ -153,10 +165,14 @@ class PanelService:
             """
             params.append(panel_id)
             
-            cursor.execute(query, params)
-            affected_rows = cursor.rowcount
-            cursor.close()
-            conn.close()
+            with db_cursor(dictionary=True) as cursor:
+                cursor.execute(query, params)
+                affected_rows = cursor.rowcount
+            self._invalidate_cache()
+            
+            # A cached login is useless once the address or credentials change
+            if url is not None or username is not None or password is not None:
+                xui_clients.invalidate(panel_id)
             if affected_rows > 0:
                 logger.info(f"Panel updated successfully: {panel_id}")
             else:
@@ -166,127 +182,195 @@ class PanelService:
             logger.error(f"Error updating panel: {e}")
             return False
     
-    def check_panel_status(self, panel_id):
+    def update_panel_statuses(self, statuses):
+        """Write the status of several panels in a single UPDATE
+        
+        Args:
+            statuses (dict): Panel IDs as keys and new status strings as values
+            
+        Returns:
+            int: Number of updated rows
         """
-        Check if a panel is active by sending a login request to its URL
+        if not statuses:
+            return 0
+        try:
+            panel_ids = list(statuses.keys())
+            case_parts = ' '.join(['WHEN %s THEN %s'] * len(panel_ids))
+            placeholders = ','.join(['%s'] * len(panel_ids))
+            params = []
+            for panel_id in panel_ids:
+                params.extend([panel_id, statuses[panel_id]])
+            params.extend(panel_ids)
+            
+            query = f"""
+                UPDATE panels
+                SET status = CASE id {case_parts} END
+                WHERE id IN ({placeholders})
+            """
+            with db_cursor() as cursor:
+                cursor.execute(query, params)
+                affected_rows = cursor.rowcount
+            self._invalidate_cache()
+            logger.info(f"Updated status of {affected_rows} panels in one batch")
+            return affected_rows
+        except Exception as e:
+            logger.error(f"Error updating panel statuses: {e}")
+            return 0
+    
+    async def _probe_panel(self, panel, timeout=None):
+        """
+        Send a login request to a panel without touching the database
+        
+        A panel whose circuit breaker is open is not contacted and keeps its status.
         
         Args:
-            panel_id: The ID of the panel to check
+            panel: Panel dictionary with id, url, username, password
+            timeout: Upper bound of the request timeout in seconds (the
+                timeout otherwise adapts to the panel's latency)
             
         Returns:
             bool: True if the panel is active and responding, False otherwise
             str: A message describing the status or error
+            str: Status to store for the panel, or None to leave it unchanged
         """
+        panel_id = panel['id']
         try:
-            panel = self.get_panel(panel_id)
-            if not panel:
-                return False, "پنل یافت نشد"
-            
             if not panel['url']:
-                return False, "آدرس پنل وجود ندارد"
-                
-            # Ensure URL has http:// or https:// prefix
-            url = panel['url']
-            if not url.startswith(('http://', 'https://')):
-                url = 'http://' + url
-                
-            # Append /login path if it doesn't have it
-            if not url.endswith('/login'):
-                url = url.rstrip('/') + '/login'
+                return False, "آدرس پنل وجود ندارد", None
                 
-            logger.info(f"Checking status of panel ID {panel_id} at URL: {url}")
-            
-            # Prepare login payload
-            payload = {
-                'username': panel['username'],
-                'password': panel['password']
-            }
-            
-            # Send POST request to panel login URL
-            response = requests.post(url, data=payload, timeout=10)
+            logger.info(f"Checking status of panel ID {panel_id} at URL: {panel['url']}")
             
-            # Handle response
-            if response.status_code == 200:
-                # Try to parse response as JSON
-                try:
-                    # Parse JSON response
-                    result = response.json()
-                    
-                    # Check for success field in JSON response
-                    if 'success' in result:
-                        if result['success'] is True:
-                            logger.info(f"Panel ID {panel_id} login successful with message: {result.get('msg', '')}")
-                            self.update_panel(panel_id, status='active')
-                            return True, "پنل فعال و در دسترس است"
-                        else:
-                            # Login failed but panel is responding
-                            logger.warning(f"Panel ID {panel_id} login failed with message: {result.get('msg', '')}")
-                            self.update_panel(panel_id, status='inactive')
-                            return False, f"پنل در دسترس است اما ورود ناموفق بود: {result.get('msg', 'نام کاربری یا رمز عبور نادرست')}"
-                    
-                    # If there's no success field but has other common fields
-                    elif any(key in result for key in ['status', 'result', 'data']):
-                        logger.info(f"Panel ID {panel_id} is active and responding with valid JSON")
-                        self.update_panel(panel_id, status='active')
-                        return True, "پنل فعال و در دسترس است"
-                        
-                except (json.JSONDecodeError, ValueError):
-                    # Some panels might return HTML or other formats
-                    if 'login' in response.text.lower() or 'admin' in response.text.lower():
-                        logger.info(f"Panel ID {panel_id} is active and responding with HTML")
-                        self.update_panel(panel_id, status='active')
-                        return True, "پنل فعال و در دسترس است"
-            
-            # If we got a response but couldn't verify it's valid
-            if response.status_code != 200:
-                logger.warning(f"Panel ID {panel_id} returned status code: {response.status_code}")
-                self.update_panel(panel_id, status='inactive')
-                return False, f"پنل پاسخ نامعتبر با کد {response.status_code} برگرداند"
-            
-            # If we got here, the panel responded but we couldn't verify it's valid
-            logger.warning(f"Panel ID {panel_id} response couldn't be verified as valid: {response.text[:100]}")
-            self.update_panel(panel_id, status='unknown')
-            return False, "وضعیت پنل نامشخص است"
+            # A successful login also refreshes the shared session of the panel
+            result = await xui_clients.get(panel).login(timeout=timeout)
+            logger.info(f"Panel ID {panel_id} login successful with message: {result.msg}")
+            return True, "پنل فعال و در دسترس است", 'active'
                 
-        except RequestException as e:
+        except XUIAuthError as e:
+            # Login failed but panel is responding
+            logger.warning(f"Panel ID {panel_id} login failed with message: {e}")
+            return False, f"پنل در دسترس است اما ورود ناموفق بود: {e}", 'inactive'
+        except XUICircuitOpenError as e:
+            logger.info(f"Skipping panel ID {panel_id}, its circuit is open")
+            return False, str(e), None
+        except XUIConnectionError as e:
             logger.error(f"Error connecting to panel ID {panel_id}: {e}")
-            self.update_panel(panel_id, status='inactive')
-            return False, f"خطا در اتصال به پنل: {e}"
+            return False, str(e), 'inactive'
+        except XUIError as e:
+            if e.status_code is not None and e.status_code != 200:
+                logger.warning(f"Panel ID {panel_id} returned status code: {e.status_code}")
+                return False, str(e), 'inactive'
+            # The panel responded but we couldn't verify it's valid
+            logger.warning(f"Panel ID {panel_id} response couldn't be verified as valid: {e}")
+            return False, "وضعیت پنل نامشخص است", 'unknown'
         except Exception as e:
             logger.error(f"Unexpected error checking panel ID {panel_id}: {e}")
-            return False, f"خطای غیرمنتظره: {e}"
+            return False, f"خطای غیرمنتظره: {e}", None
+    
+    async def check_panel_status(self, panel_id):
+        """
+        Check if a panel is active by sending a login request to its URL
+        
+        Args:
+            panel_id: The ID of the panel to check
+            
+        Returns:
+            bool: True if the panel is active and responding, False otherwise
+            str: A message describing the status or error
+        """
+        panel = await run_blocking(self.get_panel, panel_id)
+        if not panel:
+            return False, "پنل یافت نشد"
+        
+        status, message, new_status = await self._probe_panel(panel)
+        if new_status is not None:
+            await run_blocking(self.update_panel, panel_id, status=new_status)
+        return status, message
             
-    def check_all_panels_status(self):
+    async def check_all_panels_status(self, max_workers=None, panel_timeout=None, overall_timeout=None):
         """
-        Check status of all panels
+        Check status of all panels concurrently
+        
+        At most max_workers panels are probed at the same time. Each probe is
+        limited by panel_timeout and the whole sweep by overall_timeout; panels
+        that have not answered by then are reported as timed out and keep their
+        status. All status changes are written back in one batched UPDATE.
+        
+        Args:
+            max_workers: Maximum number of panels probed at the same time
+            panel_timeout: Request timeout for a single panel in seconds
+            overall_timeout: Deadline for the whole sweep in seconds
         
         Returns:
             dict: A dictionary with panel IDs as keys and tuples of (status, message) as values
         """
-        panels = self.get_all_panels()
+        max_workers = max_workers or int(os.getenv('PANEL_SWEEP_WORKERS', '10'))
+        panel_timeout = panel_timeout or float(os.getenv('PANEL_SWEEP_PANEL_TIMEOUT', '10'))
+        overall_timeout = overall_timeout or float(os.getenv('PANEL_SWEEP_TIMEOUT', '30'))
+        
+        panels = await run_blocking(self.get_all_panels)
         results = {}
+        if not panels:
+            return results
+        
+        semaphore = asyncio.Semaphore(max_workers)
         
-        for panel in panels:
-            status, message = self.check_panel_status(panel['id'])
+        async def probe(panel):
+            async with semaphore:
+                return await self._probe_panel(panel, panel_timeout)
+        
+        tasks = {asyncio.ensure_future(probe(panel)): panel for panel in panels}
+        done, not_done = await asyncio.wait(tasks, timeout=overall_timeout)
+        for task in not_done:
+            task.cancel()
+        
+        status_changes = {}
+        for task in done:
+            panel = tasks[task]
+            status, message, new_status = task.result()
             results[panel['id']] = (status, message)
-            
+            if new_status is not None and new_status != panel.get('status'):
+                status_changes[panel['id']] = new_status
+        
+        for task in not_done:
+            panel = tasks[task]
+            logger.warning(f"Panel ID {panel['id']} did not answer within the sweep deadline")
+            results[panel['id']] = (False, "پنل در مهلت تعیین شده پاسخ نداد")
+        
+        await run_blocking(self.update_panel_statuses, status_changes)
+        
+        logger.info(
+            f"Panel sweep finished: {len(done)} checked, {len(not_done)} timed out, "
+            f"{len(status_changes)} status changes"
+        )
         return results
     
+    async def get_connection_state(self, panel_id):
+        """
+        Get the circuit breaker state of a panel
+        
+        Args:
+            panel_id: The ID of the panel
+            
+        Returns:
+            dict: Breaker snapshot (state, retry_after, timeout, p95_latency, ...)
+                or None if the panel was not contacted since the bot started
+        """
+        return xui_clients.breaker_state(panel_id)
+    
     def delete_panel(self, panel_id):
         """Delete a panel"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
             logger.info(f"Deleting panel with ID: {panel_id}")
-            cursor.execute(
-                """
-                DELETE FROM panels WHERE id = %s
-                """,
-                (panel_id,)
-            )
-            affected_rows = cursor.rowcount
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                cursor.execute(
+                    """
+                    DELETE FROM panels WHERE id = %s
+                    """,
+                    (panel_id,)
+                )
+                affected_rows = cursor.rowcount
+            self._invalidate_cache()
+            xui_clients.invalidate(panel_id)
             if affected_rows > 0:
                 logger.info(f"Panel deleted successfully: {panel_id}")
             else:
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import uuid
+import base64
+import asyncio
+import secrets
+import logging
+from dataclasses import dataclass, field
+
+from src.services.async_service import AsyncService
+from src.services.client_service import ClientService
+from src.services.expiry_scheduler import expiry_scheduler
+from src.services.inbound_service import InboundService
+from src.services.inbound_sync import inbound_syncer
+from src.services.shop_service import ShopService
+from src.services.xui_client import (
+    InboundClient,
+    XUICircuitOpenError,
+    XUIConnectionError,
+    xui_clients
+)
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# Protocols whose clients can be created; others are reported as failed inbounds
+SUPPORTED_PROTOCOLS = frozenset({'vmess', 'vless', 'trojan', 'shadowsocks'})
+
+
+class ProvisioningError(Exception):
+    """Provisioning failed; clients created before the failure were removed again
+
+    The message is suitable for showing in Telegram.
+    """
+
+    def __init__(self, message, failures=None):
+        super().__init__(message)
+        self.failures = failures or []
+
+
+@dataclass
+class ProvisionedAccount:
+    """One sold account: the same UUID and subscription on every target inbound"""
+    name: str
+    uuid: str
+    sub_id: str
+    # (panel_id, inbound_id, protocol, InboundClient) created for the account
+    clients: list = field(default_factory=list)
+
+
+@dataclass
+class ProvisionResult:
+    """Accounts created and (panel name, inbound ID, reason) of the inbounds that failed"""
+    accounts: list = field(default_factory=list)
+    failures: list = field(default_factory=list)
+
+
+class ProvisioningService:
+    """Creates the clients of sold accounts on the panels of a category
+
+    The target inbounds are the inbounds of the category's panels whose port
+    is in the category's inbound_ports (read from the inbounds snapshot).
+    Client credentials follow the inbound's protocol (UUID for vmess/vless,
+    password for trojan, method and password for shadowsocks); inbounds of
+    other protocols are reported as failed.
+    Each inbound gets all new clients in one addClient call (split into
+    chunks of ``batch_size``); panels are handled concurrently over their
+    shared keep-alive sessions, the inbounds of one panel one after another.
+
+    An addClient call that timed out may still have been applied, so the
+    inbounds of the panel are read again to see which clients exist. With
+    ``atomic`` a failure on any inbound removes the clients created by the
+    order from all panels again; otherwise the created clients are kept and
+    the failed inbounds are reported.
+
+    Args:
+        concurrency (int): Panels handled at the same time
+        batch_size (int): Clients per addClient call
+    """
+
+    def __init__(self, concurrency=10, batch_size=200):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.shop_service = AsyncService(ShopService())
+        self.inbound_service = AsyncService(InboundService())
+        self.client_service = AsyncService(ClientService())
+
+    async def resolve_targets(self, category_id):
+        """Find the inbounds new clients of a category are created on
+
+        Returns:
+            tuple: (list of (panel, list of {'id', 'protocol', 'method'}) for the active
+                panels of the category, list of (panel name, inbound ID, reason) for
+                inbounds whose protocol is not supported)
+
+        Raises:
+            ProvisioningError: If the category does not exist or has no usable inbound
+        """
+        category = await self.shop_service.get_category_by_id(category_id)
+        if not category:
+            raise ProvisioningError("دسته بندی یافت نشد")
+        ports = set(category['inbound_ports'])
+        panels = [
+            panel for panel in await self.shop_service.get_category_panels(category_id)
+            if panel.get('status') in ('active', None)
+        ]
+        panel_ids = [panel['id'] for panel in panels]
+
+        _, sync_info = await self.inbound_service.get_inbounds_snapshot(panel_ids)
+        missing = [panel for panel in panels if not (sync_info.get(panel['id']) or {}).get('synced_at')]
+        if missing:
+            # Panels that were never synced are read now
+            await inbound_syncer.sync_panels(missing)
+        stored = await self.inbound_service.get_target_inbounds(panel_ids, sorted(ports))
+
+        targets = []
+        unsupported = []
+        for panel in panels:
+            inbounds = []
+            for inbound in stored.get(panel['id'], []):
+                if inbound['protocol'] in SUPPORTED_PROTOCOLS:
+                    inbounds.append(inbound)
+                else:
+                    unsupported.append((panel['name'], inbound['id'], f"پروتکل {inbound['protocol']} پشتیبانی نمی‌شود"))
+            if inbounds:
+                targets.append((panel, inbounds))
+        if not targets:
+            raise ProvisioningError("هیچ اینباند فعالی برای این دسته بندی یافت نشد", unsupported)
+        return targets, unsupported
+
+    @staticmethod
+    def build_accounts(count, prefix):
+        """Create the identities of ``count`` new accounts"""
+        return [
+            ProvisionedAccount(name=f"{prefix}{secrets.token_hex(4)}", uuid=str(uuid.uuid4()), sub_id=secrets.token_hex(8))
+            for _ in range(count)
+        ]
+
+    @staticmethod
+    def _credentials(inbound):
+        """Password and method of a new client of an inbound"""
+        if inbound['protocol'] == 'trojan':
+            return secrets.token_hex(16), ''
+        if inbound['protocol'] == 'shadowsocks':
+            method = inbound['method']
+            if method.startswith('2022-blake3-'):
+                # Keys of the 2022 ciphers have the cipher's key length; the method is set on the inbound
+                key_length = 16 if 'aes-128' in method else 32
+                return base64.b64encode(secrets.token_bytes(key_length)).decode('ascii'), ''
+            return secrets.token_urlsafe(16), method
+        return '', ''
+
+    def _inbound_clients(self, accounts, inbound, product, tg_id):
+        # Emails must be unique on a panel, so each inbound gets its own suffix
+        expiry_time = int((time.time() + product['duration'] * 86400) * 1000) if product.get('duration') else 0
+        clients = []
+        for account in accounts:
+            password, method = self._credentials(inbound)
+            clients.append(InboundClient(
+                id=account.uuid,
+                email=f"{account.name}-{inbound['id']}",
+                limit_ip=product.get('users_limit') or 0,
+                total_gb=(product.get('data_limit') or 0) * GB,
+                expiry_time=expiry_time,
+                tg_id=str(tg_id or ''),
+                sub_id=account.sub_id,
+                password=password,
+                method=method
+            ))
+        return clients
+
+    async def _reconcile(self, xui, inbound_id, clients):
+        """Clients of a batch whose addClient call timed out that exist on the panel anyway"""
+        try:
+            inbounds = await xui.list_inbounds()
+        except Exception as e:
+            logger.warning(f"Could not reconcile inbound {inbound_id} on panel {xui.panel_id}: {e}")
+            # Unknown: treat them as created so a rollback tries to remove them
+            return clients
+        existing = {
+            client.email
+            for inbound in inbounds if inbound.id == inbound_id
+            for client in inbound.clients
+        }
+        return [client for client in clients if client.email in existing]
+
+    async def _provision_panel(self, panel, inbounds, accounts, product, tg_id):
+        """Add the clients of all accounts to the target inbounds of one panel
+
+        Returns:
+            tuple: (list of (panel_id, inbound_id, protocol, InboundClient) created, list of failures)
+        """
+        xui = xui_clients.get(panel)
+        created = []
+        failures = []
+        for inbound in inbounds:
+            inbound_id = inbound['id']
+            protocol = inbound['protocol']
+            clients = self._inbound_clients(accounts, inbound, product, tg_id)
+            for start in range(0, len(clients), self.batch_size):
+                batch = clients[start:start + self.batch_size]
+                try:
+                    await xui.add_clients(inbound_id, batch, protocol)
+                    added = batch
+                except Exception as e:
+                    logger.warning(f"addClient of {len(batch)} clients failed on panel {panel['id']} inbound {inbound_id}: {e}")
+                    failures.append((panel['name'], inbound_id, str(e)))
+                    # A request that was sent and timed out may have been applied
+                    ambiguous = isinstance(e, XUIConnectionError) and not isinstance(e, XUICircuitOpenError)
+                    added = await self._reconcile(xui, inbound_id, batch) if ambiguous else []
+                created.extend((panel['id'], inbound_id, protocol, client) for client in added)
+                if len(added) < len(batch):
+                    break
+        return created, failures
+
+    async def _rollback(self, created):
+        """Delete created clients again, panels concurrently
+
+        Returns:
+            list: (panel_id, inbound_id, protocol, InboundClient) that could not be deleted
+        """
+        panels = {panel['id']: panel for panel in await self.shop_service.get_all_panels()}
+        by_panel = {}
+        for entry in created:
+            by_panel.setdefault(entry[0], []).append(entry)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def rollback_panel(panel_id, clients):
+            async with semaphore:
+                if panel_id not in panels:
+                    return clients
+                xui = xui_clients.get(panels[panel_id])
+                left = []
+                for entry in clients:
+                    _, inbound_id, protocol, client = entry
+                    try:
+                        # delClient takes the same per-protocol key as updateClient
+                        await xui.delete_client(inbound_id, client.key(protocol))
+                    except Exception as e:
+                        logger.error(f"Rollback could not delete client {client.email} on panel {panel_id}: {e}")
+                        left.append(entry)
+                return left
+
+        results = await asyncio.gather(*(rollback_panel(pid, clients) for pid, clients in by_panel.items()))
+        return [entry for left in results for entry in left]
+
+    async def provision(self, category_id, product, count=1, user_id=None, order_id=None,
+                        tg_id='', prefix='u', atomic=True):
+        """Create ``count`` accounts of a product on all target inbounds of a category
+
+        Args:
+            category_id (int): Category whose panels and inbound ports are used
+            product (dict): Product with data_limit (GB), duration (days) and users_limit
+            count (int): Number of accounts
+            user_id (int, optional): Owner (users.id) stored with the clients
+            order_id (int, optional): Order stored with the clients
+            tg_id (str, optional): Telegram id stored on the panel for notifications
+            prefix (str): Start of the generated client names
+            atomic (bool): Remove everything again if any inbound failed
+
+        Returns:
+            ProvisionResult: Created accounts and failed inbounds
+
+        Raises:
+            ProvisioningError: If nothing could be created or ``atomic`` and an inbound failed
+        """
+        started = time.monotonic()
+        targets, unsupported = await self.resolve_targets(category_id)
+        accounts = self.build_accounts(count, prefix)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def provision_panel(panel, inbounds):
+            async with semaphore:
+                return await self._provision_panel(panel, inbounds, accounts, product, tg_id)
+
+        results = await asyncio.gather(*(
+            provision_panel(panel, inbounds) for panel, inbounds in targets
+        ))
+        created = [entry for entry_list, _ in results for entry in entry_list]
+        failures = unsupported + [failure for _, failure_list in results for failure in failure_list]
+
+        if not created or (failures and atomic):
+            left = await self._rollback(created) if created else []
+            if left:
+                logger.error(f"Rollback left {len(left)} clients on the panels: {[entry[3].email for entry in left]}")
+            raise ProvisioningError("ساخت اکانت روی پنل‌ها ناموفق بود", failures)
+
+        try:
+            await self.client_service.record_clients(created, user_id, order_id)
+        except Exception as e:
+            logger.error(f"Error recording provisioned clients: {e}")
+            if atomic:
+                await self._rollback(created)
+                raise ProvisioningError("خطا در ذخیره اکانت‌ها", failures)
+            raise
+
+        by_name = {account.name: account for account in accounts}
+        for entry in created:
+            panel_id, _, _, client = entry
+            by_name[client.email.rsplit('-', 1)[0]].clients.append(entry)
+            expiry_scheduler.schedule_client(panel_id, client)
+
+        logger.info(
+            f"Provisioned {count} accounts as {len(created)} clients on {len(targets)} panels "
+            f"in {time.monotonic() - started:.2f}s ({len(failures)} failed inbounds)"
+        )
+        return ProvisionResult(accounts=accounts, failures=failures)
+
+
+# Shared by the purchase flows
+provisioning_service = ProvisioningService(
+    concurrency=int(os.getenv('PROVISION_CONCURRENCY', '10')),
+    batch_size=int(os.getenv('PROVISION_BATCH_SIZE', '200'))
+)
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
 import json
 import mysql.connector
 import logging
-from src.utils.db import get_db_connection
+from src.utils.db import db_cursor, db_transaction
+from src.utils.pagination import Page, fetch_keyset_page, PAGE_SIZE
 from src.services.panel import PanelService
+from src.services.catalog_cache import (
+    catalog_cache, CATEGORIES, CATEGORY_PANELS, PRODUCTS, PANELS, EXTRA_VOLUME
+)
 
 # Setup logging
 logging.basicConfig(
@@ -15,6 +18,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Values used when a setter creates the extra volume settings row of a category
+EXTRA_VOLUME_DEFAULTS = {
+    'price_per_gb': 10000,  # 10,000 tomans
+    'min_volume': 1,
+    'max_volume': 100,
+    'is_enabled': True
+}
+
 class ShopService:
     """Service for shop module operations"""
     
@@ -34,45 +45,51 @@ class ShopService:
             int: ID of the new category
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Convert inbound_ports list to JSON string
-            inbound_ports_json = json.dumps(inbound_ports)
-            
-            # Insert new category
-            query = """
-                INSERT INTO categories (name, description, inbound_ports)
-                VALUES (%s, %s, %s)
-            """
-            values = (name, description, inbound_ports_json)
-            
-            cursor.execute(query, values)
-            conn.commit()
-            
-            # Get the ID of the newly inserted category
-            category_id = cursor.lastrowid
-            
-            # Add relationships to category_panel table
-            if panel_ids:
-                for panel_id in panel_ids:
-                    query = """
-                        INSERT INTO category_panel (category_id, panel_id)
-                        VALUES (%s, %s)
-                    """
-                    cursor.execute(query, (category_id, panel_id))
+            # Category and its panel links are created together or not at all
+            with db_transaction() as cursor:
+                # Convert inbound_ports list to JSON string
+                inbound_ports_json = json.dumps(inbound_ports)
                 
-                conn.commit()
-            
-            cursor.close()
-            conn.close()
+                # Insert new category
+                query = """
+                    INSERT INTO categories (name, description, inbound_ports)
+                    VALUES (%s, %s, %s)
+                """
+                values = (name, description, inbound_ports_json)
+                
+                cursor.execute(query, values)
+                
+                # Get the ID of the newly inserted category
+                category_id = cursor.lastrowid
+                
+                # Add relationships to category_panel table
+                self._insert_category_panels(cursor, category_id, panel_ids)
             
+            catalog_cache.invalidate(CATEGORIES)
+            catalog_cache.invalidate(CATEGORY_PANELS, category_id)
             return category_id
             
         except mysql.connector.Error as e:
             logger.error(f"Database error in add_category: {e}")
             raise
     
+    def _insert_category_panels(self, cursor, category_id, panel_ids):
+        """Link a category to panels with one multi-row INSERT
+        
+        Args:
+            cursor: Cursor of the surrounding transaction
+            category_id (int): Category ID
+            panel_ids (list): List of panel IDs
+        """
+        if not panel_ids:
+            return
+        query = """
+            INSERT INTO category_panel (category_id, panel_id)
+            VALUES (%s, %s)
+        """
+        # executemany sends a single INSERT with all value rows
+        cursor.executemany(query, [(category_id, panel_id) for panel_id in dict.fromkeys(panel_ids)])
+    
     def get_all_panels(self):
         """Get all active panels
         
@@ -80,10 +97,18 @@ class ShopService:
             list: List of panel dictionaries
         """
         try:
-            logger.info("Getting panels directly from database")
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
+            return catalog_cache.get_or_load(PANELS, 'active', self._load_active_panels)
+        except Exception as e:
+            logger.error(f"Error in get_all_panels: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            # Return empty list but not None
+            return []
+    
+    def _load_active_panels(self):
+        """Query active panels from the database"""
+        logger.info("Getting panels directly from database")
+        with db_cursor(dictionary=True) as cursor:
             query = """
                 SELECT id, name, url, username, password, status 
                 FROM panels 
@@ -92,146 +117,49 @@ class ShopService:
             """
             cursor.execute(query)
             panels = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
-            logger.info(f"Found {len(panels)} panels in database")
-            if len(panels) == 0:
-                logger.warning("No panels found in database!")
-            else:
-                # Log first panel details for debugging
-                logger.info(f"First panel details: {panels[0]}")
-            
-            # Ensure each panel has all required fields
-            for i, panel in enumerate(panels):
-                # Ensure 'id' exists and is an integer
-                if 'id' not in panel:
-                    logger.warning(f"Panel at index {i} missing 'id' field")
-                    panel['id'] = i + 1
-                
-                # Ensure 'name' exists
-                if 'name' not in panel or not panel['name']:
-                    logger.warning(f"Panel at index {i} missing or empty 'name' field")
-                    panel['name'] = f"Panel {panel.get('id', i+1)}"
-            
-            return panels
-        except Exception as e:
-            logger.error(f"Error in get_all_panels: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-            # Return empty list but not None
-            return []
-    
-    def get_panel_inbounds(self, panel):
-        """Get all inbounds from a panel
         
-        Args:
-            panel (dict): Panel dictionary with id, url, username, password
-            
-        Returns:
-            list: List of inbound dictionaries
-        """
-        try:
-            # Build URL for API call
-            url = panel['url']
-            # Ensure URL has http:// or https:// prefix
-            if not url.startswith(('http://', 'https://')):
-                url = 'http://' + url
-                
-            # Append API path
-            url = url.rstrip('/') + '/panel/api/inbounds/list'
-            
-            logger.info(f"Getting inbounds for panel {panel['id']} from URL: {url}")
-            
-            # Set up cookies with session info
-            cookies = self._login_and_get_cookies(panel)
-            if not cookies:
-                logger.warning(f"Failed to login to panel {panel['name']}")
-                return []
-            
-            # Make API request
-            response = requests.get(url, cookies=cookies, timeout=10)
-            
-            # Check response status
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Check if response has inbounds data
-                if 'obj' in result:
-                    inbounds = result['obj']
-                    logger.info(f"Found {len(inbounds)} inbounds for panel {panel['id']}")
-                    return inbounds
-                else:
-                    logger.warning(f"No 'obj' field in response for panel {panel['id']}")
-                    return []
-            else:
-                logger.error(f"Error getting inbounds for panel {panel['id']}: status code {response.status_code}")
-                return []
-                
-        except Exception as e:
-            logger.error(f"Error getting inbounds for panel {panel.get('id', 'unknown')}: {str(e)}")
-            return []
+        logger.info(f"Found {len(panels)} panels in database")
+        if len(panels) == 0:
+            logger.warning("No panels found in database!")
+        else:
+            # Log first panel details for debugging
+            logger.info(f"First panel details: {panels[0]}")
+        
+        # Ensure each panel has all required fields
+        for i, panel in enumerate(panels):
+            # Ensure 'id' exists and is an integer
+            if 'id' not in panel:
+                logger.warning(f"Panel at index {i} missing 'id' field")
+                panel['id'] = i + 1
+            
+            # Ensure 'name' exists
+            if 'name' not in panel or not panel['name']:
+                logger.warning(f"Panel at index {i} missing or empty 'name' field")
+                panel['name'] = f"Panel {panel.get('id', i+1)}"
+        
+        return panels
     
-    def _login_and_get_cookies(self, panel):
-        """Log in to panel and get cookies
+    def get_panels_page(self, after_id=None, before_id=None, limit=PAGE_SIZE):
+        """Get one page of active panels ordered by id
         
         Args:
-            panel (dict): Panel dictionary with url, username, password
+            after_id (int, optional): Page after this panel id
+            before_id (int, optional): Page before this panel id
+            limit (int): Panels per page
             
         Returns:
-            dict: Cookies from successful login or None if login failed
+            Page: Panels of the page (empty page on error)
         """
         try:
-            # Build login URL
-            url = panel['url']
-            # Ensure URL has http:// or https:// prefix
-            if not url.startswith(('http://', 'https://')):
-                url = 'http://' + url
-            
-            # Get panel type, defaulting to 3x-ui if not specified
-            panel_type = panel.get('panel_type', '3x-ui')
-            
-            # Append login path based on panel type
-            if panel_type == '3x-ui':
-                login_url = url.rstrip('/') + '/login'
-            elif panel_type == 'marzban':
-                # For marzban, the login endpoint will be handled differently
-                # We'll implement this in the future
-                logger.warning("Marzban panel type not fully implemented yet")
-                login_url = url.rstrip('/') + '/api/admin/token'
-            else:
-                # Default to 3x-ui behavior
-                login_url = url.rstrip('/') + '/login'
-            
-            # Prepare login payload
-            payload = {
-                'username': panel['username'],
-                'password': panel['password']
-            }
-            
-            logger.info(f"Logging in to panel {panel['id']} at URL: {login_url}")
-            
-            # Send login request
-            session = requests.Session()
-            response = session.post(login_url, data=payload, timeout=10)
-            
-            # Check if login was successful
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    if 'success' in result and result['success'] is True:
-                        logger.info(f"Login successful for panel {panel['id']}")
-                        return session.cookies.get_dict()
-                except Exception as e:
-                    logger.error(f"Error parsing login response for panel {panel['id']}: {e}")
-            
-            logger.warning(f"Login failed for panel {panel['id']} with status code {response.status_code}")
-            return None
-            
-        except Exception as e:
-            logger.error(f"Login error for panel {panel.get('id', 'unknown')}: {str(e)}")
-            return None
+            with db_cursor(dictionary=True) as cursor:
+                return fetch_keyset_page(
+                    cursor,
+                    "SELECT id, name FROM panels WHERE (status = 'active' OR status IS NULL)",
+                    after_id=after_id, before_id=before_id, limit=limit
+                )
+        except mysql.connector.Error as e:
+            logger.error(f"Database error in get_panels_page: {e}")
+            return Page()
     
     def get_all_categories(self):
         """Get all categories
@@ -240,32 +168,81 @@ class ShopService:
             list: List of category dictionaries
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
+            return catalog_cache.get_or_load(CATEGORIES, 'all', self._load_all_categories)
+        
+        except mysql.connector.Error as e:
+            logger.error(f"Database error in get_all_categories: {e}")
+            return []
+    
+    def _load_all_categories(self):
+        """Query all categories and parse their inbound_ports"""
+        with db_cursor(dictionary=True) as cursor:
             query = "SELECT * FROM categories ORDER BY name"
             cursor.execute(query)
             
             categories = cursor.fetchall()
-            
-            # Parse JSON inbound_ports for each category
-            for category in categories:
-                if category.get('inbound_ports'):
-                    try:
-                        category['inbound_ports'] = json.loads(category['inbound_ports'])
-                    except:
-                        category['inbound_ports'] = []
-                else:
+        
+        # Parse JSON inbound_ports for each category
+        for category in categories:
+            if category.get('inbound_ports'):
+                try:
+                    category['inbound_ports'] = json.loads(category['inbound_ports'])
+                except:
                     category['inbound_ports'] = []
+            else:
+                category['inbound_ports'] = []
+        
+        return categories
+    
+    def get_categories_page(self, after_id=None, before_id=None, limit=PAGE_SIZE):
+        """Get one page of categories ordered by id
+        
+        Args:
+            after_id (int, optional): Page after this category id
+            before_id (int, optional): Page before this category id
+            limit (int): Categories per page
+            
+        Returns:
+            Page: Categories of the page (empty page on error)
+        """
+        try:
+            with db_cursor(dictionary=True) as cursor:
+                return fetch_keyset_page(
+                    cursor, "SELECT id, name FROM categories WHERE 1 = 1",
+                    after_id=after_id, before_id=before_id, limit=limit
+                )
+        except mysql.connector.Error as e:
+            logger.error(f"Database error in get_categories_page: {e}")
+            return Page()
+    
+    def get_category_by_id(self, category_id):
+        """Get a category by its ID
+        
+        Args:
+            category_id (int): Category ID
             
-            cursor.close()
-            conn.close()
+        Returns:
+            dict: Category dictionary or None if not found
+        """
+        def load():
+            with db_cursor(dictionary=True) as cursor:
+                query = "SELECT * FROM categories WHERE id = %s"
+                cursor.execute(query, (category_id,))
+                category = cursor.fetchone()
             
-            return categories
+            if category:
+                try:
+                    category['inbound_ports'] = json.loads(category['inbound_ports'] or '[]')
+                except (TypeError, ValueError):
+                    category['inbound_ports'] = []
+            return category
+        
+        try:
+            return catalog_cache.get_or_load(CATEGORIES, ('id', category_id), load)
             
         except mysql.connector.Error as e:
-            logger.error(f"Database error in get_all_categories: {e}")
-            return []
+            logger.error(f"Database error in get_category_by_id: {e}")
+            return None
     
     def get_category_panels(self, category_id):
         """Get all panels related to a category
@@ -276,23 +253,19 @@ class ShopService:
         Returns:
             list: List of panel dictionaries
         """
+        def load():
+            with db_cursor(dictionary=True) as cursor:
+                query = """
+                    SELECT p.* FROM panels p
+                    JOIN category_panel cp ON p.id = cp.panel_id
+                    WHERE cp.category_id = %s
+                """
+                cursor.execute(query, (category_id,))
+                return cursor.fetchall()
+        
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT p.* FROM panels p
-                JOIN category_panel cp ON p.id = cp.panel_id
-                WHERE cp.category_id = %s
-            """
-            cursor.execute(query, (category_id,))
-            panels = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
-            
-            return panels
-            
+            return catalog_cache.get_or_load(CATEGORY_PANELS, category_id, load)
+        
         except mysql.connector.Error as e:
             logger.error(f"Database error in get_category_panels: {e}")
             return []
@@ -307,18 +280,13 @@ class ShopService:
             bool: True if successful, False otherwise
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Note: Due to ON DELETE CASCADE, associated records in category_panel 
-            # will be automatically deleted
-            query = "DELETE FROM categories WHERE id = %s"
-            cursor.execute(query, (category_id,))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                # Note: Due to ON DELETE CASCADE, associated records in category_panel 
+                # will be automatically deleted
+                query = "DELETE FROM categories WHERE id = %s"
+                cursor.execute(query, (category_id,))
             
+            self._invalidate_categories()
             return True
             
         except mysql.connector.Error as e:
@@ -338,23 +306,18 @@ class ShopService:
             return {"success": False, "count": 0, "message": "هیچ دسته‌بندی برای حذف انتخاب نشده است"}
             
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Format placeholders for SQL query based on number of IDs
-            placeholders = ','.join(['%s'] * len(category_ids))
-            query = f"DELETE FROM categories WHERE id IN ({placeholders})"
-            
-            # Execute the query
-            cursor.execute(query, tuple(category_ids))
-            
-            # Get count of affected rows
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                # Format placeholders for SQL query based on number of IDs
+                placeholders = ','.join(['%s'] * len(category_ids))
+                query = f"DELETE FROM categories WHERE id IN ({placeholders})"
+                
+                # Execute the query
+                cursor.execute(query, tuple(category_ids))
+                
+                # Get count of affected rows
+                deleted_count = cursor.rowcount
             
+            self._invalidate_categories()
             return {
                 "success": True,
                 "count": deleted_count,
@@ -365,30 +328,35 @@ class ShopService:
             logger.error(f"Database error in delete_multiple_categories: {e}")
             return {"success": False, "count": 0, "message": f"خطا در حذف دسته‌بندی‌ها: {str(e)}"}
     
+    def _invalidate_categories(self):
+        """Drop cached data that depends on the categories table
+        
+        Deleting a category cascades to its panel links and extra volume
+        settings and detaches its products.
+        """
+        for namespace in (CATEGORIES, CATEGORY_PANELS, PRODUCTS, EXTRA_VOLUME):
+            catalog_cache.invalidate(namespace)
+    
     def get_all_products(self):
         """Get all products with their categories
         
         Returns:
             list: List of product dictionaries with category information
         """
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT p.*, IFNULL(c.name, 'بدون دسته‌بندی') as category_name
-                FROM products p
-                LEFT JOIN categories c ON p.category_id = c.id
-                ORDER BY p.name
-            """
-            cursor.execute(query)
-            
-            products = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
+        def load():
+            with db_cursor(dictionary=True) as cursor:
+                query = """
+                    SELECT p.*, IFNULL(c.name, 'بدون دسته‌بندی') as category_name
+                    FROM products p
+                    LEFT JOIN categories c ON p.category_id = c.id
+                    ORDER BY p.name
+                """
+                cursor.execute(query)
+                
+                return cursor.fetchall()
             
-            return products
+        try:
+            return catalog_cache.get_or_load(PRODUCTS, 'all', load)
             
         except mysql.connector.Error as e:
             logger.error(f"Database error in get_all_products: {e}")
@@ -404,16 +372,11 @@ class ShopService:
             bool: True if successful, False otherwise
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            query = "DELETE FROM products WHERE id = %s"
-            cursor.execute(query, (product_id,))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                query = "DELETE FROM products WHERE id = %s"
+                cursor.execute(query, (product_id,))
             
+            catalog_cache.invalidate(PRODUCTS)
             return True
             
         except mysql.connector.Error as e:
@@ -433,33 +396,28 @@ class ShopService:
             return {"success": False, "count": 0, "message": "هیچ محصولی برای حذف انتخاب نشده است"}
             
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # قبل از حذف، بررسی می‌کنیم که آیا سفارش‌های مرتبط وجود دارند
-            orders_count = 0
-            query = "SELECT COUNT(*) FROM orders WHERE product_id IN ({})".format(
-                ','.join(['%s'] * len(product_ids))
-            )
-            cursor.execute(query, tuple(product_ids))
-            result = cursor.fetchone()
-            if result and result[0] > 0:
-                orders_count = result[0]
-            
-            # Format placeholders for SQL query based on number of IDs
-            placeholders = ','.join(['%s'] * len(product_ids))
-            query = f"DELETE FROM products WHERE id IN ({placeholders})"
-            
-            # Execute the query
-            cursor.execute(query, tuple(product_ids))
-            
-            # Get count of affected rows
-            deleted_count = cursor.rowcount
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                # قبل از حذف، بررسی می‌کنیم که آیا سفارش‌های مرتبط وجود دارند
+                orders_count = 0
+                query = "SELECT COUNT(*) FROM orders WHERE product_id IN ({})".format(
+                    ','.join(['%s'] * len(product_ids))
+                )
+                cursor.execute(query, tuple(product_ids))
+                result = cursor.fetchone()
+                if result and result[0] > 0:
+                    orders_count = result[0]
+                
+                # Format placeholders for SQL query based on number of IDs
+                placeholders = ','.join(['%s'] * len(product_ids))
+                query = f"DELETE FROM products WHERE id IN ({placeholders})"
+                
+                # Execute the query
+                cursor.execute(query, tuple(product_ids))
+                
+                # Get count of affected rows
+                deleted_count = cursor.rowcount
             
+            catalog_cache.invalidate(PRODUCTS)
             message = f"{deleted_count} محصول با موفقیت حذف شد"
             
             # اگر سفارش مرتبط وجود داشته باشد، به کاربر اطلاع می‌دهیم
@@ -508,27 +466,22 @@ class ShopService:
                 logger.error(f"Error converting parameters in add_product: {e}")
                 raise ValueError(f"خطا در تبدیل پارامترها: {e}")
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Insert new product
-            query = """
-                INSERT INTO products (name, data_limit, price, category_id, duration, users_limit, status)
-                VALUES (%s, %s, %s, %s, %s, %s, 'active')
-            """
-            values = (name, data_limit, price, category_id, duration, users_limit)
-            
-            logger.info(f"Adding product with values: {values}")
-            
-            cursor.execute(query, values)
-            conn.commit()
-            
-            # Get the ID of the newly inserted product
-            product_id = cursor.lastrowid
-            
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                # Insert new product
+                query = """
+                    INSERT INTO products (name, data_limit, price, category_id, duration, users_limit, status)
+                    VALUES (%s, %s, %s, %s, %s, %s, 'active')
+                """
+                values = (name, data_limit, price, category_id, duration, users_limit)
+                
+                logger.info(f"Adding product with values: {values}")
+                
+                cursor.execute(query, values)
+                
+                # Get the ID of the newly inserted product
+                product_id = cursor.lastrowid
             
+            catalog_cache.invalidate(PRODUCTS)
             return product_id
             
         except mysql.connector.Error as e:
@@ -551,23 +504,19 @@ class ShopService:
         Returns:
             list: List of product dictionaries without category
         """
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT * FROM products 
-                WHERE category_id IS NULL
-                ORDER BY name
-            """
-            cursor.execute(query)
-            
-            products = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
+        def load():
+            with db_cursor(dictionary=True) as cursor:
+                query = """
+                    SELECT * FROM products 
+                    WHERE category_id IS NULL
+                    ORDER BY name
+                """
+                cursor.execute(query)
+                
+                return cursor.fetchall()
             
-            return products
+        try:
+            return catalog_cache.get_or_load(PRODUCTS, 'uncategorized', load)
             
         except mysql.connector.Error as e:
             logger.error(f"Database error in get_uncategorized_products: {e}")
@@ -582,24 +531,20 @@ class ShopService:
         Returns:
             dict: Product dictionary with category information or None if not found
         """
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT p.*, IFNULL(c.name, 'بدون دسته‌بندی') as category_name
-                FROM products p
-                LEFT JOIN categories c ON p.category_id = c.id
-                WHERE p.id = %s
-            """
-            cursor.execute(query, (product_id,))
-            
-            product = cursor.fetchone()
-            
-            cursor.close()
-            conn.close()
+        def load():
+            with db_cursor(dictionary=True) as cursor:
+                query = """
+                    SELECT p.*, IFNULL(c.name, 'بدون دسته‌بندی') as category_name
+                    FROM products p
+                    LEFT JOIN categories c ON p.category_id = c.id
+                    WHERE p.id = %s
+                """
+                cursor.execute(query, (product_id,))
+                
+                return cursor.fetchone()
             
-            return product
+        try:
+            return catalog_cache.get_or_load(PRODUCTS, ('id', product_id), load)
             
         except mysql.connector.Error as e:
             logger.error(f"Database error in get_product_by_id: {e}")
@@ -638,27 +583,22 @@ class ShopService:
                 logger.error(f"Error converting parameters in update_product: {e}")
                 raise ValueError(f"خطا در تبدیل پارامترها: {e}")
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Update product
-            query = """
-                UPDATE products 
-                SET name = %s, data_limit = %s, price = %s, category_id = %s, duration = %s, users_limit = %s
-                WHERE id = %s
-            """
-            values = (name, data_limit, price, category_id, duration, users_limit, product_id)
-            
-            logger.info(f"Updating product {product_id} with values: {values}")
-            
-            cursor.execute(query, values)
-            conn.commit()
-            
-            affected_rows = cursor.rowcount
-            
-            cursor.close()
-            conn.close()
+            with db_cursor() as cursor:
+                # Update product
+                query = """
+                    UPDATE products 
+                    SET name = %s, data_limit = %s, price = %s, category_id = %s, duration = %s, users_limit = %s
+                    WHERE id = %s
+                """
+                values = (name, data_limit, price, category_id, duration, users_limit, product_id)
+                
+                logger.info(f"Updating product {product_id} with values: {values}")
+                
+                cursor.execute(query, values)
+                
+                affected_rows = cursor.rowcount
             
+            catalog_cache.invalidate(PRODUCTS)
             return affected_rows > 0
             
         except mysql.connector.Error as e:
@@ -685,22 +625,18 @@ class ShopService:
         Returns:
             dict: Extra volume settings or None if not found
         """
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT id, category_id, price_per_gb, min_volume, max_volume, is_enabled
-                FROM extra_volume_settings
-                WHERE category_id = %s
-            """
-            cursor.execute(query, (category_id,))
-            settings = cursor.fetchone()
-            
-            cursor.close()
-            conn.close()
+        def load():
+            with db_cursor(dictionary=True) as cursor:
+                query = """
+                    SELECT id, category_id, price_per_gb, min_volume, max_volume, is_enabled
+                    FROM extra_volume_settings
+                    WHERE category_id = %s
+                """
+                cursor.execute(query, (category_id,))
+                return cursor.fetchone()
             
-            return settings
+        try:
+            return catalog_cache.get_or_load(EXTRA_VOLUME, category_id, load)
             
         except mysql.connector.Error as e:
             logger.error(f"Database error in get_extra_volume_settings: {e}")
@@ -720,79 +656,80 @@ class ShopService:
             bool: True if successful, False otherwise
         """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Check if settings already exist for this category
-            check_query = """
-                SELECT id FROM extra_volume_settings WHERE category_id = %s
-            """
-            cursor.execute(check_query, (category_id,))
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Update existing settings
-                query = """
-                    UPDATE extra_volume_settings
-                    SET price_per_gb = %s, min_volume = %s, max_volume = %s, is_enabled = %s
-                    WHERE category_id = %s
-                """
-                cursor.execute(query, (price_per_gb, min_volume, max_volume, is_enabled, category_id))
-            else:
-                # Create new settings
+            with db_cursor() as cursor:
+                # Single atomic upsert on the unique category_id
                 query = """
                     INSERT INTO extra_volume_settings 
                     (category_id, price_per_gb, min_volume, max_volume, is_enabled)
                     VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        price_per_gb = VALUES(price_per_gb),
+                        min_volume = VALUES(min_volume),
+                        max_volume = VALUES(max_volume),
+                        is_enabled = VALUES(is_enabled)
                 """
                 cursor.execute(query, (category_id, price_per_gb, min_volume, max_volume, is_enabled))
             
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
+            catalog_cache.invalidate(EXTRA_VOLUME, category_id)
             return True
             
         except mysql.connector.Error as e:
             logger.error(f"Database error in create_or_update_extra_volume_settings: {e}")
             return False
     
-    def set_extra_volume_price(self, category_id, price_per_gb):
-        """Set the price per GB for extra volume
+    def _set_extra_volume_field(self, category_id, field, value):
+        """Set one extra volume setting in a single statement
+        
+        Updates only the given field if the category already has settings;
+        otherwise inserts a row with defaults for the other fields.
         
         Args:
             category_id (int): Category ID
-            price_per_gb (int): Price per gigabyte
+            field (str): Column name, one of EXTRA_VOLUME_DEFAULTS
+            value: New value
             
         Returns:
             bool: True if successful, False otherwise
         """
+        if field not in EXTRA_VOLUME_DEFAULTS:
+            raise ValueError(f"Unknown extra volume setting: {field}")
+        
+        values = dict(EXTRA_VOLUME_DEFAULTS, **{field: value})
         try:
-            settings = self.get_extra_volume_settings(category_id)
-            
-            if settings:
-                # Update existing settings
-                return self.create_or_update_extra_volume_settings(
+            with db_cursor() as cursor:
+                query = f"""
+                    INSERT INTO extra_volume_settings 
+                    (category_id, price_per_gb, min_volume, max_volume, is_enabled)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE {field} = VALUES({field})
+                """
+                cursor.execute(query, (
                     category_id,
-                    price_per_gb,
-                    settings['min_volume'],
-                    settings['max_volume'],
-                    settings['is_enabled']
-                )
-            else:
-                # Create new settings with defaults
-                return self.create_or_update_extra_volume_settings(
-                    category_id, 
-                    price_per_gb, 
-                    1,  # Default min volume
-                    100,  # Default max volume
-                    True  # Enabled by default
-                )
-                
-        except Exception as e:
-            logger.error(f"Error in set_extra_volume_price: {e}")
+                    values['price_per_gb'],
+                    values['min_volume'],
+                    values['max_volume'],
+                    values['is_enabled']
+                ))
+            
+            catalog_cache.invalidate(EXTRA_VOLUME, category_id)
+            return True
+            
+        except mysql.connector.Error as e:
+            logger.error(f"Database error setting extra volume {field}: {e}")
             return False
     
+    def set_extra_volume_price(self, category_id, price_per_gb):
+        """Set the price per GB for extra volume
+        
+        Args:
+            category_id (int): Category ID
+            price_per_gb (int): Price per gigabyte
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        return self._set_extra_volume_field(category_id, 'price_per_gb', price_per_gb)
+    
     def set_extra_volume_min(self, category_id, min_volume):
         """Set the minimum volume that can be purchased
         
@@ -803,31 +740,7 @@ class ShopService:
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            settings = self.get_extra_volume_settings(category_id)
-            
-            if settings:
-                # Update existing settings
-                return self.create_or_update_extra_volume_settings(
-                    category_id,
-                    settings['price_per_gb'],
-                    min_volume,
-                    settings['max_volume'],
-                    settings['is_enabled']
-                )
-            else:
-                # Create new settings with defaults
-                return self.create_or_update_extra_volume_settings(
-                    category_id, 
-                    10000,  # Default price (10,000 tomans)
-                    min_volume, 
-                    100,  # Default max volume
-                    True  # Enabled by default
-                )
-                
-        except Exception as e:
-            logger.error(f"Error in set_extra_volume_min: {e}")
-            return False
+        return self._set_extra_volume_field(category_id, 'min_volume', min_volume)
     
     def set_extra_volume_max(self, category_id, max_volume):
         """Set the maximum volume that can be purchased
@@ -839,31 +752,7 @@ class ShopService:
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            settings = self.get_extra_volume_settings(category_id)
-            
-            if settings:
-                # Update existing settings
-                return self.create_or_update_extra_volume_settings(
-                    category_id,
-                    settings['price_per_gb'],
-                    settings['min_volume'],
-                    max_volume,
-                    settings['is_enabled']
-                )
-            else:
-                # Create new settings with defaults
-                return self.create_or_update_extra_volume_settings(
-                    category_id, 
-                    10000,  # Default price (10,000 tomans)
-                    1,  # Default min volume
-                    max_volume,
-                    True  # Enabled by default
-                )
-            
-        except Exception as e:
-            logger.error(f"Error in set_extra_volume_max: {e}")
-            return False
+        return self._set_extra_volume_field(category_id, 'max_volume', max_volume)
     
     def set_extra_volume_enabled(self, category_id, is_enabled):
         """Set whether extra volume purchase is enabled for a category
@@ -875,31 +764,7 @@ class ShopService:
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            settings = self.get_extra_volume_settings(category_id)
-            
-            if settings:
-                # Update existing settings
-                return self.create_or_update_extra_volume_settings(
-                    category_id,
-                    settings['price_per_gb'],
-                    settings['min_volume'],
-                    settings['max_volume'],
-                    is_enabled
-                )
-            else:
-                # Create new settings with defaults
-                return self.create_or_update_extra_volume_settings(
-                    category_id, 
-                    10000,  # Default price (10,000 tomans)
-                    1,  # Default min volume
-                    100,  # Default max volume
-                    is_enabled
-                )
-            
-        except Exception as e:
-            logger.error(f"Error in set_extra_volume_enabled: {e}")
-            return False
+        return self._set_extra_volume_field(category_id, 'is_enabled', is_enabled)
     
     def get_products_by_category(self, category_id):
         """Get products by category ID
@@ -910,25 +775,43 @@ class ShopService:
         Returns:
             list: List of products in the category
         """
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT p.*
-                FROM products p
-                WHERE p.category_id = %s
-                ORDER BY p.name
-            """
-            cursor.execute(query, (category_id,))
-            
-            products = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
+        def load():
+            with db_cursor(dictionary=True) as cursor:
+                query = """
+                    SELECT p.*
+                    FROM products p
+                    WHERE p.category_id = %s
+                    ORDER BY p.name
+                """
+                cursor.execute(query, (category_id,))
+                
+                return cursor.fetchall()
             
-            return products
+        try:
+            return catalog_cache.get_or_load(PRODUCTS, ('category', category_id), load)
             
         except mysql.connector.Error as e:
             logger.error(f"Database error in get_products_by_category: {e}")
-            return [] 
\ No newline at end of file
+            return []
+    
+    def get_products_page(self, category_id, after_id=None, before_id=None, limit=PAGE_SIZE):
+        """Get one page of the products of a category ordered by id
+        
+        Args:
+            category_id (int): Category ID
+            after_id (int, optional): Page after this product id
+            before_id (int, optional): Page before this product id
+            limit (int): Products per page
+            
+        Returns:
+            Page: Products of the page (empty page on error)
+        """
+        try:
+            with db_cursor(dictionary=True) as cursor:
+                return fetch_keyset_page(
+                    cursor, "SELECT id, name FROM products WHERE category_id = %s", (category_id,),
+                    after_id=after_id, before_id=before_id, limit=limit
+                )
+        except mysql.connector.Error as e:
+            logger.error(f"Database error in get_products_page: {e}")
+            return Page()
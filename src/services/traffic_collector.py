@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import asyncio
+import logging
+
+from src.services.async_service import AsyncService
+from src.services.expiry_scheduler import expiry_scheduler
+from src.services.shop_service import ShopService
+from src.services.traffic_service import TrafficService
+from src.services.xui_client import xui_clients
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def counter_delta(current, last):
+    """Bytes used since the last reading; a counter that went down was reset on the panel"""
+    return current - last if current >= last else current
+
+
+class TrafficCollector:
+    """Meters the traffic of all clients of all active panels
+
+    Every ``interval`` seconds the inbounds list of each panel is read (one
+    request per panel, the client counters are part of its payload) and
+    compared with the counters of the previous sweep, which are kept in
+    memory together with the running totals. Only clients whose counters
+    moved produce a usage row; all rows of a sweep are written in batched
+    inserts in one transaction. The in-memory counters are advanced only
+    after the write succeeded, so a failed write is retried with the same
+    deltas by the next sweep.
+
+    Args:
+        interval (float): Seconds between two sweeps (0 disables the job)
+        concurrency (int): Panels queried at the same time
+        panel_timeout (float): Deadline for one panel in seconds
+        batch_size (int): Rows per INSERT statement
+    """
+
+    def __init__(self, interval=60, concurrency=5, panel_timeout=15, batch_size=1000):
+        self.interval = interval
+        self.concurrency = concurrency
+        self.panel_timeout = panel_timeout
+        self.batch_size = batch_size
+        self.traffic_service = AsyncService(TrafficService())
+        self.shop_service = AsyncService(ShopService())
+        # panel_id -> email -> (up, down, total_up, total_down); loaded from the database on the first sweep
+        self._counters = None
+        self._task = None
+        self._stats = {'sweeps': 0, 'failed_panels': 0, 'usage_rows': 0, 'last_sweep_seconds': 0.0}
+
+    async def _load_counters(self):
+        counters = {}
+        for (panel_id, email), values in (await self.traffic_service.load_counters()).items():
+            counters.setdefault(panel_id, {})[email] = values
+        self._counters = counters
+
+    async def _read_panel(self, panel):
+        inbounds = await xui_clients.get(panel).list_inbounds()
+        # The same payload carries the client settings: keep their deadlines current
+        expiry_scheduler.schedule_inbounds(panel['id'], inbounds)
+        return [(inbound.id, stat) for inbound in inbounds for stat in inbound.client_stats]
+
+    async def read_panels(self, panels):
+        """Read the client counters of several panels concurrently
+
+        Returns:
+            dict: panel_id -> list of (inbound_id, ClientTraffic) for the panels that answered
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def read(panel):
+            async with semaphore:
+                return await asyncio.wait_for(self._read_panel(panel), timeout=self.panel_timeout)
+
+        results = await asyncio.gather(*(read(panel) for panel in panels), return_exceptions=True)
+
+        stats_by_panel = {}
+        for panel, result in zip(panels, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to read client traffic of panel {panel['id']} ({panel['name']}): {result!r}")
+                self._stats['failed_panels'] += 1
+            else:
+                stats_by_panel[panel['id']] = result
+        return stats_by_panel
+
+    def compute_usage(self, stats_by_panel):
+        """Compare fresh counters with the previous sweep
+
+        Returns:
+            tuple: (usage rows, counter rows, dict of panel_id -> new in-memory counters)
+        """
+        usage = []
+        counter_rows = []
+        new_counters = {}
+        for panel_id, client_stats in stats_by_panel.items():
+            previous = self._counters.get(panel_id, {})
+            current = new_counters[panel_id] = {}
+            for inbound_id, stat in client_stats:
+                last = previous.get(stat.email)
+                last_up, last_down, total_up, total_down = last or (0, 0, 0, 0)
+                up_delta = counter_delta(stat.up, last_up)
+                down_delta = counter_delta(stat.down, last_down)
+                values = (stat.up, stat.down, total_up + up_delta, total_down + down_delta)
+                current[stat.email] = values
+                if up_delta or down_delta:
+                    usage.append((panel_id, stat.email, up_delta, down_delta))
+                if values != last:
+                    counter_rows.append((panel_id, stat.email, inbound_id) + values)
+        return usage, counter_rows, new_counters
+
+    async def sweep(self):
+        """Meter all active panels once"""
+        started = time.monotonic()
+        if self._counters is None:
+            await self._load_counters()
+
+        panels = await self.shop_service.get_all_panels()
+        stats_by_panel = await self.read_panels(panels)
+        usage, counter_rows, new_counters = self.compute_usage(stats_by_panel)
+
+        if counter_rows:
+            await self.traffic_service.record_usage(usage, counter_rows, self.batch_size)
+        # Clients that disappeared from a panel that answered are forgotten
+        self._counters.update(new_counters)
+        for panel_id, email, _, _ in usage:
+            up, down = new_counters[panel_id][email][:2]
+            expiry_scheduler.check_quota(panel_id, email, up + down)
+
+        self._stats['sweeps'] += 1
+        self._stats['usage_rows'] += len(usage)
+        self._stats['last_sweep_seconds'] = round(time.monotonic() - started, 3)
+        logger.info(
+            f"Traffic sweep finished: {len(stats_by_panel)}/{len(panels)} panels, "
+            f"{sum(len(s) for s in stats_by_panel.values())} clients, {len(usage)} usage rows"
+        )
+
+    def start(self, application):
+        """Run the periodic sweep in the background"""
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = application.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic sweep"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Error collecting client traffic: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_totals(self, panel_id, email):
+        """Accumulated (up, down) usage of a client as of the last sweep, or None"""
+        values = (self._counters or {}).get(panel_id, {}).get(email)
+        return values[2:] if values else None
+
+    def stats(self):
+        """Get counters of the collector"""
+        clients = sum(len(c) for c in (self._counters or {}).values())
+        return dict(self._stats, clients=clients, interval=self.interval, running=self._task is not None)
+
+
+# Shared by the startup code
+traffic_collector = TrafficCollector(
+    interval=float(os.getenv('TRAFFIC_SYNC_INTERVAL', '60')),
+    concurrency=int(os.getenv('TRAFFIC_SYNC_CONCURRENCY', '5')),
+    panel_timeout=float(os.getenv('PANEL_INBOUNDS_TIMEOUT', '15')),
+    batch_size=int(os.getenv('TRAFFIC_BATCH_SIZE', '1000'))
+)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+
+from src.utils.db import db_cursor, db_transaction
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class TrafficService:
+    """Service for the client traffic counters and usage history"""
+
+    def load_counters(self):
+        """Read the last counters and totals of all clients
+
+        Returns:
+            dict: (panel_id, email) -> (up, down, total_up, total_down)
+        """
+        with db_cursor() as cursor:
+            cursor.execute("SELECT panel_id, email, up, down, total_up, total_down FROM client_traffic")
+            return {
+                (panel_id, email): (up, down, total_up, total_down)
+                for panel_id, email, up, down, total_up, total_down in cursor.fetchall()
+            }
+
+    def record_usage(self, usage, counters, batch_size=1000):
+        """Append usage rows and store the new counters in one transaction
+
+        Args:
+            usage (list): (panel_id, email, up_delta, down_delta) of clients whose counters moved
+            counters (list): (panel_id, email, inbound_id, up, down, total_up, total_down)
+                of the same clients and of clients seen for the first time
+            batch_size (int): Rows per INSERT statement
+        """
+        with db_transaction() as cursor:
+            # One NOW() for the whole sweep so its rows share a timestamp
+            cursor.execute("SELECT NOW()")
+            (recorded_at,) = cursor.fetchone()
+            for start in range(0, len(usage), batch_size):
+                cursor.executemany(
+                    """
+                    INSERT INTO client_usage (panel_id, email, up_delta, down_delta, recorded_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    [row + (recorded_at,) for row in usage[start:start + batch_size]]
+                )
+            for start in range(0, len(counters), batch_size):
+                cursor.executemany(
+                    """
+                    INSERT INTO client_traffic (panel_id, email, inbound_id, up, down, total_up, total_down)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        inbound_id = VALUES(inbound_id), up = VALUES(up), down = VALUES(down),
+                        total_up = VALUES(total_up), total_down = VALUES(total_down)
+                    """,
+                    counters[start:start + batch_size]
+                )
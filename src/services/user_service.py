@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import mysql.connector
+import logging
+
+from src.utils.db import db_cursor
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+class UserService:
+    """Service for bot users"""
+
+    def register_user(self, telegram_id, username=None):
+        """Add a user or refresh an existing one
+
+        A user who comes back after blocking the bot is marked active again.
+
+        Args:
+            telegram_id (int): Telegram user id
+            username (str, optional): Telegram username
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            with db_cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO users (telegram_id, username, is_active)
+                    VALUES (%s, %s, TRUE)
+                    ON DUPLICATE KEY UPDATE username = VALUES(username), is_active = TRUE
+                    """,
+                    (telegram_id, username)
+                )
+            return True
+        except mysql.connector.Error as e:
+            logger.error(f"Database error registering user {telegram_id}: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Error registering user {telegram_id}: {e}")
+            return False
+
+    def count_active_users(self):
+        """Get the number of users that can receive messages
+
+        Returns:
+            int: Number of active users
+        """
+        try:
+            with db_cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM users WHERE is_active = TRUE")
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error counting users: {e}")
+            return 0
@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+
+from src.services.circuit_breaker import CircuitBreaker
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Paths of the 3x-ui REST API (see api_endpoints.md)
+LOGIN_PATH = '/login'
+INBOUNDS_LIST_PATH = '/panel/api/inbounds/list'
+ADD_CLIENT_PATH = '/panel/api/inbounds/addClient'
+UPDATE_CLIENT_PATH = '/panel/api/inbounds/updateClient/{client_id}'
+DEL_CLIENT_PATH = '/panel/api/inbounds/{inbound_id}/delClient/{client_id}'
+CLIENT_TRAFFICS_PATH = '/panel/api/inbounds/getClientTraffics/{email}'
+RESET_CLIENT_TRAFFIC_PATH = '/panel/api/inbounds/{inbound_id}/resetClientTraffic/{email}'
+
+
+class XUIError(Exception):
+    """Error returned by or while talking to a 3x-ui panel
+
+    The message is suitable for showing to the admin in Telegram.
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class XUIAuthError(XUIError):
+    """The panel rejected the credentials"""
+
+
+class XUIConnectionError(XUIError):
+    """The panel could not be reached or did not answer in time"""
+
+
+class XUICircuitOpenError(XUIConnectionError):
+    """The panel failed repeatedly and is not contacted until its circuit breaker allows it"""
+
+
+def _parse_json_field(value, default):
+    """3x-ui returns settings objects as JSON strings"""
+    if isinstance(value, (dict, list)):
+        return value
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass
+class ApiResult:
+    """Generic 3x-ui API envelope"""
+    success: bool
+    msg: str = ''
+    obj: Any = None
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            success=bool(data.get('success')),
+            msg=data.get('msg') or '',
+            obj=data.get('obj')
+        )
+
+
+@dataclass
+class ClientTraffic:
+    """Traffic counters of one client"""
+    id: int
+    inbound_id: int
+    email: str
+    enable: bool = True
+    up: int = 0
+    down: int = 0
+    total: int = 0
+    expiry_time: int = 0
+    reset: int = 0
+
+    @property
+    def used(self):
+        """Uploaded plus downloaded bytes"""
+        return self.up + self.down
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data.get('id', 0),
+            inbound_id=data.get('inboundId', 0),
+            email=data.get('email', ''),
+            enable=bool(data.get('enable', True)),
+            up=data.get('up') or 0,
+            down=data.get('down') or 0,
+            total=data.get('total') or 0,
+            expiry_time=data.get('expiryTime') or 0,
+            reset=data.get('reset') or 0
+        )
+
+
+def client_key(protocol, client):
+    """Value 3x-ui identifies a client by in updateClient and delClient
+
+    Trojan clients are identified by their password, shadowsocks clients by
+    their email and all other protocols by their id.
+
+    Args:
+        protocol (str): Protocol of the inbound
+        client (dict): Client object as stored in the inbound settings
+    """
+    if protocol == 'trojan':
+        return client.get('password') or ''
+    if protocol == 'shadowsocks':
+        return client.get('email') or ''
+    return client.get('id') or ''
+
+
+@dataclass
+class InboundClient:
+    """Client entry of an inbound's settings
+
+    vmess/vless clients are identified by ``id``, trojan clients by
+    ``password`` and shadowsocks clients by ``email`` (with ``method`` and
+    ``password`` as credentials).
+    """
+    id: str
+    email: str
+    enable: bool = True
+    flow: str = ''
+    limit_ip: int = 0
+    total_gb: int = 0
+    expiry_time: int = 0
+    tg_id: str = ''
+    sub_id: str = ''
+    password: str = ''
+    method: str = ''
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data.get('id') or '',
+            email=data.get('email', ''),
+            enable=bool(data.get('enable', True)),
+            flow=data.get('flow') or '',
+            limit_ip=data.get('limitIp') or 0,
+            total_gb=data.get('totalGB') or 0,
+            expiry_time=data.get('expiryTime') or 0,
+            tg_id=str(data.get('tgId') or ''),
+            sub_id=data.get('subId') or '',
+            password=data.get('password') or '',
+            method=data.get('method') or ''
+        )
+
+    def to_api(self, protocol=None):
+        """Client object in the shape expected by addClient/updateClient
+
+        Args:
+            protocol (str, optional): Protocol of the inbound; selects the credential fields
+        """
+        data = {
+            'email': self.email,
+            'enable': self.enable,
+            'limitIp': self.limit_ip,
+            'totalGB': self.total_gb,
+            'expiryTime': self.expiry_time,
+            'tgId': self.tg_id,
+            'subId': self.sub_id
+        }
+        if protocol == 'trojan':
+            data['password'] = self.password
+        elif protocol == 'shadowsocks':
+            data['method'] = self.method
+            data['password'] = self.password
+        else:
+            data['id'] = self.id
+            data['flow'] = self.flow
+        return data
+
+    def key(self, protocol=None):
+        """Value the panel identifies this client by (see client_key)"""
+        return client_key(protocol, self.to_api(protocol))
+
+
+@dataclass
+class Inbound:
+    """Inbound as returned by the inbounds list endpoint"""
+    id: int
+    remark: str
+    protocol: str
+    port: int
+    enable: bool = True
+    up: int = 0
+    down: int = 0
+    total: int = 0
+    expiry_time: int = 0
+    tag: str = ''
+    listen: str = ''
+    settings: dict = field(default_factory=dict)
+    stream_settings: dict = field(default_factory=dict)
+    sniffing: dict = field(default_factory=dict)
+    client_stats: list = field(default_factory=list)
+
+    @property
+    def clients(self):
+        """Clients configured in the inbound settings"""
+        return [InboundClient.from_dict(c) for c in self.settings.get('clients', [])]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data.get('id', 0),
+            remark=data.get('remark') or '',
+            protocol=data.get('protocol') or '',
+            port=data.get('port', 0),
+            enable=bool(data.get('enable', True)),
+            up=data.get('up') or 0,
+            down=data.get('down') or 0,
+            total=data.get('total') or 0,
+            expiry_time=data.get('expiryTime') or 0,
+            tag=data.get('tag') or '',
+            listen=data.get('listen') or '',
+            settings=_parse_json_field(data.get('settings'), {}),
+            stream_settings=_parse_json_field(data.get('streamSettings'), {}),
+            sniffing=_parse_json_field(data.get('sniffing'), {}),
+            client_stats=[ClientTraffic.from_dict(s) for s in data.get('clientStats') or []]
+        )
+
+    def to_dict(self):
+        """Compact dictionary used by the bot keyboards and conversation data"""
+        return {
+            'id': self.id,
+            'remark': self.remark,
+            'protocol': self.protocol,
+            'port': self.port,
+            'enable': self.enable,
+            'up': self.up,
+            'down': self.down,
+            'total': self.total
+        }
+
+
+class XUIClient:
+    """Async client for one 3x-ui panel
+
+    Keeps a pooled keep-alive httpx connection to the panel host and the
+    login cookie. Requests log in on first use, again after ``session_ttl``
+    seconds, and once more if the panel answers that the session expired.
+
+    Every request goes through the panel's circuit breaker: while the circuit
+    is open requests fail immediately with XUICircuitOpenError, and the
+    request timeout adapts to the panel's recent latencies. GET requests that
+    fail to reach the panel are retried with jittered backoff as long as the
+    panel's retry budget allows.
+
+    Args:
+        panel (dict): Panel dictionary with id, url, username, password
+        timeout (float): Read/write timeout of a request in seconds
+        connect_timeout (float): Connect timeout in seconds
+        session_ttl (float): Seconds after which the login is renewed proactively
+        breaker (CircuitBreaker): Breaker of the panel (shared through XUIClientRegistry)
+    """
+
+    def __init__(self, panel, timeout=None, connect_timeout=None, session_ttl=None, breaker=None):
+        self.panel_id = panel.get('id')
+        self.base_url = self.normalize_url(panel.get('url') or '')
+        self.username = panel.get('username')
+        self.password = panel.get('password')
+        self.fingerprint = self.panel_fingerprint(panel)
+        self.timeout = float(timeout or os.getenv('XUI_TIMEOUT', '10'))
+        self.connect_timeout = float(connect_timeout or os.getenv('XUI_CONNECT_TIMEOUT', '5'))
+        self.session_ttl = float(session_ttl or os.getenv('PANEL_SESSION_TTL', '1800'))
+        self.breaker = breaker or CircuitBreaker.from_env()
+        self.max_retries = int(os.getenv('XUI_MAX_RETRIES', '2'))
+        self.retry_backoff = float(os.getenv('XUI_RETRY_BACKOFF', '0.5'))
+
+        self._http = None
+        self._loop = None
+        self._login_lock = asyncio.Lock()
+        self._logged_in_at = None
+
+    @staticmethod
+    def normalize_url(url):
+        """Panel URL with http:// or https:// prefix and without trailing slash or /login"""
+        if url and not url.startswith(('http://', 'https://')):
+            url = 'http://' + url
+        url = url.rstrip('/')
+        if url.endswith('/login'):
+            url = url[:-len('/login')]
+        return url
+
+    @staticmethod
+    def panel_fingerprint(panel):
+        """Values that, when changed, make an existing client unusable"""
+        return (panel.get('url'), panel.get('username'), panel.get('password'))
+
+    def _client(self):
+        """Create the pooled HTTP client on first use"""
+        if self._http is None:
+            self._loop = asyncio.get_running_loop()
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv('XUI_MAX_CONNECTIONS', '10')),
+                    max_keepalive_connections=int(os.getenv('XUI_MAX_KEEPALIVE', '5')),
+                    keepalive_expiry=float(os.getenv('XUI_KEEPALIVE_EXPIRY', '60'))
+                ),
+                follow_redirects=False
+            )
+        return self._http
+
+    async def _send(self, method, path, timeout=None, **kwargs):
+        """Send a raw request through the circuit breaker
+
+        The timeout adapts to the panel's latency; an explicit timeout is an
+        upper bound. Transport errors are translated to XUIConnectionError.
+
+        Raises:
+            XUICircuitOpenError: If the circuit of the panel is open
+            XUIConnectionError: If the panel could not be reached in time
+        """
+        if not self.base_url:
+            raise XUIError("آدرس پنل وجود ندارد")
+        breaker = self.breaker
+        if not breaker.allow():
+            raise XUICircuitOpenError(
+                f"پنل موقتاً در دسترس نیست (تلاش دوباره تا {breaker.retry_after():.0f} ثانیه دیگر)"
+            )
+        breaker.retry_budget.record_request()
+        adaptive = breaker.timeout()
+        timeout = adaptive if timeout is None else min(timeout, adaptive)
+        kwargs['timeout'] = httpx.Timeout(timeout, connect=min(timeout, self.connect_timeout))
+
+        started = time.monotonic()
+        try:
+            response = await self._client().request(method, path, **kwargs)
+        except httpx.TimeoutException as e:
+            breaker.record_failure()
+            logger.error(f"Timeout talking to panel {self.panel_id} after {timeout:.1f}s ({method} {path}): {e!r}")
+            raise XUIConnectionError("پنل در مهلت تعیین شده پاسخ نداد")
+        except httpx.HTTPError as e:
+            breaker.record_failure()
+            logger.error(f"Error connecting to panel {self.panel_id} ({method} {path}): {e!r}")
+            raise XUIConnectionError(f"خطا در اتصال به پنل: {e}")
+        except BaseException:
+            # Cancelled (e.g. by a caller's deadline): not the panel's fault
+            breaker.record_cancelled()
+            raise
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success(time.monotonic() - started)
+        return response
+
+    async def _send_with_retries(self, method, path, **kwargs):
+        """Send a request, retrying idempotent ones that did not reach the panel
+
+        Retries wait a random ("full jitter") part of an exponential backoff
+        and are limited by the panel's retry budget.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await self._send(method, path, **kwargs)
+            except XUICircuitOpenError:
+                raise
+            except XUIConnectionError:
+                if (method != 'GET' or attempt >= self.max_retries
+                        or not self.breaker.retry_budget.try_retry()):
+                    raise
+            attempt += 1
+            delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+            logger.info(f"Retrying {method} {path} on panel {self.panel_id} in {delay:.2f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _parse(response):
+        """Parse the JSON envelope of a panel response"""
+        if response.status_code != 200:
+            raise XUIError(
+                f"پنل پاسخ نامعتبر با کد {response.status_code} برگرداند",
+                status_code=response.status_code
+            )
+        try:
+            return ApiResult.from_json(response.json())
+        except (ValueError, AttributeError):
+            raise XUIError("پاسخ پنل قابل تشخیص نیست", status_code=response.status_code)
+
+    @staticmethod
+    def _is_login_required(response):
+        """Check if the panel rejected the request because the session is no longer valid"""
+        if response.status_code in (401, 404):
+            # Newer 3x-ui versions hide the API behind 404 for anonymous requests
+            return True
+        return response.is_redirect and 'login' in response.headers.get('location', '')
+
+    async def login(self, timeout=None):
+        """Log in to the panel and keep the session cookie
+
+        Returns:
+            ApiResult: Result of the login call
+
+        Raises:
+            XUIAuthError: If the credentials were rejected
+            XUIError: If the panel answered with something unexpected
+        """
+        client = self._client()
+        client.cookies.clear()
+        response = await self._send(
+            'POST', LOGIN_PATH,
+            data={'username': self.username, 'password': self.password},
+            timeout=timeout
+        )
+        if response.status_code == 401:
+            raise XUIAuthError("نام کاربری یا رمز عبور نادرست", status_code=401)
+
+        result = self._parse(response)
+        if not result.success:
+            raise XUIAuthError(result.msg or "نام کاربری یا رمز عبور نادرست", status_code=200)
+
+        self._logged_in_at = time.monotonic()
+        logger.info(f"Login successful for panel {self.panel_id}")
+        return result
+
+    async def _ensure_login(self, force=False):
+        """Log in unless a fresh session exists; concurrent callers share one login"""
+        stale = (
+            self._logged_in_at is None or
+            time.monotonic() - self._logged_in_at > self.session_ttl
+        )
+        if not force and not stale:
+            return
+        logged_in_at = self._logged_in_at
+        async with self._login_lock:
+            # Another request may have logged in while we waited
+            if self._logged_in_at != logged_in_at:
+                return
+            await self.login()
+
+    async def request(self, method, path, **kwargs):
+        """Send an authenticated API request
+
+        The request is retried once after a fresh login if the session expired.
+        GET requests are also retried when the panel could not be reached.
+
+        Returns:
+            ApiResult: Parsed response
+
+        Raises:
+            XUIError: If the request failed or the panel reported failure
+        """
+        await self._ensure_login()
+        response = await self._send_with_retries(method, path, **kwargs)
+        if self._is_login_required(response):
+            logger.info(f"Session for panel {self.panel_id} expired, logging in again")
+            await self._ensure_login(force=True)
+            response = await self._send_with_retries(method, path, **kwargs)
+
+        result = self._parse(response)
+        if not result.success:
+            logger.warning(f"Panel {self.panel_id} rejected {method} {path}: {result.msg}")
+            raise XUIError(result.msg or "درخواست توسط پنل رد شد")
+        return result
+
+    async def list_inbounds(self):
+        """Get all inbounds of the panel
+
+        Returns:
+            list[Inbound]: Inbounds with their clients and traffic counters
+        """
+        result = await self.request('GET', INBOUNDS_LIST_PATH)
+        return [Inbound.from_dict(item) for item in result.obj or []]
+
+    async def add_clients(self, inbound_id, clients, protocol=None):
+        """Add one or more clients to an inbound in a single call
+
+        Args:
+            inbound_id (int): Inbound ID on the panel
+            clients (list[InboundClient]): Clients to add
+            protocol (str, optional): Protocol of the inbound, selects the credential fields
+        """
+        settings = {'clients': [client.to_api(protocol) for client in clients]}
+        return await self.request(
+            'POST', ADD_CLIENT_PATH,
+            data={'id': inbound_id, 'settings': json.dumps(settings)}
+        )
+
+    async def add_client(self, inbound_id, client, protocol=None):
+        """Add a client to an inbound"""
+        return await self.add_clients(inbound_id, [client], protocol)
+
+    async def update_client(self, inbound_id, client, protocol=None):
+        """Replace the settings of an existing client
+
+        The panel replaces the whole client object, so to change single
+        fields pass the raw client dictionary from the inbound settings;
+        fields InboundClient does not model are kept that way.
+
+        Args:
+            inbound_id (int): Inbound ID on the panel
+            client (dict or InboundClient): Client with its current key and new settings
+            protocol (str, optional): Protocol of the inbound, selects the client key
+        """
+        if isinstance(client, InboundClient):
+            client = client.to_api(protocol)
+        settings = {'clients': [client]}
+        return await self.request(
+            'POST', UPDATE_CLIENT_PATH.format(client_id=client_key(protocol, client)),
+            data={'id': inbound_id, 'settings': json.dumps(settings)}
+        )
+
+    async def delete_client(self, inbound_id, client_id):
+        """Delete a client from an inbound
+
+        Args:
+            inbound_id (int): Inbound ID on the panel
+            client_id (str): Key of the client for the inbound's protocol (see client_key)
+        """
+        return await self.request(
+            'POST', DEL_CLIENT_PATH.format(inbound_id=inbound_id, client_id=client_id)
+        )
+
+    async def get_client_traffics(self, email):
+        """Get traffic counters of a client
+
+        Returns:
+            ClientTraffic: Counters or None if the client does not exist
+        """
+        result = await self.request('GET', CLIENT_TRAFFICS_PATH.format(email=email))
+        return ClientTraffic.from_dict(result.obj) if result.obj else None
+
+    async def reset_client_traffic(self, inbound_id, email):
+        """Reset the traffic counters of a client"""
+        return await self.request(
+            'POST', RESET_CLIENT_TRAFFIC_PATH.format(inbound_id=inbound_id, email=email)
+        )
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._http is not None:
+            http, self._http = self._http, None
+            await http.aclose()
+
+    def close_soon(self):
+        """Schedule aclose() on the loop that owns the connections; safe from any thread"""
+        if self._http is None or self._loop is None or self._loop.is_closed():
+            return
+        try:
+            self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self.aclose()))
+        except RuntimeError:
+            # Loop already stopped
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+class XUIClientRegistry:
+    """One shared XUIClient and circuit breaker per panel
+
+    A client is replaced when the panel URL or credentials change and dropped
+    when the panel is updated or deleted (see PanelService). The breaker of a
+    panel is reset in both cases.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, panel):
+        """Get the client of a panel, creating it if needed"""
+        fingerprint = XUIClient.panel_fingerprint(panel)
+        with self._lock:
+            client = self._clients.get(panel['id'])
+            if client is not None and client.fingerprint == fingerprint:
+                self._stats['hits'] += 1
+                return client
+            self._stats['misses'] += 1
+            old = client
+            if old is not None:
+                # New address or credentials: earlier failures say nothing about them
+                self._breakers.pop(panel['id'], None)
+            breaker = self._breakers.setdefault(panel['id'], CircuitBreaker.from_env())
+            client = self._clients[panel['id']] = XUIClient(panel, breaker=breaker)
+        if old is not None:
+            old.close_soon()
+        return client
+
+    def invalidate(self, panel_id):
+        """Drop the client of a panel"""
+        with self._lock:
+            client = self._clients.pop(panel_id, None)
+            self._breakers.pop(panel_id, None)
+            if client is not None:
+                self._stats['invalidations'] += 1
+        if client is not None:
+            client.close_soon()
+            logger.info(f"Client for panel {panel_id} invalidated")
+
+    async def aclose(self):
+        """Close all clients"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+    def breaker_state(self, panel_id):
+        """Get the circuit breaker snapshot of a panel
+
+        Returns:
+            dict: See CircuitBreaker.snapshot(), or None if the panel was not contacted yet
+        """
+        with self._lock:
+            breaker = self._breakers.get(panel_id)
+        return breaker.snapshot() if breaker is not None else None
+
+    def stats(self):
+        """Get registry statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['clients'] = len(self._clients)
+            breakers = dict(self._breakers)
+        stats['breakers'] = {panel_id: breaker.snapshot() for panel_id, breaker in breakers.items()}
+        return stats
+
+
+# Shared by PanelService, ShopService and the bot scenes
+xui_clients = XUIClientRegistry()
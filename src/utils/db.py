@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os
-import mysql.connector
 import logging
+from contextlib import contextmanager
+
+import mysql.connector
+
+from src.utils.db_pool import get_pool, PoolTimeoutError
 
 # Setup logging
 logging.basicConfig(
@@ -13,19 +16,57 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def get_db_connection():
-    """Get database connection"""
+    """Get database connection from the shared pool
+
+    The returned connection goes back to the pool when close() is called.
+    """
     try:
-        db_config = {
-            'host': os.getenv('DB_HOST'),
-            'database': os.getenv('DB_NAME'),
-            'user': os.getenv('DB_USER'),
-            'password': os.getenv('DB_PASSWORD')
-        }
-        
-        conn = mysql.connector.connect(**db_config)
-        conn.autocommit = True
-        return conn
-    except mysql.connector.Error as e:
+        return get_pool().acquire()
+    except (mysql.connector.Error, PoolTimeoutError) as e:
         logger.error(f"Database connection error: {e}")
         # Persian error message for Telegram, but error is logged in English
-        raise Exception(f"خطا در اتصال به پایگاه داده: {e}") 
\ No newline at end of file
+        raise Exception(f"خطا در اتصال به پایگاه داده: {e}")
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection for the duration of a with-block"""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+@contextmanager
+def db_cursor(dictionary=False):
+    """Borrow a pooled connection and yield a cursor on it
+
+    Args:
+        dictionary (bool): Return rows as dictionaries
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+@contextmanager
+def db_transaction(dictionary=False):
+    """Run the statements of a with-block in one transaction
+
+    Commits when the block finishes and rolls back if it raises.
+
+    Args:
+        dictionary (bool): Return rows as dictionaries
+    """
+    with db_connection() as conn:
+        conn.start_transaction()
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
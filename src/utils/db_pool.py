@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+
+import mysql.connector
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+class PooledConnection:
+    """Proxy around a MySQL connection that returns itself to the pool on close()
+
+    Existing code calls ``conn.close()`` after each query; with the proxy that
+    call hands the connection back to the pool instead of tearing down the
+    TCP connection.
+    """
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw = raw_conn
+        self._created_at = time.monotonic()
+        self._last_used = self._created_at
+        self._checked_out = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    @property
+    def raw(self):
+        """Underlying mysql.connector connection"""
+        return self._raw
+
+    @property
+    def age(self):
+        """Seconds since the physical connection was opened"""
+        return time.monotonic() - self._created_at
+
+    @property
+    def idle_time(self):
+        """Seconds since the connection was last returned to the pool"""
+        return time.monotonic() - self._last_used
+
+    def close(self):
+        """Return the connection to the pool"""
+        if self._checked_out:
+            self._pool.release(self)
+
+    def _dispose(self):
+        """Close the physical connection"""
+        try:
+            self._raw.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled connection: {e}")
+
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool
+
+    Args:
+        db_config (dict): Keyword arguments for mysql.connector.connect
+        pool_size (int): Number of connections kept open while idle
+        max_overflow (int): Extra connections allowed above pool_size under load
+        timeout (float): Seconds to wait for a free connection before failing
+        recycle (float): Connections older than this many seconds are reopened (0 disables)
+        pre_ping (bool): Ping connections idle for more than ping_interval before handing them out
+        ping_interval (float): Idle seconds after which a connection is pinged on checkout
+    """
+
+    def __init__(self, db_config, pool_size=5, max_overflow=10, timeout=30,
+                 recycle=3600, pre_ping=True, ping_interval=30):
+        self.db_config = dict(db_config)
+        self.pool_size = max(1, int(pool_size))
+        self.max_overflow = max(0, int(max_overflow))
+        self.timeout = float(timeout)
+        self.recycle = float(recycle)
+        self.pre_ping = pre_ping
+        self.ping_interval = float(ping_interval)
+
+        self._idle = deque()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._stats = {
+            'checkouts': 0,
+            'checkins': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'creations': 0,
+            'recycles': 0,
+            'stale': 0,
+            'discarded': 0,
+        }
+
+    @property
+    def capacity(self):
+        """Maximum number of simultaneously open connections"""
+        return self.pool_size + self.max_overflow
+
+    def _connect(self):
+        """Open a new physical connection"""
+        raw = mysql.connector.connect(**self.db_config)
+        raw.autocommit = True
+        with self._lock:
+            self._stats['creations'] += 1
+        return PooledConnection(self, raw)
+
+    def _is_usable(self, conn):
+        """Check recycle age and liveness of an idle connection"""
+        if self.recycle > 0 and conn.age > self.recycle:
+            with self._lock:
+                self._stats['recycles'] += 1
+            return False
+
+        if self.pre_ping and conn.idle_time > self.ping_interval:
+            try:
+                conn.raw.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._stats['stale'] += 1
+                return False
+
+        return True
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds
+
+        Returns:
+            PooledConnection: Connection that must be returned with close()
+        """
+        deadline = None
+        waited_since = None
+
+        while True:
+            conn = None
+            create = False
+
+            with self._lock:
+                if self._idle:
+                    conn = self._idle.pop()
+                elif self._total < self.capacity:
+                    self._total += 1
+                    create = True
+                else:
+                    if deadline is None:
+                        deadline = time.monotonic() + self.timeout
+                        waited_since = time.monotonic()
+                        self._stats['waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.timeout}s "
+                            f"({self._total} connections in use)"
+                        )
+                    self._available.wait(remaining)
+                    continue
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._total -= 1
+                        self._available.notify()
+                    raise
+            elif not self._is_usable(conn):
+                self._discard(conn)
+                continue
+
+            with self._lock:
+                conn._checked_out = True
+                self._stats['checkouts'] += 1
+                if waited_since is not None:
+                    self._stats['wait_time'] += time.monotonic() - waited_since
+            return conn
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        conn._checked_out = False
+
+        # Leave no open transaction or non-default session state behind
+        try:
+            if conn.raw.in_transaction:
+                conn.raw.rollback()
+            if not conn.raw.autocommit:
+                conn.raw.autocommit = True
+        except Exception as e:
+            logger.warning(f"Discarding broken pooled connection: {e}")
+            self._discard(conn)
+            return
+
+        conn._last_used = time.monotonic()
+
+        with self._lock:
+            self._stats['checkins'] += 1
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                self._available.notify()
+                return
+            # Overflow connection - close it instead of keeping it idle
+            self._total -= 1
+            self._available.notify()
+        conn._dispose()
+
+    def _discard(self, conn):
+        """Close a connection and free its slot"""
+        conn._checked_out = False
+        conn._dispose()
+        with self._lock:
+            self._total -= 1
+            self._stats['discarded'] += 1
+            self._available.notify()
+
+    def dispose(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self._available.notify_all()
+        for conn in idle:
+            conn._dispose()
+
+    def stats(self):
+        """Get pool statistics
+
+        Returns:
+            dict: Counters plus current size, idle and in-use connection counts
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self._total
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._total - len(self._idle)
+            stats['pool_size'] = self.pool_size
+            stats['max_overflow'] = self.max_overflow
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _default_db_config():
+    """Database settings from the environment"""
+    return {
+        'host': os.getenv('DB_HOST'),
+        'database': os.getenv('DB_NAME'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD')
+    }
+
+
+def get_pool():
+    """Get the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _default_db_config(),
+                    pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+                    max_overflow=int(os.getenv('DB_POOL_MAX_OVERFLOW', '10')),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+                    recycle=float(os.getenv('DB_POOL_RECYCLE', '3600')),
+                    pre_ping=os.getenv('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no'),
+                    ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', '30'))
+                )
+                logger.info(
+                    f"Database pool created (size={_pool.pool_size}, "
+                    f"max_overflow={_pool.max_overflow}, timeout={_pool.timeout}s)"
+                )
+    return _pool
+
+
+def get_pool_stats():
+    """Get statistics of the process-wide pool"""
+    return get_pool().stats()
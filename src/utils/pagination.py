@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+from dataclasses import dataclass, field
+
+# Setup logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+# Rows per page of an inline keyboard
+PAGE_SIZE = int(os.getenv('KEYBOARD_PAGE_SIZE', '10'))
+
+
+@dataclass
+class Page:
+    """One page of rows
+
+    Keyset pages (read with fetch_keyset_page) are addressed by the ids of
+    their first and last rows; numbered pages (paginate_list) by number.
+    """
+    items: list = field(default_factory=list)
+    has_prev: bool = False
+    has_next: bool = False
+    number: int = None
+
+    @property
+    def first_id(self):
+        return self.items[0]['id'] if self.items else None
+
+    @property
+    def last_id(self):
+        return self.items[-1]['id'] if self.items else None
+
+
+def fetch_keyset_page(cursor, query, params=(), after_id=None, before_id=None, limit=PAGE_SIZE):
+    """Read one page of rows ordered by id with a keyset (seek) query
+
+    The id condition, ORDER BY and LIMIT are appended to the query, so it
+    must be a SELECT of dictionaries that includes ``id`` and ends with a
+    WHERE clause (``WHERE 1 = 1`` if there is nothing to filter). One extra
+    row is read to tell whether another page follows. A cursor that no
+    longer points at any row (e.g. after deletions) yields the first page.
+
+    Args:
+        cursor: Dictionary cursor
+        query (str): SELECT ... WHERE ... without ORDER BY / LIMIT
+        params (tuple): Parameters of the query
+        after_id (int, optional): Read the page after this id
+        before_id (int, optional): Read the page before this id
+        limit (int): Rows per page
+
+    Returns:
+        Page: The page
+    """
+    if before_id is not None:
+        cursor.execute(f"{query} AND id < %s ORDER BY id DESC LIMIT %s", (*params, before_id, limit + 1))
+        rows = cursor.fetchall()
+        if rows:
+            return Page(items=rows[:limit][::-1], has_prev=len(rows) > limit, has_next=True)
+    elif after_id is not None:
+        cursor.execute(f"{query} AND id > %s ORDER BY id LIMIT %s", (*params, after_id, limit + 1))
+        rows = cursor.fetchall()
+        if rows:
+            return Page(items=rows[:limit], has_prev=True, has_next=len(rows) > limit)
+
+    cursor.execute(f"{query} ORDER BY id LIMIT %s", (*params, limit + 1))
+    rows = cursor.fetchall()
+    return Page(items=rows[:limit], has_prev=False, has_next=len(rows) > limit)
+
+
+def paginate_list(items, number=0, limit=PAGE_SIZE):
+    """Take one numbered page of an in-memory list
+
+    Args:
+        items (list): All rows
+        number (int): Page number, clamped to the existing pages
+        limit (int): Rows per page
+
+    Returns:
+        Page: The page
+    """
+    last_page = max((len(items) - 1) // limit, 0)
+    number = min(max(number, 0), last_page)
+    start = number * limit
+    return Page(
+        items=items[start:start + limit],
+        has_prev=number > 0,
+        has_next=number < last_page,
+        number=number
+    )
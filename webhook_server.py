@@ -2,11 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import os
-import json
+import hmac
 import logging
-import requests
-from flask import Flask, request, jsonify
+import contextlib
+
+import uvicorn
 from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from telegram import Update
 
 # تنظیم لاگینگ
 logging.basicConfig(
@@ -22,114 +28,122 @@ logger = logging.getLogger(__name__)
 # بارگذاری متغیرهای محیطی
 load_dotenv()
 
+from src.bot.index import build_application, send_admin_notification, route_stats
+from src.bot.utils.loop_monitor import start_loop_monitor
+from src.bot.utils.broadcaster import broadcaster
+from src.services.inbound_sync import inbound_syncer
+from src.services.traffic_collector import traffic_collector
+from src.services.expiry_scheduler import expiry_scheduler
+from src.bot.utils.dedup import update_dedup
+from src.bot.utils.webhook_queue import build_update_queue, QueueFullError
+from src.services.xui_client import xui_clients
+
 # دریافت توکن بات
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 SERVER_PORT = int(os.getenv('SERVER_PORT', '8443'))
 WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# اگر تنظیم شود، هدر X-Telegram-Bot-Api-Secret-Token بررسی می‌شود (باید در setWebhook هم تنظیم شود)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_METRICS_PATH = os.getenv('WEBHOOK_METRICS_PATH', '/metrics')
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '10'))
 
 if not TELEGRAM_BOT_TOKEN:
     logger.error("خطا: TELEGRAM_BOT_TOKEN در فایل .env یافت نشد!")
     exit(1)
 
-# ایجاد نمونه Flask
-app = Flask(__name__)
-
-# آدرس‌های API تلگرام
-API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-
-# ارسال پیام به تلگرام
-def send_message(chat_id, text, reply_markup=None):
-    """ارسال پیام به تلگرام"""
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML"
-    }
-    
-    if reply_markup:
-        payload["reply_markup"] = reply_markup
-        
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """راه‌اندازی بات و صف آپدیت‌ها هنگام شروع سرور و توقف آن‌ها هنگام خاموشی"""
+    start_loop_monitor()
+    application = build_application()
+    await application.initialize()
+    await application.start()
+    await send_admin_notification(application)
+    # ادامه پیام‌های همگانی نیمه‌کاره
+    await broadcaster.resume(application)
+    # همگام‌سازی دوره‌ای اینباندهای پنل‌ها با جدول inbounds
+    inbound_syncer.start(application)
+    # اندازه‌گیری دوره‌ای مصرف کلاینت‌ها
+    traffic_collector.start(application)
+    # غیرفعال کردن کلاینت‌های منقضی یا بدون حجم در زمان سررسید
+    expiry_scheduler.start(application)
+
+    update_queue = build_update_queue(application)
+    update_queue.start()
+    app.state.application = application
+    app.state.update_queue = update_queue
     try:
-        response = requests.post(f"{API_URL}/sendMessage", json=payload)
-        if response.status_code == 200:
-            return True
-        logger.error(f"خطا در ارسال پیام: {response.text}")
-        return False
-    except Exception as e:
-        logger.error(f"خطا در ارسال پیام: {e}")
-        return False
+        yield
+    finally:
+        await update_queue.stop(WEBHOOK_DRAIN_TIMEOUT)
+        await inbound_syncer.stop()
+        await traffic_collector.stop()
+        await expiry_scheduler.stop()
+        await application.stop()
+        await application.shutdown()
+
 
 # مسیر اصلی
-@app.route('/')
-def index():
+async def index(request: Request):
     """صفحه اصلی سرور"""
-    return "سرور وبهوک تلگرام در حال اجراست!"
+    return PlainTextResponse("سرور وبهوک تلگرام در حال اجراست!")
+
 
 # مسیر وبهوک
-@app.route(f'{WEBHOOK_PATH}/{TELEGRAM_BOT_TOKEN}', methods=['POST'])
-def webhook():
-    """دریافت و پردازش پیام‌های تلگرام"""
+async def webhook(request: Request):
+    """دریافت آپدیت و قرار دادن آن در صف؛ پاسخ بدون انتظار برای پردازش ارسال می‌شود"""
+    if WEBHOOK_SECRET:
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(token, WEBHOOK_SECRET):
+            return JSONResponse({"status": "forbidden"}, status_code=403)
+
+    application = request.app.state.application
     try:
-        # دریافت آپدیت از تلگرام
-        update = request.get_json()
-        logger.info(f"آپدیت دریافت شد: {json.dumps(update, ensure_ascii=False)}")
-        
-        # پردازش پیام‌ها
-        if 'message' in update:
-            handle_message(update['message'])
-        
-        # پردازش کالبک کوئری‌ها
-        elif 'callback_query' in update:
-            handle_callback_query(update['callback_query'])
-        
-        return jsonify({"status": "success"})
-        
+        update = Update.de_json(await request.json(), application.bot)
     except Exception as e:
-        logger.error(f"خطا در پردازش وبهوک: {e}")
-        return jsonify({"status": "error", "message": str(e)})
-
-# پردازش پیام‌ها
-def handle_message(message):
-    """پردازش پیام‌های دریافتی"""
-    chat_id = message.get('chat', {}).get('id')
-    text = message.get('text', '')
-    
-    logger.info(f"پیام از کاربر {chat_id}: {text}")
-    
-    # پردازش دستور /start
-    if text == '/start':
-        from src.bot.index import main_menu
-        return main_menu.show(None, {'user_data': {}, 'effective_chat': {'id': chat_id}})
-    
-    elif text == 'مدیریت':
-        from src.bot.index import admin_menu
-        return admin_menu.show(None, {'user_data': {}, 'effective_chat': {'id': chat_id}})
-    
-    # سایر پیام‌ها
-    else:
-        keyboard = [
-            [{"text": "مدیریت"}],
-            [{"text": "🏪 فروشگاه"}]
-        ]
-        reply_markup = {"keyboard": keyboard, "resize_keyboard": True}
-        send_message(chat_id, f"پیام شما دریافت شد: {text}", reply_markup)
-
-# پردازش کالبک کوئری‌ها
-def handle_callback_query(callback_query):
-    """پردازش کالبک‌های دریافتی"""
-    chat_id = callback_query.get('message', {}).get('chat', {}).get('id')
-    callback_data = callback_query.get('data', '')
-    
-    logger.info(f"کالبک از کاربر {chat_id}: {callback_data}")
-    
-    # پردازش کالبک‌ها
-    if callback_data.startswith('panel_'):
-        # اینجا می‌توانید منطق اختصاصی پردازش کالبک‌ها را قرار دهید
-        send_message(chat_id, f"دکمه فشرده شده: {callback_data}")
-    else:
-        send_message(chat_id, f"کالبک ناشناخته: {callback_data}")
+        logger.error(f"Invalid webhook payload: {e}")
+        return JSONResponse({"status": "error", "message": "invalid update"}, status_code=400)
+
+    try:
+        queued = request.app.state.update_queue.put(update)
+    except QueueFullError:
+        # تلگرام آپدیت رد شده را بعداً دوباره ارسال می‌کند
+        return JSONResponse({"status": "busy"}, status_code=503, headers={"Retry-After": "5"})
+
+    return JSONResponse({"status": "success" if queued else "dropped"})
+
+
+# وضعیت صف آپدیت‌ها
+async def metrics(request: Request):
+    """عمق صف، تأخیر صف و شمارنده‌های پردازش"""
+    application = request.app.state.application
+    processor = application.update_processor
+    persistence = application.persistence
+    return JSONResponse({
+        "queue": request.app.state.update_queue.stats(),
+        "update_processor": processor.stats() if hasattr(processor, 'stats') else {},
+        "persistence": persistence.stats() if hasattr(persistence, 'stats') else {},
+        "dedup": update_dedup.stats(),
+        "panels": xui_clients.stats(),
+        "inbound_sync": inbound_syncer.stats(),
+        "traffic": traffic_collector.stats(),
+        "expiry": expiry_scheduler.stats(),
+        "routes": route_stats.snapshot()
+    })
+
+
+routes = [
+    Route('/', index),
+    Route(f'{WEBHOOK_PATH}/{TELEGRAM_BOT_TOKEN}', webhook, methods=['POST']),
+]
+# با مقدار خالی WEBHOOK_METRICS_PATH مسیر متریک‌ها غیرفعال می‌شود
+if WEBHOOK_METRICS_PATH:
+    routes.append(Route(WEBHOOK_METRICS_PATH, metrics))
+
+app = Starlette(routes=routes, lifespan=lifespan)
 
 # راه‌اندازی سرور
 if __name__ == '__main__':
     logger.info(f"سرور وبهوک در حال راه‌اندازی روی پورت {SERVER_PORT}...")
-    app.run(host='0.0.0.0', port=SERVER_PORT, debug=False) 
\ No newline at end of file
+    uvicorn.run(app, host='0.0.0.0', port=SERVER_PORT, log_level='info')